@@ -0,0 +1,202 @@
+"""Aggregate views maintained incrementally by triggers on their source table.
+
+A full refresh of a materialised view rescans its whole source table.  An `IncrementalAggregateView` is
+materialised as a table instead, which triggers on the source table keep up to date as rows are written:
+
+* inserted rows are aggregated on their own and merged into the existing groups, which is cheap.
+* updated and deleted rows cause the groups they belong to to be recomputed from the source rows of those groups
+  (which an index on the grouped columns of the source table keeps cheap), as MIN/MAX can't be maintained from
+  the removed rows alone.  These recomputations lock the aggregate table so that they're
+  consistent with concurrent writers, which makes this best suited to append-heavy tables.
+"""
+from typing import List
+
+from django.db.models import Count, Max, Min, Sum
+
+try:
+    # Django 3.1 and above
+    from django.utils.functional import classproperty
+except ImportError:
+    from django.utils.decorators import classproperty
+
+from .constants import SUB_SCHEMA_NAME, ParameterisedSQL
+from .exceptions import InvalidAggregateView
+from .views import PostgresViewFromQueryset
+
+# How the aggregate of existing rows is combined with the aggregate of inserted rows (`agg` and `EXCLUDED`).
+# SUM is NULL when all its values are, hence the COALESCE.
+_MERGE_EXPRESSIONS = {
+    Sum: '"{column}" = COALESCE(agg."{column}" + EXCLUDED."{column}", agg."{column}", EXCLUDED."{column}")',
+    Count: '"{column}" = agg."{column}" + EXCLUDED."{column}"',
+    Min: '"{column}" = LEAST(agg."{column}", EXCLUDED."{column}")',
+    Max: '"{column}" = GREATEST(agg."{column}", EXCLUDED."{column}")',
+}
+
+
+def get_maintenance_function_name(view_name: str) -> str:
+    """The name of the trigger function maintaining an aggregate view, under the same schema as the view."""
+    return f'{view_name}_maintain'
+
+
+class IncrementalAggregateView(PostgresViewFromQueryset, should_register=False):
+    """A view aggregating a single table, materialised as a table maintained by triggers on that table.
+
+    `get_queryset` is restricted to grouping by (non-nullable) fields of the model with `values`, followed by
+    `annotate` with SUM, COUNT, MIN or MAX aggregates, e.g.
+
+    ```
+        Order.objects.filter(status='paid').values('customer').annotate(total=Sum('amount'), orders=Count('id'))
+    ```
+
+    Unlike materialised views these don't need refreshing, but the triggers add to the cost of writing to the
+    source table.  The aggregate table is consistent with the source table as of the sync creating it, as the
+    source table is locked against writes while the table is populated.  The lock is taken in the transaction of
+    the sync, so it's held until the sync commits, i.e. until every other view of the database has been created.
+    """
+
+    materialised = True
+
+    @classmethod
+    def get_creation_sql(
+        cls, schema: str = SUB_SCHEMA_NAME, include_indexes: bool = True, with_data: bool = True
+    ) -> ParameterisedSQL:
+        """Returns the SQL to create the aggregate table, its maintenance function and the triggers calling it.
+
+        The table is always populated, as the triggers only apply changes to existing groups.
+        """
+        parameterised_sql = cls._get_parameterised_sql_for_schema(schema)
+        source_table = cls._quoted_source_table
+        name_with_schema = f'{schema}.{cls.name}'
+        function_name = f'{schema}.{get_maintenance_function_name(cls.name)}'
+
+        # The dynamic SQL of the function is dollar quoted, as the parameters are interpolated as literals.
+        # The aggregate table is passed to the function by oid, so that it survives the schema being renamed.
+        sql = (
+            f'LOCK TABLE {source_table} IN SHARE ROW EXCLUSIVE MODE;'
+            f'CREATE TABLE {name_with_schema} AS {parameterised_sql.sql};'
+            f'CREATE UNIQUE INDEX {cls.name}_groups ON {name_with_schema} ({cls._group_column_list});'
+            f'CREATE FUNCTION {function_name}() RETURNS trigger LANGUAGE plpgsql AS $maintain$\n'
+            f'DECLARE\n'
+            f'    target text := TG_ARGV[0]::oid::regclass::text;\n'
+            f'BEGIN\n'
+            f'    IF TG_OP = \'INSERT\' THEN\n'
+            f'        {cls._get_merge_statement(parameterised_sql.sql)}\n'
+            f'    ELSIF TG_OP = \'UPDATE\' THEN\n'
+            f'        {cls._get_recompute_statements(parameterised_sql.sql, ["deleted_rows", "inserted_rows"])}\n'
+            f'    ELSIF TG_OP = \'DELETE\' THEN\n'
+            f'        {cls._get_recompute_statements(parameterised_sql.sql, ["deleted_rows"])}\n'
+            f'    ELSE\n'
+            f'        EXECUTE \'TRUNCATE \' || target;\n'
+            f'    END IF;\n'
+            f'    RETURN NULL;\n'
+            f'END\n'
+            f'$maintain$;'
+            f'{cls._get_trigger_creation_sql(name_with_schema, function_name)}'
+        )
+        return ParameterisedSQL(sql=sql, params=[*parameterised_sql.params] * 4)
+
+    @classmethod
+    def _get_merge_statement(cls, sql: str) -> str:
+        """Aggregates the inserted rows and merges them into the existing groups."""
+        delta_sql = cls._replace_source_table(sql, f'inserted_rows AS {cls._quoted_source_table}')
+        updates = ', '.join(
+            _MERGE_EXPRESSIONS[type(aggregate)].format(column=column)
+            for column, aggregate in cls._aggregates.items()
+        )
+        return (
+            f"EXECUTE 'INSERT INTO ' || target || $delta$ AS agg {delta_sql}"
+            f" ON CONFLICT ({cls._group_column_list}) DO UPDATE SET {updates}$delta$;"
+        )
+
+    @classmethod
+    def _replace_source_table(cls, sql: str, replacement: str) -> str:
+        """Replaces the source table in the FROM clause of the view's SQL with `replacement`."""
+        source_table = cls._quoted_source_table
+        table_reference = f'FROM {source_table}'
+        if sql.count(table_reference) != 1:
+            raise InvalidAggregateView(f'{cls.name} has to aggregate {source_table} without joins or subqueries')
+        return sql.replace(table_reference, f'FROM {replacement}')
+
+    @classmethod
+    def _get_groups_sql(cls, sql: str, changed_groups: str) -> str:
+        """The view's SQL aggregating only the source rows of the groups selected by `changed_groups`.
+
+        The source rows are filtered before being aggregated, as Postgres can't push a filter on the aggregated
+        rows below the GROUP BY, which would re-aggregate the whole source table.
+        """
+        source_table = cls._quoted_source_table
+        return cls._replace_source_table(
+            sql,
+            f'(SELECT * FROM {source_table} WHERE ({cls._group_column_list}) IN ({changed_groups})) AS {source_table}',
+        )
+
+    @classmethod
+    def _get_recompute_statements(cls, sql: str, transition_tables: List[str]) -> str:
+        """Recomputes the groups of the rows in the given transition tables, dropping the groups left empty."""
+        groups = cls._group_column_list
+        changed_groups = ' UNION '.join(f'SELECT {groups} FROM {table}' for table in transition_tables)
+        updates = ', '.join(f'"{column}" = EXCLUDED."{column}"' for column in cls._aggregates)
+        return (
+            f"EXECUTE 'LOCK TABLE ' || target || ' IN SHARE ROW EXCLUSIVE MODE';\n        "
+            f"EXECUTE 'WITH recomputed AS (' || $delta$ {cls._get_groups_sql(sql, changed_groups)} $delta$"
+            f" || '), upserted AS (INSERT INTO ' || target"
+            f" || ' AS agg SELECT * FROM recomputed ON CONFLICT ({groups}) DO UPDATE SET {updates})"
+            f" DELETE FROM ' || target || ' WHERE ({groups}) IN ({changed_groups})"
+            f" AND ({groups}) NOT IN (SELECT {groups} FROM recomputed)';"
+        )
+
+    @classmethod
+    def _get_trigger_creation_sql(cls, name_with_schema: str, function_name: str) -> str:
+        """The trigger names are randomised, as a blue/green sync creates the triggers of the staging schema while
+        those of the live schema still exist.  `%` is doubled for the cursor.
+        """
+        source_table = cls._quoted_source_table
+        triggers = [
+            ('i', 'AFTER INSERT', 'REFERENCING NEW TABLE AS inserted_rows'),
+            ('u', 'AFTER UPDATE', 'REFERENCING OLD TABLE AS deleted_rows NEW TABLE AS inserted_rows'),
+            ('d', 'AFTER DELETE', 'REFERENCING OLD TABLE AS deleted_rows'),
+            ('t', 'AFTER TRUNCATE', ''),
+        ]
+        statements = ''.join(
+            f"EXECUTE format('CREATE TRIGGER %%I {event} ON {source_table} {transition_tables}"
+            f" FOR EACH STATEMENT EXECUTE PROCEDURE {function_name}(%%s)',"
+            f" '{cls.name[:40]}_' || left(md5(random()::text), 12) || '_{suffix}',"
+            f" '{name_with_schema}'::regclass::oid);"
+            for suffix, event, transition_tables in triggers
+        )
+        return f'DO $triggers$ BEGIN {statements} END $triggers$;'
+
+    @classproperty
+    def _quoted_source_table(cls) -> str:
+        return f'"{cls.get_queryset().model._meta.db_table}"'
+
+    @classproperty
+    def group_columns(cls) -> List[str]:
+        """The columns the view groups by."""
+        query = cls.get_queryset().query
+        if not query.values_select or not query.annotation_select:
+            raise InvalidAggregateView(f'{cls.name} has to group by fields using values() followed by annotate()')
+        columns = []
+        for field_name in query.values_select:
+            field = query.model._meta.get_field(field_name)
+            if field.null:
+                # Postgres doesn't consider NULLs equal in unique indexes, so they can't be merged into
+                raise InvalidAggregateView(f"{cls.name} can't group by the nullable field {field_name}")
+            columns.append(field.column)
+        return columns
+
+    @classproperty
+    def _group_column_list(cls) -> str:
+        return ', '.join(f'"{column}"' for column in cls.group_columns)
+
+    @classproperty
+    def _aggregates(cls):
+        query = cls.get_queryset().query
+        if query.where.contains_aggregate:
+            raise InvalidAggregateView(f"{cls.name} can't filter on aggregates")
+        for column, aggregate in query.annotation_select.items():
+            if type(aggregate) not in _MERGE_EXPRESSIONS or aggregate.distinct or aggregate.filter is not None:
+                raise InvalidAggregateView(
+                    f'{cls.name} can only use SUM, COUNT, MIN and MAX aggregates, without DISTINCT or FILTER'
+                )
+        return query.annotation_select
@@ -1,6 +1,8 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_migrate
 
-from .register import register_all_views
+from .register import discover_views_modules, register_all_views
 
 
 class DjangoPostgresViewsConfig(AppConfig):
@@ -9,4 +11,13 @@ class DjangoPostgresViewsConfig(AppConfig):
     app_label = 'django_orm_views'
     
     def ready(self):
-        register_all_views()
+        from .views import _clear_compiled_sql_cache_on_migrate
+
+        # With lazy registration, the views are only imported once they're needed (e.g. by sync_views)
+        if getattr(settings, 'DJANGO_ORM_VIEWS_LAZY_REGISTRATION', False):
+            discover_views_modules()
+        else:
+            register_all_views()
+        post_migrate.connect(
+            _clear_compiled_sql_cache_on_migrate, dispatch_uid='django_orm_views.clear_compiled_sql_cache'
+        )
@@ -0,0 +1,213 @@
+"""Caching of the results of queries against readable views, for views whose rows only change when they're
+refreshed or sync'd (i.e. materialised views).
+
+```
+    class DashboardView(PostgresMaterialisedViewMixin, ReadableViewFromQueryset):
+        objects = CachedViewManager(LRUResultCache(max_entries=500))
+```
+
+Results are keyed by the compiled SQL of the query, and all the results of a view are invalidated whenever the view
+is refreshed or sync'd (through the `view_changed` signal).  The signal is sent from the process doing the refresh,
+so refreshes from other processes are only seen by a cache shared between processes (i.e. a Django cache backend like
+memcached or redis): an in-process LRUResultCache should be given a `timeout` if views are refreshed elsewhere.
+Plain views are computed on each query, so caching them serves stale rows until the timeout.
+"""
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+
+from .signals import view_changed
+from .views import ViewManager, ViewQuerySet, _LiveViewTable
+
+
+class LRUResultCache:
+    """An in-process cache holding the results of up to `max_entries` queries, evicting the least recently used.
+
+    Results expire after `timeout` seconds if given.  Like Django's local memory cache, results are pickled so that
+    the cached rows can't be modified by their readers.
+    """
+
+    def __init__(self, max_entries: int = 1000, timeout: Optional[float] = None):
+        if max_entries <= 0:
+            raise ValueError('An LRU cache needs to hold at least one entry')
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, view, key: str):
+        """Returns the cached result, or None if it isn't cached."""
+        with self._lock:
+            entry = self._entries.get((view, key))
+            if entry is None:
+                return None
+            expires_at, pickled_result = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[(view, key)]
+                return None
+            self._entries.move_to_end((view, key))
+        return pickle.loads(pickled_result)
+
+    def set(self, view, key: str, result):
+        pickled_result = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        expires_at = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._lock:
+            self._entries[(view, key)] = (expires_at, pickled_result)
+            self._entries.move_to_end((view, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, view):
+        """Forgets the cached results of the given view."""
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] is view]:
+                del self._entries[entry_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoResultCache:
+    """Caches results in one of the CACHES of the Django settings, for `timeout` seconds (defaults to the backend's
+    own default timeout).
+
+    The results of a view are invalidated by bumping a version which is part of their keys, so the stale results are
+    left to expire (or be evicted).
+    """
+
+    def __init__(self, alias: str = 'default', timeout: Optional[float] = None, key_prefix: str = 'django_orm_views'):
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+
+    @property
+    def _cache(self):
+        return caches[self.alias]
+
+    def _get_version_key(self, view) -> str:
+        return f'{self.key_prefix}:{view.database}:{view.name}:version'
+
+    def _get_version(self, view) -> int:
+        version_key = self._get_version_key(view)
+        version = self._cache.get(version_key)
+        if version is None:
+            # A version which was evicted mustn't come back to an older value, which could revive stale results
+            self._cache.add(version_key, time.time_ns(), timeout=None)
+            version = self._cache.get(version_key)
+        return version
+
+    def _get_result_key(self, view, key: str) -> str:
+        return f'{self.key_prefix}:{view.database}:{view.name}:{self._get_version(view)}:{key}'
+
+    def get(self, view, key: str):
+        """Returns the cached result, or None if it isn't cached."""
+        return self._cache.get(self._get_result_key(view, key))
+
+    def set(self, view, key: str, result):
+        kwargs = {} if self.timeout is None else {'timeout': self.timeout}
+        self._cache.set(self._get_result_key(view, key), result, **kwargs)
+
+    def invalidate(self, view):
+        """Forgets the cached results of the given view."""
+        try:
+            self._cache.incr(self._get_version_key(view))
+        except ValueError:
+            # The version isn't cached (anymore), so there's nothing to invalidate
+            pass
+
+
+class CachedViewQuerySet(ViewQuerySet):
+    """A ViewQuerySet whose rows (and counts) are read from the cache of its manager if possible.
+
+    Queries computing a view from its SQL (see `fresh_within`), locking rows, or prefetching related objects aren't
+    cached.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._view_cache = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._view_cache = self._view_cache
+        return clone
+
+    def _get_cache_key(self, kind: str) -> Optional[str]:
+        """Returns the cache key of the query, or None if it shouldn't be cached."""
+        query = self.query
+        if (
+            self._view_cache is None
+            or self._prefetch_related_lookups
+            or query.select_for_update
+            or any(isinstance(table, _LiveViewTable) for table in query.alias_map.values())
+        ):
+            return None
+        try:
+            # Compiling sets the query up, so a copy is compiled
+            sql, params = query.chain().get_compiler(using=self.db).as_sql()
+        except EmptyResultSet:
+            return None
+        digest = hashlib.sha256(f'{kind}:{self._iterable_class.__name__}:{self._fields}:{sql}'.encode())
+        digest.update(repr(params).encode())
+        return digest.hexdigest()
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            key = self._get_cache_key('rows')
+            if key is not None:
+                result = self._view_cache.get(self.model, key)
+                if result is None:
+                    result = list(self._iterable_class(self))
+                    self._view_cache.set(self.model, key, result)
+                self._result_cache = result
+        super()._fetch_all()
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        key = self._get_cache_key('count')
+        if key is None:
+            return super().count()
+        count = self._view_cache.get(self.model, key)
+        if count is None:
+            count = super().count()
+            self._view_cache.set(self.model, key, count)
+        return count
+
+
+class CachedViewManager(ViewManager):
+    """A manager for readable views, caching the results of their queries in `cache` (an LRUResultCache or a
+    DjangoResultCache, defaulting to the default Django cache).  See the module docstring.
+    """
+
+    _queryset_class = CachedViewQuerySet
+
+    def __init__(self, cache=None):
+        super().__init__()
+        self.cache = cache if cache is not None else DjangoResultCache()
+
+    def contribute_to_class(self, model, name):
+        super().contribute_to_class(model, name)
+        if model._meta.abstract:
+            return
+        view_changed.connect(
+            self._invalidate, sender=model, weak=False, dispatch_uid=f'{model.name}:{name}:{id(self.cache)}'
+        )
+
+    def _invalidate(self, sender, **kwargs):
+        self.cache.invalidate(sender)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        queryset._view_cache = self.cache
+        return queryset
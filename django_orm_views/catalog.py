@@ -0,0 +1,194 @@
+"""Bookkeeping tables for django_orm_views.
+
+We don't want the package to generate migrations, so the catalog lives under its own schema which is
+created on demand.  Unlike the views schema it is never dropped by `sync_views`.
+"""
+import datetime
+import json
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+from .constants import CATALOG_SCHEMA_NAME
+
+FINGERPRINT_TABLE = f'{CATALOG_SCHEMA_NAME}.view_fingerprint'
+SOURCE_SIGNATURE_TABLE = f'{CATALOG_SCHEMA_NAME}.view_source_signature'
+WATERMARK_TABLE = f'{CATALOG_SCHEMA_NAME}.view_watermark'
+REFRESH_TABLE = f'{CATALOG_SCHEMA_NAME}.view_refresh'
+
+
+@dataclass
+class ViewRefresh:
+    """The last refresh of a view, as recorded in the catalog.
+
+    Attributes:
+        started_at (datetime): when the refresh started.  The rows of the view reflect its source tables as of then.
+        finished_at (datetime): when the refresh finished
+        duration (float): the number of seconds the refresh took
+        rows (int): the number of rows of the view after the refresh, None if they weren't counted (i.e. unless
+            the refresh was asked to count them, or instrumented, see `refresh_materialized_view`)
+    """
+
+    started_at: datetime.datetime
+    finished_at: datetime.datetime
+    duration: float
+    rows: Optional[int] = None
+
+
+def ensure_catalog(cursor):
+    """Creates the catalog schema and tables if they don't exist yet.
+
+    Their existence is checked first, so that refreshes don't run DDL (and take its locks) once they're created.
+    """
+    cursor.execute(
+        'SELECT bool_and(to_regclass(name) IS NOT NULL) FROM unnest(%s::text[]) AS name;',
+        params=[[FINGERPRINT_TABLE, SOURCE_SIGNATURE_TABLE, WATERMARK_TABLE, REFRESH_TABLE]],
+    )
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute(
+        f'CREATE SCHEMA IF NOT EXISTS {CATALOG_SCHEMA_NAME};'
+        f'CREATE TABLE IF NOT EXISTS {FINGERPRINT_TABLE} ('
+        f'    view_name text PRIMARY KEY,'
+        f'    fingerprint text NOT NULL,'
+        f'    synced_at timestamptz NOT NULL DEFAULT now()'
+        f');'
+        f'CREATE TABLE IF NOT EXISTS {SOURCE_SIGNATURE_TABLE} ('
+        f'    view_name text PRIMARY KEY,'
+        f'    signature jsonb NOT NULL,'
+        f'    recorded_at timestamptz NOT NULL DEFAULT now()'
+        f');'
+        f'CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} ('
+        f'    view_name text PRIMARY KEY,'
+        f'    watermark text NOT NULL,'
+        f'    refreshed_at timestamptz NOT NULL DEFAULT now()'
+        f');'
+        f'CREATE TABLE IF NOT EXISTS {REFRESH_TABLE} ('
+        f'    view_name text PRIMARY KEY,'
+        f'    started_at timestamptz NOT NULL,'
+        f'    finished_at timestamptz NOT NULL,'
+        f'    duration double precision NOT NULL,'
+        f'    rows bigint'
+        f');'
+    )
+
+
+def get_fingerprints(cursor) -> Dict[str, str]:
+    """Returns the stored fingerprint of every view, keyed by view name."""
+    cursor.execute(f'SELECT view_name, fingerprint FROM {FINGERPRINT_TABLE};')
+    return dict(cursor.fetchall())
+
+
+def set_fingerprints(cursor, fingerprints: Dict[str, str]):
+    """Upserts the fingerprints of the given views."""
+    cursor.execute(
+        f'INSERT INTO {FINGERPRINT_TABLE} (view_name, fingerprint) '
+        f'SELECT * FROM unnest(%s::text[], %s::text[]) '
+        f'ON CONFLICT (view_name) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, synced_at = now();',
+        params=[list(fingerprints.keys()), list(fingerprints.values())],
+    )
+
+
+def delete_fingerprints(cursor, view_names: Iterable[str]):
+    """Forgets the fingerprints of the given views."""
+    cursor.execute(f'DELETE FROM {FINGERPRINT_TABLE} WHERE view_name = ANY(%s);', params=[list(view_names)])
+
+
+def replace_fingerprints(cursor, fingerprints: Dict[str, str]):
+    """Replaces the whole fingerprint table, used after a full sync has rebuilt every view."""
+    cursor.execute(f'DELETE FROM {FINGERPRINT_TABLE};')
+    set_fingerprints(cursor, fingerprints)
+
+
+def get_source_signature(cursor, view_name: str) -> Optional[Dict[str, int]]:
+    """Returns the modification counters of the view's source tables recorded at its last refresh."""
+    cursor.execute(
+        f'SELECT signature::text FROM {SOURCE_SIGNATURE_TABLE} WHERE view_name = %s;', params=[view_name]
+    )
+    row = cursor.fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def set_source_signature(cursor, view_name: str, signature: Dict[str, int]):
+    cursor.execute(
+        f'INSERT INTO {SOURCE_SIGNATURE_TABLE} (view_name, signature) VALUES (%s, %s::jsonb) '
+        f'ON CONFLICT (view_name) DO UPDATE SET signature = EXCLUDED.signature, recorded_at = now();',
+        params=[view_name, json.dumps(signature)],
+    )
+
+
+def delete_source_signatures(cursor, view_names: Optional[Iterable[str]] = None):
+    """Forgets the source signatures of the given views (or of every view), so they're considered stale."""
+    if view_names is None:
+        cursor.execute(f'DELETE FROM {SOURCE_SIGNATURE_TABLE};')
+    else:
+        cursor.execute(
+            f'DELETE FROM {SOURCE_SIGNATURE_TABLE} WHERE view_name = ANY(%s);', params=[list(view_names)]
+        )
+
+
+def get_watermark(cursor, view_name: str) -> Optional[str]:
+    """Returns the watermark reached by the last incremental refresh of the view, as text."""
+    cursor.execute(f'SELECT watermark FROM {WATERMARK_TABLE} WHERE view_name = %s;', params=[view_name])
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(cursor, view_name: str, watermark: str):
+    cursor.execute(
+        f'INSERT INTO {WATERMARK_TABLE} (view_name, watermark) VALUES (%s, %s) '
+        f'ON CONFLICT (view_name) DO UPDATE SET watermark = EXCLUDED.watermark, refreshed_at = now();',
+        params=[view_name, watermark],
+    )
+
+
+def delete_watermarks(cursor, view_names: Optional[Iterable[str]] = None):
+    """Forgets the watermarks of the given views (or of every view), e.g. as they've been rebuilt."""
+    if view_names is None:
+        cursor.execute(f'DELETE FROM {WATERMARK_TABLE};')
+    else:
+        cursor.execute(f'DELETE FROM {WATERMARK_TABLE} WHERE view_name = ANY(%s);', params=[list(view_names)])
+
+
+def get_refresh(cursor, view_name: str) -> Optional[ViewRefresh]:
+    """Returns the last refresh of the view, None if it hasn't been populated since it was last sync'd."""
+    cursor.execute(
+        f'SELECT started_at, finished_at, duration, rows FROM {REFRESH_TABLE} WHERE view_name = %s;',
+        params=[view_name],
+    )
+    row = cursor.fetchone()
+    return ViewRefresh(*row) if row else None
+
+
+def set_refresh(cursor, view_name: str, duration: float, rows: Optional[int] = None):
+    """Records a refresh of the view which has just finished, having taken `duration` seconds."""
+    cursor.execute(
+        f'INSERT INTO {REFRESH_TABLE} (view_name, started_at, finished_at, duration, rows) '
+        f'VALUES (%s, clock_timestamp() - make_interval(secs => %s), clock_timestamp(), %s, %s) '
+        f'ON CONFLICT (view_name) DO UPDATE SET started_at = EXCLUDED.started_at, '
+        f'finished_at = EXCLUDED.finished_at, duration = EXCLUDED.duration, rows = EXCLUDED.rows;',
+        params=[view_name, duration, duration, rows],
+    )
+
+
+def set_synced_refreshes(
+    cursor, view_names: Iterable[str], started_at: Optional[datetime.datetime] = None
+):
+    """Records the given views as populated by a sync which started at `started_at`, defaulting to the start of
+    the current transaction.
+    """
+    cursor.execute(
+        f'INSERT INTO {REFRESH_TABLE} (view_name, started_at, finished_at, duration) '
+        f'SELECT view_name, started_at, clock_timestamp(), extract(epoch FROM clock_timestamp() - started_at) '
+        f'FROM unnest(%s::text[]) AS view_name, COALESCE(%s::timestamptz, now()) AS started_at '
+        f'ON CONFLICT (view_name) DO UPDATE SET started_at = EXCLUDED.started_at, '
+        f'finished_at = EXCLUDED.finished_at, duration = EXCLUDED.duration, rows = NULL;',
+        params=[list(view_names), started_at],
+    )
+
+
+def delete_refreshes(cursor, view_names: Optional[Iterable[str]] = None):
+    """Forgets the refreshes of the given views (or of every view), e.g. as they've been rebuilt without data."""
+    if view_names is None:
+        cursor.execute(f'DELETE FROM {REFRESH_TABLE};')
+    else:
+        cursor.execute(f'DELETE FROM {REFRESH_TABLE} WHERE view_name = ANY(%s);', params=[list(view_names)])
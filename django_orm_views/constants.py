@@ -4,6 +4,9 @@ from typing import List, Any
 from dataclasses import dataclass
 
 SUB_SCHEMA_NAME = 'views'
+CATALOG_SCHEMA_NAME = 'views_catalog'
+STAGING_SCHEMA_NAME = f'{SUB_SCHEMA_NAME}_next'
+RETIRED_SCHEMA_NAME = f'{SUB_SCHEMA_NAME}_old'
 VIEWS_FILE_NAME = 'postgres_views'
 
 LOGGER_NAME = 'django_orm_views'
@@ -3,6 +3,41 @@
 class CyclicDependencyError(Exception):
     """Raised if views depend on one another and cause a cyclic dependency"""
 
+    def __init__(self, message, cycle=None):
+        self.cycle = cycle or []
+        super().__init__(message)
+
 
 class InvalidViewDepencies(Exception):
     """Raised if the view dependency list contains 2 or more views with differing database attribute"""
+
+
+class MaterialisedViewRefreshError(Exception):
+    """Raised once a batch refresh has finished if one or more materialised views failed to refresh"""
+
+    def __init__(self, failures, skipped=()):
+        self.failures = failures
+        self.skipped = set(skipped)
+        super().__init__(f'Failed to refresh materialised views: {sorted(view.name for view in failures)}')
+
+
+class ViewSyncError(Exception):
+    """Raised once a parallel sync has finished if the views of one or more databases failed to sync"""
+
+    def __init__(self, results):
+        self.results = results
+        failed_databases = sorted(database for database, result in results.items() if result.error is not None)
+        super().__init__(f'Failed to sync views for databases: {failed_databases}')
+
+
+class InvalidAggregateView(Exception):
+    """Raised if the queryset of an IncrementalAggregateView can't be maintained incrementally"""
+
+
+class AdvisoryLockTimeout(Exception):
+    """Raised if an advisory lock is still held by another session once the lock timeout has elapsed"""
+
+    def __init__(self, name, timeout):
+        self.name = name
+        self.timeout = timeout
+        super().__init__(f'Timed out after {timeout}s waiting for the {name} lock')
@@ -0,0 +1,166 @@
+"""Cost reports for the SQL of registered views, based on EXPLAIN.
+
+The plans are those of the views' own SQL, i.e. of querying a view or refreshing a materialised view.  As views
+may reference one another, they need to have been sync'd to the database being reported on.
+"""
+import itertools
+import json
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from django.db import DatabaseError, connections, transaction
+
+from .register import registry, register_all_views
+
+# Sequential scans of tables estimated to hold fewer rows than this are not reported
+LARGE_TABLE_ROWS = 100_000
+
+
+@dataclass
+class SequentialScan:
+    """A sequential scan of a large table in the plan of a view."""
+
+    table: str
+    table_rows: int
+    filter: Optional[str] = None
+    rows_removed_by_filter: Optional[int] = None
+
+    @property
+    def missing_index_hint(self) -> Optional[str]:
+        """A hint to add an index, if the scan filters the table (and so could use an index instead)."""
+        if self.filter is None:
+            return None
+        return f'{self.table} ({self.table_rows} rows) is scanned sequentially to filter on {self.filter}'
+
+
+@dataclass
+class ViewCostReport:
+    """The estimated cost of the SQL of a view, from its plan.
+
+    Attributes:
+        total_cost (float): the estimated total cost of the plan, in the planner's arbitrary units
+        plan_rows (int): the estimated number of rows of the view
+        sequential_scans (List[SequentialScan]): the sequential scans of large tables
+        execution_time (float): the time in milliseconds taken to execute the plan with a sample limit,
+            if it was analyzed
+        error (str): the error explaining the view, e.g. as one of its dependencies doesn't exist
+        inlined_views (List[str]): the names of the hidden views inlined into the SQL of the view, see
+            `BasePostgresView.inlined_views`
+    """
+
+    view: type
+    database: str
+    total_cost: float = 0.0
+    plan_rows: int = 0
+    sequential_scans: List[SequentialScan] = field(default_factory=list)
+    execution_time: Optional[float] = None
+    error: Optional[str] = None
+    inlined_views: List[str] = field(default_factory=list)
+
+    @property
+    def missing_index_hints(self) -> List[str]:
+        return [scan.missing_index_hint for scan in self.sequential_scans if scan.missing_index_hint]
+
+
+def explain_view(
+    view, analyze: bool = False, sample_limit: int = 1000, large_table_rows: int = LARGE_TABLE_ROWS
+) -> ViewCostReport:
+    """Explain the SQL of the given view.
+
+    Args:
+        analyze (bool): if True the plan is also executed, on at most `sample_limit` rows of the view (the estimated
+            cost and rows are still those of the whole view).  Note that views aggregating their rows still have to
+            read all of them.
+        large_table_rows (int): the estimated number of rows from which sequential scans are reported
+    """
+    report = ViewCostReport(view=view, database=view.database)
+    if view.inline_hidden_views:
+        report.inlined_views = [inlined_view.name for inlined_view in view.inlined_views]
+    parameterised_sql = view._compiled_sql
+    # VERBOSE qualifies the scanned relations with their schema
+    options = 'VERBOSE, FORMAT JSON'
+    sql = parameterised_sql.sql
+    if analyze:
+        options = f'ANALYZE, {options}'
+        sql = f'SELECT * FROM ({sql}) AS sample LIMIT {int(sample_limit)}'
+
+    with connections[view.database].cursor() as cursor:
+        try:
+            # The savepoint keeps a failing view from breaking the caller's transaction
+            with transaction.atomic(using=view.database):
+                cursor.execute(f'EXPLAIN ({options}) {sql}', params=parameterised_sql.params)
+                explain_output = cursor.fetchone()[0]
+        except DatabaseError as error:
+            report.error = str(error).strip()
+            return report
+
+        # psycopg2 parses the json, unless the column comes back as text
+        if isinstance(explain_output, str):
+            explain_output = json.loads(explain_output)
+        [explain_output] = explain_output
+        plan = explain_output['Plan']
+        # The estimates are those of the view's own plan, under the Limit of the sample
+        view_plan = plan['Plans'][0] if analyze else plan
+        report.total_cost = view_plan['Total Cost']
+        report.plan_rows = view_plan['Plan Rows']
+        report.execution_time = explain_output.get('Execution Time')
+
+        scans = [node for node in _walk_plan(plan) if node['Node Type'] == 'Seq Scan']
+        table_rows = _get_table_rows(cursor, {_qualified_name(scan) for scan in scans})
+        for scan in scans:
+            table = _qualified_name(scan)
+            if table_rows.get(table, 0) < large_table_rows:
+                continue
+            report.sequential_scans.append(SequentialScan(
+                table=table,
+                table_rows=table_rows[table],
+                filter=scan.get('Filter'),
+                rows_removed_by_filter=scan.get('Rows Removed by Filter'),
+            ))
+    return report
+
+
+def explain_views(
+    views: Optional[Iterable] = None,
+    analyze: bool = False,
+    sample_limit: int = 1000,
+    large_table_rows: int = LARGE_TABLE_ROWS,
+) -> List[ViewCostReport]:
+    """Explain the SQL of the given views (defaults to every registered view), see `explain_view`.
+
+    Returns the reports, the most expensive first.
+    """
+    register_all_views()
+    if views is None:
+        views = itertools.chain.from_iterable(registry.values())
+    reports = [
+        explain_view(view, analyze=analyze, sample_limit=sample_limit, large_table_rows=large_table_rows)
+        for view in views
+    ]
+    return sorted(reports, key=lambda report: (-report.total_cost, report.view.name))
+
+
+def _walk_plan(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _walk_plan(child)
+
+
+def _qualified_name(scan) -> str:
+    return f"{scan['Schema']}.{scan['Relation Name']}"
+
+
+def _get_table_rows(cursor, tables) -> dict:
+    """Returns the number of rows of the given tables estimated by Postgres statistics."""
+    if not tables:
+        return {}
+    cursor.execute(
+        """
+        SELECT n.nspname || '.' || c.relname, c.reltuples::bigint
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname || '.' || c.relname = ANY(%s)
+        """,
+        params=[sorted(tables)],
+    )
+    return dict(cursor.fetchall())
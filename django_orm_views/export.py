@@ -0,0 +1,150 @@
+"""Streaming exports of the rows of views, without loading them into memory (as querysets would).
+
+CSV exports are streamed by Postgres with `COPY (SELECT ...) TO STDOUT`.  Parquet exports are read through a
+server side cursor, a row group at a time, and need pyarrow (`pip install django_orm_views[parquet]`).
+"""
+import json
+from typing import Optional, Sequence, Union
+
+from django.db import connections, transaction
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from .register import get_view_by_name
+
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+
+DEFAULT_ROW_GROUP_SIZE = 100_000
+
+_NUMERIC_OID = 1700
+# The Arrow types of the Postgres types (by oid) which are exported as is, other columns are exported as text
+_ARROW_TYPE_FACTORIES = {
+    16: lambda: pyarrow.bool_(),
+    20: lambda: pyarrow.int64(),
+    21: lambda: pyarrow.int16(),
+    23: lambda: pyarrow.int32(),
+    700: lambda: pyarrow.float32(),
+    701: lambda: pyarrow.float64(),
+    1082: lambda: pyarrow.date32(),
+    1114: lambda: pyarrow.timestamp('us'),
+    1184: lambda: pyarrow.timestamp('us', tz='UTC'),
+}
+
+
+def export_view(
+    view: Union[type, str],
+    output,
+    format: str = FORMAT_CSV,
+    columns: Optional[Sequence[str]] = None,
+    where: Optional[str] = None,
+    params: Optional[Sequence] = None,
+    header: bool = True,
+    row_group_size: int = DEFAULT_ROW_GROUP_SIZE,
+) -> int:
+    """Writes the rows of the given view (a view class, or the name of a registered view) to `output`.
+
+    Args:
+        output: the file object to write to.  CSV can be written to text or binary files, Parquet to binary files
+            (or a path).
+        format (str): FORMAT_CSV or FORMAT_PARQUET
+        columns (List[str]): the columns to export, defaults to every column of the view
+        where (str): an SQL condition filtering the rows, e.g. `"created >= %s"`, with its `params`
+        header (bool): whether CSV exports start with a header row
+        row_group_size (int): the number of rows of each row group of Parquet exports, which bounds the number of
+            rows held in memory
+
+    Returns the number of rows exported.
+    """
+    if isinstance(view, str):
+        view = get_view_by_name(view)
+    sql = get_export_sql(view, columns, where)
+
+    if format == FORMAT_CSV:
+        return _export_csv(view, output, sql, params, header)
+    if format == FORMAT_PARQUET:
+        return _export_parquet(view, output, sql, params, row_group_size)
+    raise ValueError(f"Can't export views to {format!r}")
+
+
+def get_export_sql(view, columns: Optional[Sequence[str]] = None, where: Optional[str] = None) -> str:
+    """Returns the query selecting the exported rows of the view."""
+    quote_name = connections[view.database].ops.quote_name
+    selected_columns = ', '.join(quote_name(column) for column in columns) if columns else '*'
+    sql = f'SELECT {selected_columns} FROM {view.name_with_schema}'
+    if where:
+        sql += f' WHERE {where}'
+    return sql
+
+
+def _export_csv(view, output, sql: str, params: Optional[Sequence], header: bool) -> int:
+    with connections[view.database].cursor() as cursor:
+        # COPY doesn't take parameters, so they're interpolated by the cursor
+        query = cursor.mogrify(sql, params).decode()
+        cursor.copy_expert(f'COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER {str(header).lower()})', output)
+        return cursor.rowcount
+
+
+def _export_parquet(view, output, sql: str, params: Optional[Sequence], row_group_size: int) -> int:
+    if pyarrow is None:
+        raise ImportError('Exporting views to Parquet requires pyarrow: pip install django_orm_views[parquet]')
+    if row_group_size <= 0:
+        raise ValueError('Row groups need to hold at least one row')
+
+    rows_exported = 0
+    writer = None
+    # The server side cursor has to be read within a transaction, as it would otherwise be materialised on commit
+    with transaction.atomic(using=view.database):
+        cursor = connections[view.database].chunked_cursor()
+        try:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(row_group_size)
+                if writer is None:
+                    # A server side cursor only describes the columns once rows have been fetched
+                    schema = pyarrow.schema(
+                        [pyarrow.field(column.name, _get_arrow_type(column)) for column in cursor.description]
+                    )
+                    writer = pyarrow.parquet.ParquetWriter(output, schema)
+                if not rows:
+                    break
+                writer.write_table(_get_arrow_table(rows, schema), row_group_size=row_group_size)
+                rows_exported += len(rows)
+        finally:
+            cursor.close()
+            if writer is not None:
+                writer.close()
+    return rows_exported
+
+
+def _get_arrow_type(column):
+    """The Arrow type of a column of the cursor's description.  Columns whose type has no Arrow equivalent (or
+    numerics without a precision) are exported as text.
+    """
+    if column.type_code == _NUMERIC_OID and column.precision is not None and 0 < column.precision <= 38:
+        return pyarrow.decimal128(column.precision, max(column.scale or 0, 0))
+    factory = _ARROW_TYPE_FACTORIES.get(column.type_code)
+    return factory() if factory is not None else pyarrow.string()
+
+
+def _get_arrow_table(rows, schema):
+    arrays = []
+    for values, field in zip(zip(*rows), schema):
+        if pyarrow.types.is_string(field.type):
+            values = [_to_text(value) for value in values]
+        arrays.append(pyarrow.array(values, type=field.type))
+    return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+
+def _to_text(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        # json and jsonb columns are parsed by psycopg2
+        return json.dumps(value)
+    return str(value)
+
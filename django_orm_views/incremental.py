@@ -0,0 +1,70 @@
+from typing import List, Optional
+
+from .constants import SUB_SCHEMA_NAME, ParameterisedSQL
+
+
+class WatermarkRefreshMixin:
+    """Mixin to make a subclass of AutoRegisterMixin and BasePostgresView an append-only table, which is
+    refreshed incrementally by `refresh_incremental` rather than recomputed.
+
+    A refresh only inserts the rows of the view beyond the watermark reached by the previous refresh (stored in
+    the catalog), so the view's SQL should be able to use an index on the watermark column of its source table.
+    Rows appearing with a watermark lower than the stored one are never picked up, e.g. ids of a sequence
+    committed out of order, so the watermark should be lagged behind in-flight writes by the view if needed.
+
+    Attributes:
+        watermark_field (str): the column of the view which only ever increases, e.g. `created` or `id`.
+        pk_field (str): is an optional column of the view, which gets a unique index.  Rows beyond the watermark
+            are then upserted on it, rather than inserted.
+    """
+
+    materialised = True
+    watermark_field: Optional[str] = None
+    pk_field: Optional[str] = None
+
+    @classmethod
+    def get_creation_sql(
+        cls, schema: str = SUB_SCHEMA_NAME, include_indexes: bool = True, with_data: bool = True
+    ) -> ParameterisedSQL:
+        if not cls.watermark_field:
+            raise ValueError(f"{cls.name} can't be refreshed incrementally without a watermark_field")
+
+        parameterised_sql = cls._get_parameterised_sql_for_schema(schema)
+        name_with_schema = f'{schema}.{cls.name}'
+        sql = f"CREATE TABLE {name_with_schema} AS {parameterised_sql.sql}"
+        sql += ";" if with_data else " WITH NO DATA;"
+        # The unique index of the pk_field serves the watermark too when they're the same column
+        if cls.watermark_field != cls.pk_field:
+            sql += f"CREATE INDEX {cls.name}_{cls.watermark_field} ON {name_with_schema} ({cls.watermark_field});"
+
+        if cls.pk_field:
+            sql += f"CREATE UNIQUE INDEX {cls.name}_{cls.pk_field} ON {name_with_schema} ({cls.pk_field});"
+
+        return ParameterisedSQL(sql=sql, params=parameterised_sql.params)
+
+    @classmethod
+    def get_incremental_refresh_sql(cls, watermark: Optional[str], columns: List[str]) -> ParameterisedSQL:
+        """Get the SQL statement inserting the rows beyond `watermark` (all rows if it's None).
+
+        The statement returns the new watermark and the number of rows inserted.
+
+        Args:
+            watermark (str): the watermark reached by the last refresh, as text
+            columns (List[str]): the columns of the view, which are updated on conflicts with the pk_field (rows
+                conflicting on a view without other columns are left as they are)
+        """
+        parameterised_sql = cls._compiled_sql
+        params = list(parameterised_sql.params)
+        insert_sql = f"INSERT INTO {cls.name_with_schema} SELECT * FROM ({parameterised_sql.sql}) AS source"
+        if watermark is not None:
+            insert_sql += f" WHERE source.{cls.watermark_field} > %s"
+            params.append(watermark)
+        if cls.pk_field:
+            updates = ', '.join(f'"{column}" = EXCLUDED."{column}"' for column in columns if column != cls.pk_field)
+            insert_sql += f" ON CONFLICT ({cls.pk_field}) " + (f"DO UPDATE SET {updates}" if updates else "DO NOTHING")
+        insert_sql += f" RETURNING {cls.watermark_field}"
+
+        return ParameterisedSQL(
+            sql=f"WITH inserted AS ({insert_sql}) SELECT max({cls.watermark_field})::text, count(*) FROM inserted;",
+            params=params,
+        )
@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from django.db import connections
+
+from .constants import LOG
+
+# Postgres truncates identifiers longer than this
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def shorten_identifier(name: str, max_length: int = MAX_IDENTIFIER_LENGTH) -> str:
+    """Returns the name as is if it fits in `max_length` characters, otherwise truncated and suffixed with a hash
+    of the whole name, so that names sharing a prefix stay unique once shortened.
+    """
+    if len(name) <= max_length:
+        return name
+    digest = hashlib.md5(name.encode()).hexdigest()[:8]
+    return f'{name[:max_length - 9]}_{digest}'
+
+
+@dataclass
+class ViewIndex:
+    """An index on a materialised view, declared in `PostgresMaterialisedViewMixin.indexes`.
+
+    This mirrors Django's `Meta.indexes`, but works on column names (and SQL) rather than model fields, as
+    views don't necessarily have a model.
+
+    Attributes:
+        fields (List[str]): the columns of the index.  Prefix a column with '-' for a descending order.
+        name (str): the name of the index.  Defaults to a name generated from the view name and the fields.
+        method (str): the index access method, e.g. 'btree', 'hash', 'gin', 'gist' or 'brin'.
+        condition (str): an SQL predicate, which makes this a partial index, e.g. "status = 'active'".
+        include (List[str]): non-key columns to add to the index, so that it can cover more queries.
+        unique (bool): if True this is a unique index.
+    """
+
+    fields: List[str]
+    name: Optional[str] = None
+    method: str = 'btree'
+    condition: Optional[str] = None
+    include: List[str] = field(default_factory=list)
+    unique: bool = False
+
+    def __post_init__(self):
+        if not self.fields:
+            raise ValueError('At least one field is required to define an index')
+
+    def get_name(self, view_name: str) -> str:
+        if self.name:
+            return self.name
+        return shorten_identifier(f'{view_name}_{"_".join(field_name.lstrip("-") for field_name in self.fields)}_idx')
+
+    def get_creation_sql(self, view_name: str, view_name_with_schema: str, concurrently: bool = False) -> str:
+        """Returns the SQL to create this index on the given view.
+
+        Args:
+            concurrently (bool): if True the index is built without blocking writes (and reads) of the view.
+                The statement can't run inside a transaction, and is a no-op if the index already exists.
+        """
+        columns = ', '.join(
+            f'{field_name[1:]} DESC' if field_name.startswith('-') else field_name for field_name in self.fields
+        )
+        statement_parts = ['CREATE UNIQUE INDEX' if self.unique else 'CREATE INDEX']
+        if concurrently:
+            statement_parts.append('CONCURRENTLY IF NOT EXISTS')
+        statement_parts.append(f'{self.get_name(view_name)} ON {view_name_with_schema} USING {self.method} ({columns})')
+        if self.include:
+            statement_parts.append(f'INCLUDE ({", ".join(self.include)})')
+        if self.condition:
+            statement_parts.append(f'WHERE ({self.condition})')
+        return ' '.join(statement_parts) + ';'
+
+
+class IndexBuildMonitor:
+    """Logs the progress of the index builds of a backend, by polling `pg_stat_progress_create_index` from
+    a separate connection whilst the indexes are being built.
+    """
+
+    def __init__(self, database: str, backend_pid: int, interval: float = 5.0):
+        self.database = database
+        self.backend_pid = backend_pid
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _poll(self):
+        logger = LOG.getChild('indexes')
+        try:
+            with connections[self.database].cursor() as cursor:
+                while not self._stop.wait(self.interval):
+                    cursor.execute(
+                        """
+                        SELECT index_relid::regclass::text, phase, blocks_done, blocks_total, tuples_done, tuples_total
+                        FROM pg_stat_progress_create_index
+                        WHERE pid = %s
+                        """,
+                        params=[self.backend_pid],
+                    )
+                    for index_name, phase, blocks_done, blocks_total, tuples_done, tuples_total in cursor.fetchall():
+                        logger.info(
+                            'Building index %s: %s (blocks %s/%s, tuples %s/%s)',
+                            index_name, phase, blocks_done, blocks_total, tuples_done, tuples_total,
+                        )
+        finally:
+            connections[self.database].close()
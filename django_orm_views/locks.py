@@ -0,0 +1,68 @@
+"""Postgres advisory locks, so that several processes (e.g. deploy jobs started by every pod) never sync the views
+of a database, or refresh the same view, at the same time.
+
+The locks are session level: they're held by the connection until released, whether or not its transactions
+commit, and are released by Postgres if the connection is lost.
+"""
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+from django.db import transaction
+
+from .exceptions import AdvisoryLockTimeout
+
+# The first half of the keys of every lock taken by the package, the second half being derived from the lock name
+LOCK_NAMESPACE = 'django_orm_views'
+SYNC_LOCK_NAME = 'sync'
+
+# How often pg_try_advisory_lock is retried whilst waiting for a lock with a timeout
+POLL_INTERVAL = 0.05
+
+
+def get_refresh_lock_name(view) -> str:
+    return f'refresh:{view.name}'
+
+
+@contextmanager
+def advisory_lock(cursor, name: str, skip_if_locked: bool = False, timeout: Optional[float] = None):
+    """Holds the advisory lock with the given name on the cursor's connection for the duration of the block.
+
+    If the lock is held by another session, waits for it to be released: indefinitely if `timeout` is None,
+    otherwise for up to `timeout` seconds before raising AdvisoryLockTimeout.  If `skip_if_locked` is True, the
+    block is entered without the lock instead: straight away without a `timeout`, otherwise once the lock is still
+    held after polling it for `timeout` seconds.
+
+    Within a transaction, the block runs in a savepoint: an error rolls back to it, so that the lock can still be
+    released (rather than the release failing in the aborted transaction, and hiding the error).
+
+    Yields whether the lock was acquired.
+    """
+    key_sql = 'hashtext(%s), hashtext(%s)'
+    key_params = [LOCK_NAMESPACE, name]
+
+    if timeout is None and not skip_if_locked:
+        cursor.execute(f'SELECT pg_advisory_lock({key_sql});', key_params)
+        acquired = True
+    else:
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            cursor.execute(f'SELECT pg_try_advisory_lock({key_sql});', key_params)
+            acquired = cursor.fetchone()[0]
+            remaining = deadline - time.monotonic()
+            if acquired or remaining <= 0:
+                break
+            time.sleep(min(POLL_INTERVAL, remaining))
+
+    if not acquired and not skip_if_locked:
+        raise AdvisoryLockTimeout(name, timeout)
+
+    # Django's cursors know their connection, unlike those of psycopg2
+    connection = getattr(cursor, 'db', None)
+    in_atomic_block = connection is not None and connection.in_atomic_block
+    try:
+        with transaction.atomic(using=connection.alias) if in_atomic_block else nullcontext():
+            yield acquired
+    finally:
+        if acquired:
+            cursor.execute(f'SELECT pg_advisory_unlock({key_sql});', key_params)
@@ -0,0 +1,96 @@
+import json
+
+from django.core.management import BaseCommand
+
+from ...explain import LARGE_TABLE_ROWS, explain_views
+from ...register import get_view_by_name
+
+
+class Command(BaseCommand):
+    help = 'Reports the estimated cost of views defined using the django_orm_views framework, most expensive first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'view_names',
+            nargs='*',
+            help='Names of the views to report on (defaults to every view)',
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            dest='analyze',
+            help='Also execute the plans (EXPLAIN ANALYZE), on a sample of rows of each view',
+        )
+        parser.add_argument(
+            '--sample-limit',
+            action='store',
+            type=int,
+            default=1000,
+            dest='sample_limit',
+            help='Maximum number of rows of each view read with --analyze',
+        )
+        parser.add_argument(
+            '--large-table-rows',
+            action='store',
+            type=int,
+            default=LARGE_TABLE_ROWS,
+            dest='large_table_rows',
+            help='Estimated number of rows from which sequential scans of a table are reported',
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            dest='json',
+            help='Output the reports as JSON',
+        )
+
+    def handle(self, *_, **options):
+        view_names = options.get('view_names')
+        views = [get_view_by_name(name) for name in view_names] if view_names else None
+        reports = explain_views(
+            views,
+            analyze=options.get('analyze', False),
+            sample_limit=options.get('sample_limit'),
+            large_table_rows=options.get('large_table_rows'),
+        )
+
+        if options.get('json'):
+            self.stdout.write(json.dumps([self._to_dict(report) for report in reports], indent=2))
+            return
+
+        for report in reports:
+            if report.error is not None:
+                self.stderr.write(f'{report.view.name} ({report.database}): failed to explain: {report.error}')
+                continue
+            line = f'{report.view.name} ({report.database}): cost {report.total_cost:.2f}, {report.plan_rows} rows'
+            if report.execution_time is not None:
+                line += f', sample executed in {report.execution_time:.2f}ms'
+            self.stdout.write(line)
+            if report.inlined_views:
+                self.stdout.write(f'    inlined {", ".join(report.inlined_views)}')
+            for scan in report.sequential_scans:
+                self.stdout.write(f'    sequential scan of {scan.table} ({scan.table_rows} rows)')
+            for hint in report.missing_index_hints:
+                self.stdout.write(f'    missing index? {hint}')
+
+    @staticmethod
+    def _to_dict(report):
+        return {
+            'view': report.view.name,
+            'database': report.database,
+            'total_cost': report.total_cost,
+            'plan_rows': report.plan_rows,
+            'execution_time': report.execution_time,
+            'sequential_scans': [
+                {
+                    'table': scan.table,
+                    'table_rows': scan.table_rows,
+                    'filter': scan.filter,
+                    'rows_removed_by_filter': scan.rows_removed_by_filter,
+                }
+                for scan in report.sequential_scans
+            ],
+            'missing_index_hints': report.missing_index_hints,
+            'error': report.error,
+            'inlined_views': report.inlined_views,
+        }
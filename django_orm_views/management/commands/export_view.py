@@ -0,0 +1,96 @@
+import io
+
+from django.core.management import BaseCommand, CommandError
+
+from ...export import DEFAULT_ROW_GROUP_SIZE, FORMAT_CSV, FORMAT_PARQUET, export_view
+from ...register import get_view_by_name
+
+
+class _StdoutFile(io.TextIOBase):
+    """The command's stdout as a file, writing the data as is (OutputWrapper would end each write with a newline)."""
+
+    def __init__(self, stdout):
+        super().__init__()
+        self._stdout = stdout
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._stdout.write(data, ending='')
+        return len(data)
+
+
+class Command(BaseCommand):
+    help = 'Exports the rows of a view defined using the django_orm_views framework to CSV or Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'view_name',
+            help='Name of the view to export',
+        )
+        parser.add_argument(
+            '--format',
+            action='store',
+            choices=[FORMAT_CSV, FORMAT_PARQUET],
+            default=FORMAT_CSV,
+            dest='format',
+            help='Format of the export',
+        )
+        parser.add_argument(
+            '--output',
+            action='store',
+            dest='output',
+            help='Path of the file to write (defaults to stdout, for CSV only)',
+        )
+        parser.add_argument(
+            '--columns',
+            action='store',
+            dest='columns',
+            help='Comma separated columns to export (defaults to every column)',
+        )
+        parser.add_argument(
+            '--where',
+            action='store',
+            dest='where',
+            help='SQL condition filtering the exported rows',
+        )
+        parser.add_argument(
+            '--no-header',
+            action='store_false',
+            dest='header',
+            help='Leave the header row out of CSV exports',
+        )
+        parser.add_argument(
+            '--row-group-size',
+            action='store',
+            type=int,
+            default=DEFAULT_ROW_GROUP_SIZE,
+            dest='row_group_size',
+            help='Number of rows of each row group of Parquet exports',
+        )
+
+    def handle(self, *_, **options):
+        try:
+            view = get_view_by_name(options['view_name'])
+        except LookupError as error:
+            raise CommandError(str(error))
+        output_path = options.get('output')
+        export_format = options.get('format', FORMAT_CSV)
+        if output_path is None and export_format != FORMAT_CSV:
+            raise CommandError(f'--output is required to export to {export_format}')
+        columns = options.get('columns')
+        export_kwargs = dict(
+            format=export_format,
+            columns=[column.strip() for column in columns.split(',')] if columns else None,
+            where=options.get('where'),
+            header=options.get('header', True),
+            row_group_size=options.get('row_group_size'),
+        )
+
+        if output_path is None:
+            export_view(view, _StdoutFile(self.stdout), **export_kwargs)
+            return
+        with open(output_path, 'wb') as output:
+            rows = export_view(view, output, **export_kwargs)
+        self.stdout.write(f'Exported {rows} rows of {view.name} to {output_path}')
@@ -0,0 +1,25 @@
+from django.core.management import BaseCommand
+
+from ...constants import LOG
+from ...sync import populate_materialized_views
+
+
+class Command(BaseCommand):
+    help = 'Populates the materialized views created WITH NO DATA by `sync_views --defer-population`'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            action='store',
+            type=int,
+            default=4,
+            dest='workers',
+            help='Maximum number of views populated at the same time',
+        )
+
+    def handle(self, *_, **options):
+        populated = populate_materialized_views(max_workers=options.get('workers'))
+
+        msg = f'Successfully populated {len(populated)} materialized views using django_orm_views'
+        LOG.getChild('populate_materialized_views').info(msg)
+        self.stdout.write(msg)
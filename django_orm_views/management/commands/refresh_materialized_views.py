@@ -0,0 +1,65 @@
+from django.core.management import BaseCommand
+
+from ...constants import LOG
+from ...register import get_view_by_name
+from ...sync import refresh_materialized_views
+
+
+class Command(BaseCommand):
+    help = 'Refreshes materialized views defined using the django_orm_views framework, in dependency order'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'view_names',
+            nargs='*',
+            help='Names of the views to refresh (defaults to every materialized view)',
+        )
+        parser.add_argument(
+            '--workers',
+            action='store',
+            type=int,
+            default=4,
+            dest='workers',
+            help='Maximum number of views refreshed at the same time',
+        )
+        parser.add_argument(
+            '--concurrently',
+            action='store_true',
+            dest='concurrently',
+            help='Refresh the views concurrently (requires a pk_field on every view)',
+        )
+        parser.add_argument(
+            '--only-if-stale',
+            action='store_true',
+            dest='only_if_stale',
+            help='Skip views whose source tables have not been written to since their last refresh',
+        )
+        parser.add_argument(
+            '--skip-if-locked',
+            action='store_true',
+            dest='skip_if_locked',
+            help='Skip views being refreshed by another process (after --lock-timeout if given), rather than failing',
+        )
+        parser.add_argument(
+            '--lock-timeout',
+            action='store',
+            type=float,
+            dest='lock_timeout',
+            help='Maximum number of seconds to wait for views being refreshed elsewhere (defaults to no limit)',
+        )
+
+    def handle(self, *_, **options):
+        view_names = options.get('view_names')
+        views = [get_view_by_name(name) for name in view_names] if view_names else None
+        refreshed = refresh_materialized_views(
+            views,
+            concurrently=options.get('concurrently', False),
+            max_workers=options.get('workers'),
+            only_if_stale=options.get('only_if_stale', False),
+            skip_if_locked=options.get('skip_if_locked', False),
+            lock_timeout=options.get('lock_timeout'),
+        )
+
+        msg = f'Successfully refreshed {len(refreshed)} materialized views using django_orm_views'
+        LOG.getChild('refresh_materialized_views').info(msg)
+        self.stdout.write(msg)
@@ -0,0 +1,63 @@
+import signal
+import threading
+
+from django.core.management import BaseCommand, CommandError
+
+from ...constants import LOG
+from ...register import get_view_by_name
+from ...scheduler import ViewRefresher
+
+
+class Command(BaseCommand):
+    help = 'Refreshes materialized views according to their refresh_policy, until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'view_names',
+            nargs='*',
+            help='Names of the views to refresh (defaults to every materialized view with a refresh_policy)',
+        )
+        parser.add_argument(
+            '--workers',
+            action='store',
+            type=int,
+            default=4,
+            dest='workers',
+            help='Maximum number of views refreshed at the same time',
+        )
+        parser.add_argument(
+            '--jitter',
+            action='store',
+            type=float,
+            default=0.1,
+            dest='jitter',
+            help='Fraction of their interval by which refreshes are randomly brought forward or delayed',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            action='store',
+            type=float,
+            default=1.0,
+            dest='poll_interval',
+            help='Number of seconds between checks for refreshes which are due',
+        )
+
+    def handle(self, *_, **options):
+        view_names = options.get('view_names')
+        views = [get_view_by_name(name) for name in view_names] if view_names else None
+        try:
+            refresher = ViewRefresher(views, max_workers=options.get('workers'), jitter=options.get('jitter'))
+        except ValueError as error:
+            raise CommandError(str(error)) from error
+
+        stop = threading.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signal_number, lambda *_: stop.set())
+
+        logger = LOG.getChild('run_view_refresher')
+        logger.info('Starting the view refresher')
+        refresher.run(stop, poll_interval=options.get('poll_interval'))
+
+        msg = 'Stopped refreshing views using django_orm_views'
+        logger.info(msg)
+        self.stdout.write(msg)
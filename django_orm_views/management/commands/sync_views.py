@@ -1,6 +1,7 @@
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 
 from ...constants import LOG
+from ...exceptions import AdvisoryLockTimeout, ViewSyncError
 from ...sync import sync_views
 
 
@@ -14,14 +15,90 @@ class Command(BaseCommand):
             dest='grant_select_to_user',
             help='Delete poll instead of closing it',
         )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            dest='incremental',
+            help='Only rebuild views whose definition changed since the last sync (and their dependents)',
+        )
+        parser.add_argument(
+            '--blue-green',
+            action='store_true',
+            dest='blue_green',
+            help='Build the views under a staging schema and swap it in, without blocking readers',
+        )
+        parser.add_argument(
+            '--batched',
+            action='store_true',
+            dest='batched',
+            help='Send the DDL of each level of the dependency graph in a single round trip',
+        )
+        parser.add_argument(
+            '--parallel-databases',
+            action='store_true',
+            dest='parallel_databases',
+            help='Sync each database from its own thread',
+        )
+        parser.add_argument(
+            '--concurrent-indexes',
+            action='store_true',
+            dest='concurrent_indexes',
+            help='Build the indexes of materialised views concurrently, once the views have been sync\'d',
+        )
+        parser.add_argument(
+            '--defer-population',
+            action='store_true',
+            dest='defer_population',
+            help='Create materialised views WITH NO DATA, to be populated by populate_materialized_views',
+        )
+        parser.add_argument(
+            '--skip-if-locked',
+            action='store_true',
+            dest='skip_if_locked',
+            help='Skip databases whose views are being sync\'d by another process (after --lock-timeout if given)',
+        )
+        parser.add_argument(
+            '--lock-timeout',
+            action='store',
+            type=float,
+            dest='lock_timeout',
+            help='Maximum number of seconds to wait for another process syncing the views (defaults to no limit)',
+        )
 
     def handle(self, *_, **options):
         grant_select_to_user = options.get('grant_select_to_user')
-        sync_views(
-            grant_select_permissions_to_user=grant_select_to_user
-        )
+        try:
+            results = sync_views(
+                grant_select_permissions_to_user=grant_select_to_user,
+                incremental=options.get('incremental', False),
+                blue_green=options.get('blue_green', False),
+                batched=options.get('batched', False),
+                parallel_databases=options.get('parallel_databases', False),
+                concurrent_indexes=options.get('concurrent_indexes', False),
+                defer_population=options.get('defer_population', False),
+                skip_if_locked=options.get('skip_if_locked', False),
+                lock_timeout=options.get('lock_timeout'),
+            )
+        except ViewSyncError as error:
+            self._write_results(error.results)
+            raise CommandError(str(error)) from error
+        except AdvisoryLockTimeout as error:
+            raise CommandError(str(error)) from error
+        self._write_results(results)
 
         # Inform everything that we sync'd views (Logging + stdout)
         msg = 'Successfully sync\'d all views using django_orm_views'
         LOG.getChild('sync_views').info(msg)
         self.stdout.write(msg)
+
+    def _write_results(self, results):
+        for result in results.values():
+            if result.error is not None:
+                self.stderr.write(f'Failed to sync views for {result.database} database: {result.error}')
+                continue
+            if result.skipped:
+                self.stdout.write(f'Skipped {result.database} database as it is being sync\'d by another process')
+                continue
+            self.stdout.write(
+                f'Sync\'d {result.views_synced} views for {result.database} database in {result.duration:.2f}s'
+            )
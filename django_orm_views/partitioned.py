@@ -0,0 +1,183 @@
+"""Materialised views stored as tables partitioned by period, for views over time-series tables.
+
+A refresh of a materialised view recomputes all of its rows.  A `PartitionedMaterialisedViewMixin` view is
+materialised into a table partitioned by month or day on one of its columns instead, and a refresh only recomputes
+the rows of its most recent partitions: the older partitions are frozen, so the cost of a refresh is proportional to
+the recent rows rather than to the whole history.
+
+```
+    class DailyEvents(PartitionedMaterialisedViewMixin, ReadableViewFromQueryset):
+        partition_field = 'day'
+        partition_interval = PARTITION_BY_MONTH
+        refresh_partitions = 2
+```
+"""
+import datetime
+import re
+from typing import Optional
+
+from .constants import SUB_SCHEMA_NAME, ParameterisedSQL
+from .indexes import MAX_IDENTIFIER_LENGTH, shorten_identifier
+from .register import registry
+from .views import PostgresMaterialisedViewMixin
+
+PARTITION_BY_MONTH = 'month'
+PARTITION_BY_DAY = 'day'
+
+# The suffixes of the partitions of each period, formatted with Postgres' to_char
+_PARTITION_SUFFIX_FORMATS = {PARTITION_BY_MONTH: 'YYYYMM', PARTITION_BY_DAY: 'YYYYMMDD'}
+# The longest suffix appended to the partition prefix: `_p` and a day (`_pdefault`, `_columns` and `_rows` are shorter)
+_MAX_SUFFIX_LENGTH = len('_pYYYYMMDD')
+
+
+def get_period_start(day: datetime.date, interval: str) -> datetime.date:
+    """The first day of the period of the given interval that `day` falls in."""
+    return day.replace(day=1) if interval == PARTITION_BY_MONTH else day
+
+
+def _get_previous_period_start(period_start: datetime.date, interval: str) -> datetime.date:
+    return get_period_start(period_start - datetime.timedelta(days=1), interval)
+
+
+def is_partitioned(view) -> bool:
+    """Whether the view (a view class, or an instance of one) is a PartitionedMaterialisedViewMixin view."""
+    return issubclass(view if isinstance(view, type) else type(view), PartitionedMaterialisedViewMixin)
+
+
+class PartitionedMaterialisedViewMixin(PostgresMaterialisedViewMixin):
+    """Mixin to make a subclass of AutoRegisterMixin and BasePostgresView materialised into a table partitioned by
+    range on `partition_field`, with a partition per period (see the module docstring).
+
+    Partitions are created as rows of new periods appear.  Rows whose `partition_field` is NULL are kept in a
+    default partition, which is recomputed by every refresh.
+
+    A refresh recomputes the partitions from the start of the `refresh_partitions`-th most recent period (as of the
+    current date), or of the period of the previous refresh if that's earlier so that no period is frozen before a
+    refresh has seen its end.  Rows which change in frozen partitions are only picked up by the next sync.  The
+    refresh deletes and inserts the recomputed rows in a transaction, so it doesn't block readers (`concurrently`
+    doesn't apply), and the view's SQL should let Postgres push the filter on `partition_field` down to an index
+    of its source table.
+
+    Attributes:
+        partition_field (str): the date or timestamp column of the view the table is partitioned on.
+        partition_interval (str): the period of each partition, PARTITION_BY_MONTH or PARTITION_BY_DAY.
+        refresh_partitions (int): the number of most recent periods recomputed by a refresh.
+    """
+
+    partition_field: Optional[str] = None
+    partition_interval: str = PARTITION_BY_MONTH
+    refresh_partitions: int = 2
+
+    @classmethod
+    def get_partition_prefix(cls) -> str:
+        """The prefix of the names of the view's partitions (and of the temporary tables of its refreshes): the name
+        of the view, shortened with a hash if the names would otherwise be longer than Postgres allows.
+        """
+        return shorten_identifier(cls.name, MAX_IDENTIFIER_LENGTH - _MAX_SUFFIX_LENGTH)
+
+    @classmethod
+    def _check_partitioning(cls):
+        if len(cls.name) > MAX_IDENTIFIER_LENGTH:
+            raise ValueError(f"{cls.name} is longer than the {MAX_IDENTIFIER_LENGTH} characters Postgres allows")
+        partition_name_pattern = re.compile(rf'{re.escape(cls.get_partition_prefix())}_p(\d+|default)')
+        for view in registry[cls.database]:
+            if view is not cls and partition_name_pattern.fullmatch(view.name):
+                raise ValueError(f"The partitions of {cls.name} would collide with {view.name}")
+        if not cls.partition_field:
+            raise ValueError(f"{cls.name} can't be partitioned without a partition_field")
+        if cls.partition_interval not in _PARTITION_SUFFIX_FORMATS:
+            raise ValueError(f"{cls.name} can't be partitioned by {cls.partition_interval!r}")
+        if cls.refresh_partitions < 1:
+            raise ValueError(f"{cls.name} has to refresh at least one partition")
+        if cls.pk_field:
+            # Unique indexes of partitioned tables have to include the partition key
+            raise ValueError(
+                f"{cls.name} can't have a pk_field, declare a unique ViewIndex including the partition_field instead"
+            )
+
+    @classmethod
+    def get_creation_sql(
+        cls, schema: str = SUB_SCHEMA_NAME, include_indexes: bool = True, with_data: bool = True
+    ) -> ParameterisedSQL:
+        """Returns the SQL to create the partitioned table, populated unless `with_data` is False.
+
+        The indexes are always included, as Postgres can't build the indexes of partitioned tables concurrently.
+        """
+        cls._check_partitioning()
+        parameterised_sql = cls._get_parameterised_sql_for_schema(schema)
+        name_with_schema = f'{schema}.{cls.name}'
+        partition_prefix = cls.get_partition_prefix()
+        # The columns of the table are those of the view's SQL, which are only known to Postgres
+        columns_table = f'pg_temp."{partition_prefix}_columns"'
+        sql = (
+            f'CREATE TEMPORARY TABLE "{partition_prefix}_columns" AS {parameterised_sql.sql} WITH NO DATA;'
+            f'CREATE TABLE {name_with_schema} (LIKE {columns_table}) PARTITION BY RANGE ({cls.partition_field});'
+            f'DROP TABLE {columns_table};'
+            f'CREATE TABLE {schema}.{partition_prefix}_pdefault PARTITION OF {name_with_schema} DEFAULT;'
+        )
+        params = list(parameterised_sql.params)
+        if with_data:
+            population_sql = cls.get_partition_refresh_sql(None, schema=schema)
+            sql += population_sql.sql
+            params += population_sql.params
+        sql += ''.join(cls.get_index_sql(schema=schema))
+        return ParameterisedSQL(sql=sql, params=params)
+
+    @classmethod
+    def get_refresh_sql(cls, concurrently: bool = False) -> str:
+        raise ValueError(f"{cls.name} is refreshed by partition, see get_partition_refresh_sql")
+
+    @classmethod
+    def get_refresh_start(
+        cls, today: datetime.date, last_refreshed_on: Optional[datetime.date]
+    ) -> Optional[datetime.date]:
+        """Returns the start of the oldest period recomputed by a refresh (see the class docstring), or None if
+        the view has never been refreshed, in which case all of its rows are recomputed.
+        """
+        if last_refreshed_on is None:
+            return None
+        start = get_period_start(today, cls.partition_interval)
+        for _ in range(cls.refresh_partitions - 1):
+            start = _get_previous_period_start(start, cls.partition_interval)
+        return min(start, get_period_start(last_refreshed_on, cls.partition_interval))
+
+    @classmethod
+    def get_partition_refresh_sql(
+        cls, since: Optional[datetime.date], schema: str = SUB_SCHEMA_NAME
+    ) -> ParameterisedSQL:
+        """Get the SQL statements recomputing the rows from the period starting `since` onwards (and those without
+        a period), or every row if it's None, creating the partitions of new periods.  They have to run in a
+        transaction.
+        """
+        cls._check_partitioning()
+        parameterised_sql = cls._get_parameterised_sql_for_schema(schema)
+        name_with_schema = f'{schema}.{cls.name}'
+        field = cls.partition_field
+        partition_prefix = cls.get_partition_prefix()
+        suffix_format = _PARTITION_SUFFIX_FORMATS[cls.partition_interval]
+        # The rows are computed once into a temporary table, which tells the periods to create partitions for
+        rows_table = f'pg_temp."{partition_prefix}_rows"'
+
+        delete_sql = f'DELETE FROM {name_with_schema}'
+        select_sql = f'SELECT * FROM ({parameterised_sql.sql}) AS source'
+        params = list(parameterised_sql.params)
+        if since is not None:
+            delete_sql += f' WHERE {field} >= %s OR {field} IS NULL'
+            select_sql += f' WHERE source.{field} >= %s OR source.{field} IS NULL'
+            params = [since, *params, since]
+
+        # The DO block is dollar quoted and takes no parameters, `%` is doubled for the cursor
+        sql = (
+            f'{delete_sql};'
+            f'CREATE TEMPORARY TABLE "{partition_prefix}_rows" AS {select_sql};'
+            f'DO $partitions$ DECLARE period date; BEGIN '
+            f"FOR period IN SELECT DISTINCT date_trunc('{cls.partition_interval}', {field})::date FROM {rows_table}"
+            f' WHERE {field} IS NOT NULL LOOP '
+            f"EXECUTE format('CREATE TABLE IF NOT EXISTS %%I.%%I PARTITION OF %%I.%%I FOR VALUES FROM (%%L) TO (%%L)',"
+            f" '{schema}', '{partition_prefix}_p' || to_char(period, '{suffix_format}'),"
+            f" '{schema}', '{cls.name}', period, (period + interval '1 {cls.partition_interval}')::date);"
+            f' END LOOP; END $partitions$;'
+            f'INSERT INTO {name_with_schema} SELECT * FROM {rows_table};'
+            f'DROP TABLE {rows_table};'
+        )
+        return ParameterisedSQL(sql=sql, params=params)
@@ -0,0 +1,37 @@
+import datetime
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class RefreshPolicy:
+    """How `run_view_refresher` refreshes a materialised view, see `PostgresMaterialisedViewMixin.refresh_policy`.
+
+    Attributes:
+        interval (timedelta): how often the view is refreshed.
+        max_staleness (timedelta): if set, refreshes are skipped whilst the source tables of the view are unchanged
+            (see `only_if_stale`), as long as the view was refreshed within `max_staleness`.
+        concurrently (bool): if True the view is refreshed concurrently, which requires a pk_field.
+        window_start (time): if set along with `window_end`, refreshes only start between these times of the day
+            (in the current time zone).  The window spans midnight if `window_end` is before `window_start`.
+        window_end (time): see `window_start`.
+    """
+
+    interval: datetime.timedelta
+    max_staleness: Optional[datetime.timedelta] = None
+    concurrently: bool = False
+    window_start: Optional[datetime.time] = None
+    window_end: Optional[datetime.time] = None
+
+    def __post_init__(self):
+        if self.interval <= datetime.timedelta(0):
+            raise ValueError('The refresh interval has to be positive')
+        if (self.window_start is None) != (self.window_end is None):
+            raise ValueError('A refresh window needs both a start and an end')
+
+    def is_within_window(self, time_of_day: datetime.time) -> bool:
+        if self.window_start is None:
+            return True
+        if self.window_start <= self.window_end:
+            return self.window_start <= time_of_day < self.window_end
+        return time_of_day >= self.window_start or time_of_day < self.window_end
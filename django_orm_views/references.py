@@ -0,0 +1,50 @@
+"""Helpers for finding references to views in generated or hand written SQL.
+
+References are matched on the qualified name, either unquoted (`views.my_view`) or quoted (`"views"."my_view"`,
+as generated by Django for `NotManagedModel` tables).  This is a textual match: a qualified view name inside a
+string literal would be matched too.
+"""
+import re
+from typing import Callable, Iterable, Optional, Pattern, Set
+
+from .constants import SUB_SCHEMA_NAME
+
+
+def compile_view_reference_pattern(view_names: Iterable[str]) -> Optional[Pattern]:
+    """Returns the pattern matching references to `view_names`, which can be reused across calls of
+    `find_view_references` and `replace_view_references`.  None if there are no names.
+    """
+    view_names = list(view_names)
+    if not view_names:
+        return None
+    names = '|'.join(re.escape(name) for name in sorted(view_names, key=len, reverse=True))
+    return re.compile(
+        rf'(?<![\w."$])("?){re.escape(SUB_SCHEMA_NAME)}\1\s*\.\s*("?)(?P<name>{names})\2(?![\w"$])'
+    )
+
+
+def replace_view_references(
+    sql: str,
+    view_names: Iterable[str],
+    replacement: Callable[[str], str],
+    pattern: Optional[Pattern] = None,
+) -> str:
+    """Replaces each reference to one of `view_names` with `replacement(view_name)`.
+
+    `pattern` is the pattern of `view_names`, if already compiled with `compile_view_reference_pattern`.
+    """
+    pattern = pattern or compile_view_reference_pattern(view_names)
+    if pattern is None:
+        return sql
+    return pattern.sub(lambda match: replacement(match.group('name')), sql)
+
+
+def find_view_references(sql: str, view_names: Iterable[str], pattern: Optional[Pattern] = None) -> Set[str]:
+    """Returns the names amongst `view_names` of the views referenced by the SQL.
+
+    `pattern` is the pattern of `view_names`, if already compiled with `compile_view_reference_pattern`.
+    """
+    pattern = pattern or compile_view_reference_pattern(view_names)
+    if pattern is None:
+        return set()
+    return {match.group('name') for match in pattern.finditer(sql)}
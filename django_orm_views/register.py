@@ -1,11 +1,17 @@
 import importlib
+import importlib.util
 from collections import defaultdict
+from typing import List, Optional
+
 from django.apps import apps
 from .constants import LOG, VIEWS_FILE_NAME, DEFAULT_DATABASE_LABEL
 
 
 registry = defaultdict(set)
 
+_views_modules: Optional[List[str]] = None
+_all_views_registered = False
+
 
 class AutoRegisterMixin:
     """
@@ -34,18 +40,54 @@ class AutoRegisterMixin:
         registry[cls.database].add(cls)
 
 
+def discover_views_modules() -> List[str]:
+    """Returns the names of the .postgres_views modules/packages of all installed apps, without importing them.
+    """
+    global _views_modules
+    if _views_modules is None:
+        _views_modules = [
+            f'{app_config.name}.{VIEWS_FILE_NAME}'
+            for app_config in apps.get_app_configs()
+            if _module_exists(f'{app_config.name}.{VIEWS_FILE_NAME}')
+        ]
+    return _views_modules
+
+
+def _module_exists(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        # The parent isn't a package
+        return False
+
+
 def register_all_views():
     """
     Forces import of all views which will then register themselves using AutoRegisterMixin.
+
+    The modules are only imported the first time this is called.
     """
-    LOG.getChild(__name__).info('Importing all Postgres views from .%s files/packages in apps', VIEWS_FILE_NAME)
-    # Iterate over all app configs to build out our list of postgres views
-    for app_label, app_config in apps.app_configs.items():
+    global _all_views_registered
+    if _all_views_registered:
+        return
 
-        # Assume we have a top level module/package called postgres_views in our app.
-        import_name = app_config.name
-        to_import = f'{import_name}.{VIEWS_FILE_NAME}'
+    LOG.getChild(__name__).info('Importing all Postgres views from .%s files/packages in apps', VIEWS_FILE_NAME)
+    for to_import in discover_views_modules():
         try:
             importlib.import_module(to_import)
         except ImportError:
-            continue
+            LOG.getChild(__name__).warning('Failed to import %s', to_import, exc_info=True)
+    _all_views_registered = True
+
+
+def get_view_by_name(name: str):
+    """Looks up a registered view by its name in the database (e.g. `test_simpleviewfromsql`).
+
+    Raises LookupError if no registered view has that name.
+    """
+    register_all_views()
+    for views in registry.values():
+        for view in views:
+            if view.name == name:
+                return view
+    raise LookupError(f'No view named {name} is registered')
@@ -0,0 +1,160 @@
+import datetime
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .constants import LOG
+from .register import registry, register_all_views
+from .sync import _materialised_dependencies, _refresh_materialized_view_in_thread
+from .views import PostgresMaterialisedViewMixin
+
+
+@dataclass
+class _ScheduledView:
+    view: type
+    next_run: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    last_refreshed: Optional[float] = None
+    failures: int = 0
+
+
+def _get_time_of_day() -> datetime.time:
+    """The current time of the day, in the current time zone."""
+    return (timezone.localtime() if settings.USE_TZ else datetime.datetime.now()).time()
+
+
+class ViewRefresher:
+    """Refreshes materialised views according to their `refresh_policy`, from a pool of `max_workers` threads.
+
+    Each view is refreshed every `interval` of its policy (from the start of one refresh to the next), give or take
+    `jitter` (a fraction of the interval) so that views with the same interval don't all refresh at once.  The first
+    refreshes are spread over the jitter.  A failed refresh is retried `retry_delay` after it failed, doubling on each
+    consecutive failure up to `max_backoff`.
+    A view isn't started whilst one of the materialised views it depends on is being refreshed, or is due to be.
+
+    `tick` starts the refreshes which are due, and `run` calls it until stopped.
+    """
+
+    def __init__(
+        self,
+        views: Optional[Iterable[PostgresMaterialisedViewMixin]] = None,
+        max_workers: int = 4,
+        jitter: float = 0.1,
+        retry_delay: datetime.timedelta = datetime.timedelta(minutes=1),
+        max_backoff: datetime.timedelta = datetime.timedelta(hours=1),
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None,
+    ):
+        register_all_views()
+        if views is None:
+            views = [
+                view for view in itertools.chain.from_iterable(registry.values())
+                if issubclass(view, PostgresMaterialisedViewMixin) and view.refresh_policy is not None
+            ]
+        views = set(views)
+        views_without_policy = sorted(view.name for view in views if view.refresh_policy is None)
+        if views_without_policy:
+            raise ValueError(f"Can't schedule views without a refresh_policy: {views_without_policy}")
+
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.retry_delay = retry_delay.total_seconds()
+        self.max_backoff = max_backoff.total_seconds()
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._running = {}
+        self._dependencies = {view: _materialised_dependencies(view, views) for view in views}
+
+        now = self._clock()
+        self._scheduled = {
+            view: _ScheduledView(
+                view, now + self._rng.uniform(0, jitter) * view.refresh_policy.interval.total_seconds()
+            )
+            for view in views
+        }
+
+    def tick(self):
+        """Records the refreshes which have finished, then starts the ones which are due (as workers allow)."""
+        logger = LOG.getChild('refresher')
+        now = self._clock()
+
+        for view, future in list(self._running.items()):
+            if not future.done():
+                continue
+            del self._running[view]
+            scheduled = self._scheduled[view]
+            error = future.exception()
+            if error is None:
+                if future.result():
+                    scheduled.last_refreshed = scheduled.started_at
+                scheduled.failures = 0
+                interval = view.refresh_policy.interval.total_seconds()
+                jitter = self._rng.uniform(-self.jitter, self.jitter)
+                scheduled.next_run = scheduled.started_at + interval * (1 + jitter)
+            else:
+                scheduled.failures += 1
+                backoff = min(self.retry_delay * 2 ** (scheduled.failures - 1), self.max_backoff)
+                scheduled.next_run = scheduled.finished_at + backoff
+                logger.error(
+                    'Failed to refresh %s (%s consecutive failures), retrying in %ss',
+                    view.name, scheduled.failures, backoff, exc_info=error,
+                )
+
+        time_of_day = _get_time_of_day()
+        due = sorted(
+            (scheduled for scheduled in self._scheduled.values() if scheduled.next_run <= now),
+            key=lambda scheduled: scheduled.next_run,
+        )
+        for scheduled in due:
+            if len(self._running) >= self.max_workers:
+                break
+            view = scheduled.view
+            policy = view.refresh_policy
+            # Dependencies which can start now go first, as their refresh would otherwise be held back by this one.
+            # Those waiting for their window (or backing off after failures) don't hold back their dependents.
+            if view in self._running or any(
+                dependency in self._running
+                or (
+                    self._scheduled[dependency].next_run <= now
+                    and dependency.refresh_policy.is_within_window(time_of_day)
+                )
+                for dependency in self._dependencies[view]
+            ):
+                continue
+            if not policy.is_within_window(time_of_day):
+                continue
+            only_if_stale = (
+                policy.max_staleness is not None
+                and scheduled.last_refreshed is not None
+                and now - scheduled.last_refreshed < policy.max_staleness.total_seconds()
+            )
+            logger.info('Refreshing %s', view.name)
+            scheduled.started_at = now
+            self._running[view] = self._executor.submit(self._refresh, scheduled, policy.concurrently, only_if_stale)
+
+    def _refresh(self, scheduled: _ScheduledView, concurrently: bool, only_if_stale: bool) -> bool:
+        try:
+            # Views being refreshed by another refresher (e.g. from another pod) are skipped until their next run
+            return _refresh_materialized_view_in_thread(
+                scheduled.view, concurrently, only_if_stale, skip_if_locked=True
+            )
+        finally:
+            scheduled.finished_at = self._clock()
+
+    def run(self, stop: threading.Event, poll_interval: float = 1.0):
+        """Refreshes the views until `stop` is set, then waits for the running refreshes to finish."""
+        try:
+            while not stop.is_set():
+                self.tick()
+                stop.wait(poll_interval)
+        finally:
+            self._executor.shutdown(wait=True)
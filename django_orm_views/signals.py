@@ -0,0 +1,112 @@
+"""Signals sent as views are sync'd and refreshed, for instrumentation.
+
+Receivers are given a `metrics` keyword argument holding a ViewMetrics, and the view class as the sender, e.g.
+
+```
+    @receiver(view_refreshed)
+    def record_refresh(sender, metrics, **kwargs):
+        statsd.timing(f'views.{sender.name}.refresh', metrics.duration)
+```
+
+The metrics are only gathered when a signal has receivers, as counting the rows of a view can be expensive.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db import connections
+from django.dispatch import Signal
+
+from .constants import DEFAULT_DATABASE_LABEL
+
+# Sent once the transaction creating the views has been committed, for each view created
+view_synced = Signal()
+# Sent after each refresh of a materialised view, or incremental refresh of a WatermarkRefreshMixin view
+view_refreshed = Signal()
+# Sent without metrics whenever the rows of a view may have changed (it was sync'd or refreshed), e.g. to invalidate
+# caches without the cost of gathering metrics
+view_changed = Signal()
+
+
+@dataclass
+class ViewMetrics:
+    """Metrics about the sync or refresh of a view.
+
+    Attributes:
+        database (str): the database of the view
+        duration (float): the number of seconds spent creating or refreshing the view, including lock waits.  Views
+            sync'd in batches share the duration of the statement creating their batch.
+        relation_size (int): the size of the view on disk in bytes (`pg_total_relation_size`), 0 for plain views
+        rows (int): the number of rows the view holds, or inserted for an incremental refresh.  None for plain views.
+        lock_wait (float): the number of seconds spent waiting for locks whilst refreshing the view, as sampled
+            from pg_stat_activity
+        concurrently (bool): whether the view was refreshed concurrently
+    """
+
+    database: str
+    duration: float
+    relation_size: int
+    rows: Optional[int] = None
+    lock_wait: float = 0.0
+    concurrently: bool = False
+
+
+def get_relation_metrics(cursor, relation: str):
+    """Returns the total size of the relation (including its partitions) and the number of rows it holds (None
+    unless it stores them).
+    """
+    cursor.execute(
+        "SELECT CASE WHEN relkind = 'p' THEN "
+        "(SELECT sum(pg_total_relation_size(relid))::bigint FROM pg_partition_tree(oid)) "
+        "ELSE pg_total_relation_size(oid) END, relkind IN ('m', 'r', 'p') AND relispopulated "
+        "FROM pg_class WHERE oid = %s::regclass;",
+        params=[relation],
+    )
+    relation_size, stores_rows = cursor.fetchone()
+    rows = None
+    if stores_rows:
+        cursor.execute(f'SELECT count(*) FROM {relation};')
+        rows = cursor.fetchone()[0]
+    return relation_size, rows
+
+
+class LockWaitSampler:
+    """Estimates the time spent waiting for locks, by sampling pg_stat_activity from a separate connection.
+
+    Only the given backend is sampled, or every other backend of the database if none is given, in which case
+    the estimate is in backend-seconds: two backends waiting for a second count as two seconds.
+    """
+
+    def __init__(
+        self, database: str = DEFAULT_DATABASE_LABEL, backend_pid: Optional[int] = None, interval: float = 0.01
+    ):
+        self.database = database
+        self.backend_pid = backend_pid
+        self.interval = interval
+        self.lock_wait = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        try:
+            with connections[self.database].cursor() as cursor:
+                while not self._stop.wait(self.interval):
+                    cursor.execute(
+                        """
+                        SELECT count(*) FROM pg_stat_activity
+                        WHERE datname = current_database() AND pid <> pg_backend_pid() AND wait_event_type = 'Lock'
+                        AND (%s::int IS NULL OR pid = %s::int)
+                        """,
+                        params=[self.backend_pid, self.backend_pid],
+                    )
+                    self.lock_wait += cursor.fetchone()[0] * self.interval
+        finally:
+            connections[self.database].close()
@@ -0,0 +1,44 @@
+"""Detects whether a materialised view's source tables have been written to since it was last refreshed.
+
+We compare the modification counters (n_tup_ins + n_tup_upd + n_tup_del) of every source table, as reported by
+`pg_stat_user_tables`, with the counters recorded in the catalog when the view was last refreshed.  Writes made by
+the current transaction are included via `pg_stat_xact_user_tables`.  Materialised views amongst the source tables
+are tracked by the end of their last refresh, as recorded in the catalog, instead.
+
+Note that the statistics are flushed asynchronously by Postgres (up to a second or so after a commit), and that
+a TRUNCATE on its own doesn't change these counters.
+"""
+from typing import Dict, List, Optional
+
+from .catalog import REFRESH_TABLE
+
+
+def get_source_table_signature(
+    cursor, tables: List[str], refreshed_views: Optional[Dict[str, str]] = None
+) -> Dict[str, int]:
+    """Returns the current modification counter of each table, keyed by table name.
+
+    Args:
+        refreshed_views (Dict[str, str]): the names (as recorded in the catalog) of the refreshed views amongst the
+            tables, keyed by their name with schema.  Their counter is the end of their last refresh, in
+            microseconds since the epoch (0 if they haven't been refreshed).
+    """
+    refreshed_views = refreshed_views or {}
+    cursor.execute(
+        f"""
+        SELECT
+            t.name,
+            CASE WHEN t.view_name IS NULL THEN
+                coalesce(s.n_tup_ins + s.n_tup_upd + s.n_tup_del, 0)
+                + coalesce(x.n_tup_ins + x.n_tup_upd + x.n_tup_del, 0)
+            ELSE
+                coalesce((extract(epoch FROM r.finished_at) * 1000000)::bigint, 0)
+            END
+        FROM unnest(%s::text[], %s::text[]) AS t(name, view_name)
+        LEFT JOIN pg_stat_user_tables s ON s.relid = to_regclass(t.name)
+        LEFT JOIN pg_stat_xact_user_tables x ON x.relid = to_regclass(t.name)
+        LEFT JOIN {REFRESH_TABLE} r ON r.view_name = t.view_name
+        """,
+        params=[list(tables), [refreshed_views.get(table.replace('"', '')) for table in tables]],
+    )
+    return {name: int(counter) for name, counter in cursor.fetchall()}
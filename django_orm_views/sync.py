@@ -1,52 +1,148 @@
 import itertools
+import time
+from collections import defaultdict, deque
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Set
 
 from django.db import connections, transaction
 
-from .exceptions import CyclicDependencyError
-from .constants import SUB_SCHEMA_NAME, LOG
+from .aggregates import get_maintenance_function_name
+from .catalog import (
+    delete_fingerprints,
+    delete_refreshes,
+    delete_source_signatures,
+    delete_watermarks,
+    ensure_catalog,
+    get_fingerprints,
+    get_refresh,
+    get_source_signature,
+    get_watermark,
+    replace_fingerprints,
+    set_fingerprints,
+    set_refresh,
+    set_source_signature,
+    set_synced_refreshes,
+    set_watermark,
+)
+from .incremental import WatermarkRefreshMixin
+from .indexes import IndexBuildMonitor
+from .locks import SYNC_LOCK_NAME, advisory_lock, get_refresh_lock_name
+from .partitioned import PartitionedMaterialisedViewMixin, is_partitioned
+from .exceptions import CyclicDependencyError, MaterialisedViewRefreshError, ViewSyncError
+from .constants import SUB_SCHEMA_NAME, STAGING_SCHEMA_NAME, RETIRED_SCHEMA_NAME, LOG
 from .register import registry, register_all_views
-from .views import PostgresMaterialisedViewMixin
+from .signals import LockWaitSampler, ViewMetrics, get_relation_metrics, view_changed, view_refreshed, view_synced
+from .staleness import get_source_table_signature
+from .views import PostgresMaterialisedViewMixin, _is_refreshed
 
 
-def topological_sort_views(list_of_views):
-    """Implements a topological sort to build the views based on their dependencies.  This
-    is because the SQL needs to be executed in the correct order.
+def topological_levels(list_of_views) -> List[List]:
+    """Groups the views into levels, where each view only depends on views of previous levels.  Views of the
+    same level don't depend on each other, so they can be built (or refreshed) in parallel.
 
-    Returns an ordered list of views
-    Raises CyclicDependencyError if there is a cyclic dependency between the views.
+    This is Kahn's algorithm, so it runs in O(views + dependencies).  Dependencies which aren't amongst the given
+    views are assumed to exist already.  Views are sorted by name within a level.
+
+    Raises CyclicDependencyError (with the shortest cycle, e.g. `a -> b -> a` where a depends on b)
+    if there is a cyclic dependency between the views.
     """
+    views = set(list_of_views)
+    view_dependencies = {view: view.get_dependencies() & views for view in views}
+    remaining_dependencies = {}
+    dependents = defaultdict(list)
+    for view, dependencies in view_dependencies.items():
+        remaining_dependencies[view] = len(dependencies)
+        for dependency in dependencies:
+            dependents[dependency].append(view)
 
-    def _sets_of_views_deps_iterator(views):
-        """Builds an iterator based on the number of dependencies, popping off
-        any which no longer have any dependencies.
-        """
+    levels = []
+    level = [view for view, count in remaining_dependencies.items() if count == 0]
+    while level:
+        levels.append(sorted(level, key=lambda view: view.name))
+        next_level = []
+        for view in level:
+            for dependent in dependents[view]:
+                remaining_dependencies[dependent] -= 1
+                if remaining_dependencies[dependent] == 0:
+                    next_level.append(dependent)
+        level = next_level
+
+    if sum(len(level) for level in levels) != len(views):
+        cycle = _find_shortest_cycle(
+            [view for view, count in remaining_dependencies.items() if count > 0], view_dependencies
+        )
+        raise CyclicDependencyError(
+            f'A Cyclic dependency exists: {" -> ".join(view.name for view in cycle)}', cycle=cycle
+        )
+    return levels
 
-        view_to_deps = {view: set(view.view_dependencies) for view in views}
 
-        while True:
-            ordered = set(item for item, dep in view_to_deps.items() if not dep)
-            if not ordered:
+def _find_shortest_cycle(views: List, view_dependencies: Dict) -> List:
+    """Returns the shortest cycle amongst the given views (each of which is on, or depends on, a cycle), as a path
+    of views starting and ending with the same view.  `view_dependencies` maps each view to its dependencies.
+    """
+    views_set = set(views)
+    shortest_cycle = None
+    for start in sorted(views, key=lambda view: view.name):
+        # Breadth first search for the shortest path from `start` back to itself
+        previous = {}
+        queue = deque([start])
+        while queue:
+            view = queue.popleft()
+            dependencies = sorted(
+                (dependency for dependency in view_dependencies[view] if dependency in views_set),
+                key=lambda dependency: dependency.name,
+            )
+            if start in dependencies:
+                path = [start]
+                while view is not start:
+                    path.append(view)
+                    view = previous[view]
+                cycle = [start] + path[:0:-1] + [start]
+                if shortest_cycle is None or len(cycle) < len(shortest_cycle):
+                    shortest_cycle = cycle
                 break
-            yield ordered
+            for dependency in dependencies:
+                if dependency not in previous and dependency is not start:
+                    previous[dependency] = view
+                    queue.append(dependency)
+    return shortest_cycle or views
 
-            view_to_deps = {
-                item: (dep - ordered)
-                for item, dep in view_to_deps.items()
-                if item not in ordered
-            }
 
-        if view_to_deps:
-            raise CyclicDependencyError(f'A Cyclic dependency exists amongst {view_to_deps}')
+def topological_sort_views(list_of_views):
+    """Implements a topological sort to build the views based on their dependencies.  This
+    is because the SQL needs to be executed in the correct order.
 
+    Returns an ordered list of views
+    Raises CyclicDependencyError if there is a cyclic dependency between the views.
+    """
     # Flatten the list of sets
-    return list(itertools.chain.from_iterable(_sets_of_views_deps_iterator(list_of_views)))
+    return list(itertools.chain.from_iterable(topological_levels(list_of_views)))
+
+
+@dataclass
+class DatabaseSyncResult:
+    database: str
+    views_synced: int
+    duration: float
+    error: Optional[BaseException] = None
+    skipped: bool = False
 
 
 def sync_views(
-        grant_select_permissions_to_user: Optional[str] = None
-):
+        grant_select_permissions_to_user: Optional[str] = None,
+        incremental: bool = False,
+        blue_green: bool = False,
+        batched: bool = False,
+        parallel_databases: bool = False,
+        concurrent_indexes: bool = False,
+        defer_population: bool = False,
+        skip_if_locked: bool = False,
+        lock_timeout: Optional[float] = None,
+) -> Dict[str, DatabaseSyncResult]:
     """This function syncs all the views in the registry.
 
     This effectively destroys + recreates all views within a transaction. Views live under a separate schema
@@ -54,45 +150,828 @@ def sync_views(
 
     Implements topological sorting in order to analyse interdependencies and execute the SQL in the correct order.
 
+    If `incremental` is True, the schema is left in place and only the views whose fingerprint differs from
+    the one stored in the catalog are rebuilt, along with the views depending on them.  Views that are
+    no longer registered are dropped.
+
+    If `blue_green` is True, all views (including materialised views) are built under STAGING_SCHEMA_NAME first,
+    and the schemas are then swapped in a short final transaction, so readers of the existing views are never
+    blocked by the rebuild.
+
+    If `batched` is True, the DDL of all views of the same topological level is sent to the database as a single
+    statement, which saves a round trip per view.
+
+    If `concurrent_indexes` is True, the `indexes` of materialised views are built with CREATE INDEX CONCURRENTLY
+    once the views have been committed, rather than within the sync's transaction.  This can't be used from within
+    a transaction.
+
+    If `defer_population` is True, materialised views are created WITH NO DATA so the sync commits without running
+    their queries.  They're unreadable until `populate_materialized_views` has been run.  This can't be combined
+    with `blue_green`, as the swapped in views wouldn't be readable.
+
+    If `parallel_databases` is True, each database is sync'd from its own thread (and connection).  A failure
+    doesn't stop the other databases from being sync'd: ViewSyncError is raised once they've all finished.
+
+    Each database is sync'd whilst holding an advisory lock (see `django_orm_views.locks`), so concurrent syncs of the
+    same database run one after the other.  The sync waits for the lock, for at most `lock_timeout` seconds if given,
+    after which AdvisoryLockTimeout is raised.  If `skip_if_locked` is True, a database whose lock is held by another
+    sync is skipped instead (its result is marked as `skipped`): straight away, or after waiting for `lock_timeout`
+    seconds if given.
+
     Note, it assumes that the registry has been built (i.e. depending on the AppConfig of this app calling ready).
+
+    Returns the result of the sync of each database, keyed by database.
     """
+    if incremental and blue_green:
+        raise ValueError("Views can't be sync'd both incrementally and blue/green")
+    if defer_population and blue_green:
+        raise ValueError("The population of materialised views can't be deferred in a blue/green sync")
+
     logger = LOG.getChild('sync')
 
+    register_all_views()
+
+    # The databases are only known once the views are registered
+    if concurrent_indexes and any(connections[database].in_atomic_block for database in registry):
+        raise ValueError("Indexes can't be built concurrently from within a transaction")
+
     logger.info('Syncing view registry for databases %s', list(registry.keys()))
 
-    register_all_views()
+    if incremental:
+        sync_database = _sync_database_incrementally
+    elif blue_green:
+        sync_database = _sync_database_blue_green
+    else:
+        sync_database = _sync_database
 
-    for database, views in registry.items():
-        views_to_generate = topological_sort_views(views)
-        with connections[database].cursor() as cursor:
-            with transaction.atomic():
-                # Drop the view schema and recreate it
-                cursor.execute(f'DROP SCHEMA IF EXISTS {SUB_SCHEMA_NAME} CASCADE; CREATE SCHEMA {SUB_SCHEMA_NAME};')
-
-                # Execute each SQL statement from the views
-                for view in views_to_generate:
-                    LOG.info("generating view %s", view.name)
-                    cursor.execute(view.creation_sql.sql, params=view.creation_sql.params)
-
-                # Re-grant permissions.
-                if grant_select_permissions_to_user is not None:
-                    cursor.execute(
-                        f'GRANT USAGE ON SCHEMA {SUB_SCHEMA_NAME} TO {grant_select_permissions_to_user};'
-                    )
-                for view in views_to_generate:
-                    if view.hidden or grant_select_permissions_to_user is None:
-                        continue
-                    cursor.execute(
-                        f'GRANT SELECT ON {SUB_SCHEMA_NAME}.{view.name} TO {grant_select_permissions_to_user};'
-                    )
-        LOG.info('Successfully sync\'d %s views for %s database', len(views_to_generate), database)
+    if not parallel_databases:
+        results = {}
+        for database, views in registry.items():
+            results[database] = _sync_locked_database(
+                sync_database,
+                skip_if_locked,
+                lock_timeout,
+                database,
+                views,
+                grant_select_permissions_to_user,
+                batched,
+                concurrent_indexes,
+                defer_population,
+            )
+    else:
+        with ThreadPoolExecutor(max_workers=len(registry) or 1) as executor:
+            futures = {
+                database: executor.submit(
+                    _sync_database_in_thread,
+                    sync_database,
+                    skip_if_locked,
+                    lock_timeout,
+                    database,
+                    views,
+                    grant_select_permissions_to_user,
+                    batched,
+                    concurrent_indexes,
+                    defer_population,
+                )
+                for database, views in registry.items()
+            }
+        results = {database: future.result() for database, future in futures.items()}
+        for result in results.values():
+            if result.error is not None:
+                logger.error('Failed to sync views for %s database', result.database, exc_info=result.error)
+        if any(result.error is not None for result in results.values()):
+            raise ViewSyncError(results)
 
     LOG.info('Successfully sync\'d %s views', len(registry))
+    return results
 
 
-def refresh_materialized_view(
-    view: PostgresMaterialisedViewMixin, concurrently: bool = False
+def _sync_locked_database(
+    sync_database, skip_if_locked: bool, lock_timeout: Optional[float], database: str, views, *args
+) -> DatabaseSyncResult:
+    """Syncs a database whilst holding its sync lock, or skips it if the lock is busy and `skip_if_locked`."""
+    start = time.monotonic()
+    with connections[database].cursor() as cursor:
+        with advisory_lock(cursor, SYNC_LOCK_NAME, skip_if_locked, lock_timeout) as acquired:
+            if not acquired:
+                LOG.getChild('sync').info('Skipping %s database as it is being sync\'d by another process', database)
+                return DatabaseSyncResult(database, 0, time.monotonic() - start, skipped=True)
+            views_synced = sync_database(database, views, *args)
+    return DatabaseSyncResult(database, views_synced, time.monotonic() - start)
+
+
+def _sync_database_in_thread(
+    sync_database, skip_if_locked: bool, lock_timeout: Optional[float], database: str, views, *args
+) -> DatabaseSyncResult:
+    """Syncs a database from a worker thread, capturing any error and closing the thread's connection afterwards."""
+    start = time.monotonic()
+    try:
+        return _sync_locked_database(sync_database, skip_if_locked, lock_timeout, database, views, *args)
+    except Exception as error:
+        return DatabaseSyncResult(database, 0, time.monotonic() - start, error)
+    finally:
+        connections[database].close()
+
+
+def _sync_database(
+    database: str,
+    views,
+    grant_select_permissions_to_user: Optional[str],
+    batched: bool,
+    concurrent_indexes: bool,
+    defer_population: bool,
+):
+    """Drops the view schema of the given database and recreates all of its views."""
+    levels = topological_levels(views)
+    views_to_generate = list(itertools.chain.from_iterable(levels))
+    with connections[database].cursor() as cursor:
+        with transaction.atomic(using=database):
+            # Drop the view schema and recreate it
+            cursor.execute(f'DROP SCHEMA IF EXISTS {SUB_SCHEMA_NAME} CASCADE; CREATE SCHEMA {SUB_SCHEMA_NAME};')
+
+            # Execute each SQL statement from the views
+            metrics = _create_views(
+                cursor, levels, batched, include_indexes=not concurrent_indexes, with_data=not defer_population
+            )
+
+            _grant_select_permissions(cursor, views_to_generate, grant_select_permissions_to_user)
+
+            ensure_catalog(cursor)
+            replace_fingerprints(cursor, {view.name: view.fingerprint for view in views_to_generate})
+            delete_source_signatures(cursor)
+            delete_watermarks(cursor)
+            delete_refreshes(cursor)
+            if not defer_population:
+                set_synced_refreshes(cursor, [view.name for view in views_to_generate if _is_refreshed(view)])
+    _send_view_synced(metrics, views_to_generate)
+    if concurrent_indexes:
+        _create_indexes_concurrently(database, views_to_generate)
+    LOG.info('Successfully sync\'d %s views for %s database', len(views_to_generate), database)
+    return len(views_to_generate)
+
+
+def _sync_database_incrementally(
+    database: str,
+    views,
+    grant_select_permissions_to_user: Optional[str],
+    batched: bool,
+    concurrent_indexes: bool,
+    defer_population: bool,
+):
+    """Rebuilds only the views of the given database whose definition changed since the last sync,
+    plus the views depending on them.
+    """
+    levels = topological_levels(views)
+    views_in_order = list(itertools.chain.from_iterable(levels))
+    fingerprints = {view.name: view.fingerprint for view in views_in_order}
+
+    with connections[database].cursor() as cursor:
+        with transaction.atomic(using=database):
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS {SUB_SCHEMA_NAME};')
+            ensure_catalog(cursor)
+            stored_fingerprints = get_fingerprints(cursor)
+            existing_relations = _get_existing_relations(cursor)
+
+            changed_views = {
+                view for view in views_in_order
+                if view.name not in existing_relations or stored_fingerprints.get(view.name) != fingerprints[view.name]
+            }
+            views_to_rebuild = _with_dependents(changed_views, views_in_order)
+            views_to_rebuild_in_order = [view for view in views_in_order if view in views_to_rebuild]
+            removed_view_names = [name for name in stored_fingerprints if name not in fingerprints]
+
+            # Dependents have to be dropped before the views they depend on.  We intentionally don't CASCADE,
+            # so that a dependency which was neither declared nor inferred (see `get_dependencies`) fails loudly
+            # instead of silently dropping a view.  The removed views go first, as they may still read from the
+            # views being rebuilt, and amongst themselves in the order of their dependencies in the database.
+            removed_relation_names = [name for name in removed_view_names if name in existing_relations]
+            for level in _get_drop_levels(cursor, removed_relation_names):
+                relations_by_relkind = defaultdict(list)
+                for view_name in level:
+                    LOG.info("dropping view %s", view_name)
+                    relations_by_relkind[existing_relations[view_name]].append(view_name)
+                for relkind, view_names in relations_by_relkind.items():
+                    cursor.execute(_drop_relation_sql(view_names, relkind))
+            for view in reversed(views_to_rebuild_in_order):
+                if view.name in existing_relations:
+                    cursor.execute(_drop_relation_sql([view.name], existing_relations[view.name]))
+
+            metrics = _create_views(
+                cursor,
+                [[view for view in level if view in views_to_rebuild] for level in levels],
+                batched,
+                include_indexes=not concurrent_indexes,
+                with_data=not defer_population,
+            )
+
+            _grant_select_permissions(cursor, views_in_order, grant_select_permissions_to_user)
+
+            set_fingerprints(cursor, {view.name: fingerprints[view.name] for view in views_to_rebuild_in_order})
+            rebuilt_view_names = [view.name for view in views_to_rebuild_in_order]
+            delete_source_signatures(cursor, rebuilt_view_names + removed_view_names)
+            delete_watermarks(cursor, rebuilt_view_names + removed_view_names)
+            delete_refreshes(cursor, rebuilt_view_names + removed_view_names)
+            if not defer_population:
+                set_synced_refreshes(
+                    cursor, [view.name for view in views_to_rebuild_in_order if _is_refreshed(view)]
+                )
+            if removed_view_names:
+                delete_fingerprints(cursor, removed_view_names)
+    _send_view_synced(metrics, views_to_rebuild_in_order)
+    if concurrent_indexes:
+        _create_indexes_concurrently(database, views_to_rebuild_in_order)
+    LOG.info(
+        'Successfully sync\'d %s views for %s database (%s unchanged, %s dropped)',
+        len(views_to_rebuild_in_order),
+        database,
+        len(views_in_order) - len(views_to_rebuild_in_order),
+        len(removed_view_names),
+    )
+    return len(views_to_rebuild_in_order)
+
+
+def _sync_database_blue_green(
+    database: str,
+    views,
+    grant_select_permissions_to_user: Optional[str],
+    batched: bool,
+    concurrent_indexes: bool,
+    defer_population: bool,
+):
+    """Builds all views of the given database under the staging schema, then swaps it with the view schema."""
+    levels = topological_levels(views)
+    views_to_generate = list(itertools.chain.from_iterable(levels))
+    with connections[database].cursor() as cursor:
+        with transaction.atomic(using=database):
+            cursor.execute(
+                f'DROP SCHEMA IF EXISTS {STAGING_SCHEMA_NAME} CASCADE; CREATE SCHEMA {STAGING_SCHEMA_NAME};'
+            )
+            # The views are only swapped in later, but their rows are as of this transaction
+            cursor.execute('SELECT now();')
+            started_at = cursor.fetchone()[0]
+            metrics = _create_views(
+                cursor, levels, batched, schema=STAGING_SCHEMA_NAME, include_indexes=not concurrent_indexes
+            )
+
+            _grant_select_permissions(
+                cursor, views_to_generate, grant_select_permissions_to_user, schema=STAGING_SCHEMA_NAME
+            )
+
+        # Only the renames happen in the final transaction, which keeps the time readers have to wait to a minimum
+        with transaction.atomic(using=database):
+            cursor.execute(f'DROP SCHEMA IF EXISTS {RETIRED_SCHEMA_NAME} CASCADE;')
+            cursor.execute('SELECT EXISTS (SELECT 1 FROM pg_namespace WHERE nspname = %s);', params=[SUB_SCHEMA_NAME])
+            if cursor.fetchone()[0]:
+                cursor.execute(f'ALTER SCHEMA {SUB_SCHEMA_NAME} RENAME TO {RETIRED_SCHEMA_NAME};')
+            cursor.execute(f'ALTER SCHEMA {STAGING_SCHEMA_NAME} RENAME TO {SUB_SCHEMA_NAME};')
+
+            ensure_catalog(cursor)
+            replace_fingerprints(cursor, {view.name: view.fingerprint for view in views_to_generate})
+            delete_source_signatures(cursor)
+            delete_watermarks(cursor)
+            delete_refreshes(cursor)
+            set_synced_refreshes(cursor, [view.name for view in views_to_generate if _is_refreshed(view)], started_at)
+
+        # Queries which were already reading the retired views hold this back, but new readers aren't affected.
+        with transaction.atomic(using=database):
+            cursor.execute(f'DROP SCHEMA IF EXISTS {RETIRED_SCHEMA_NAME} CASCADE;')
+    _send_view_synced(metrics, views_to_generate)
+    if concurrent_indexes:
+        _create_indexes_concurrently(database, views_to_generate)
+    LOG.info('Successfully sync\'d %s views for %s database (blue/green)', len(views_to_generate), database)
+    return len(views_to_generate)
+
+
+def _create_views(
+    cursor,
+    levels: List[List],
+    batched: bool,
+    schema: str = SUB_SCHEMA_NAME,
+    include_indexes: bool = True,
+    with_data: bool = True,
+):
+    """Executes the creation SQL of the views, level by level.  If `batched` is True, the statements of each level
+    are sent in a single round trip.
+
+    Returns the metrics of the views which `view_synced` has receivers for, to be sent once committed.
+    """
+    metrics = []
+    for views in levels:
+        if not views:
+            continue
+        if not batched:
+            for view in views:
+                LOG.info("generating view %s", view.name)
+                if view.inline_hidden_views:
+                    LOG.info(
+                        "inlined views %s into %s", [inlined.name for inlined in view.inlined_views], view.name
+                    )
+                creation_sql = view.get_creation_sql(
+                    schema=schema, include_indexes=include_indexes, with_data=with_data
+                )
+                start = time.monotonic()
+                cursor.execute(creation_sql.sql, params=creation_sql.params)
+                if view_synced.has_listeners(view):
+                    metrics.append(_get_sync_metrics(cursor, view, schema, time.monotonic() - start))
+            continue
+
+        LOG.info("generating views %s", [view.name for view in views])
+        creation_sqls = [
+            view.get_creation_sql(schema=schema, include_indexes=include_indexes, with_data=with_data)
+            for view in views
+        ]
+        start = time.monotonic()
+        cursor.execute(
+            ''.join(creation_sql.sql for creation_sql in creation_sqls),
+            params=list(itertools.chain.from_iterable(creation_sql.params for creation_sql in creation_sqls)),
+        )
+        duration = time.monotonic() - start
+        metrics.extend(
+            _get_sync_metrics(cursor, view, schema, duration) for view in views if view_synced.has_listeners(view)
+        )
+    return metrics
+
+
+def _get_sync_metrics(cursor, view, schema: str, duration: float):
+    relation_size, rows = get_relation_metrics(cursor, f'{schema}.{view.name}')
+    return view, ViewMetrics(cursor.db.alias, duration, relation_size, rows)
+
+
+def _send_view_synced(metrics, views):
+    for view, view_metrics in metrics:
+        view_synced.send(sender=view, metrics=view_metrics)
+    for view in views:
+        view_changed.send(sender=view)
+
+
+def _create_indexes_concurrently(database: str, views):
+    """Builds the `indexes` of the given materialised views with CREATE INDEX CONCURRENTLY, outside of any
+    transaction, logging the progress of the builds.
+    """
+    # The indexes of partitioned views are always created with the view
+    views_with_indexes = [
+        view for view in views
+        if issubclass(view, PostgresMaterialisedViewMixin)
+        and not is_partitioned(view)
+        and view.indexes
+    ]
+    if not views_with_indexes:
+        return
+
+    with connections[database].cursor() as cursor:
+        cursor.execute('SELECT pg_backend_pid();')
+        with IndexBuildMonitor(database, cursor.fetchone()[0]):
+            for view in views_with_indexes:
+                for index, index_sql in zip(view.indexes, view.get_index_sql(concurrently=True)):
+                    index_name = index.get_name(view.name)
+                    LOG.info("building index %s concurrently", index_name)
+                    try:
+                        cursor.execute(index_sql)
+                    except Exception:
+                        # A failed concurrent build leaves an invalid index behind, which IF NOT EXISTS would keep
+                        cursor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {SUB_SCHEMA_NAME}.{index_name};')
+                        raise
+
+
+def _grant_select_permissions(
+    cursor, views, grant_select_permissions_to_user: Optional[str], schema: str = SUB_SCHEMA_NAME
 ):
-    """Refresh the given materialized view."""
+    """Re-grants usage of the view schema and select on every non-hidden view, in a single round trip."""
+    if grant_select_permissions_to_user is None:
+        return
+    sql = f'GRANT USAGE ON SCHEMA {schema} TO {grant_select_permissions_to_user};'
+    views_to_grant = [f'{schema}.{view.name}' for view in views if not view.hidden]
+    if views_to_grant:
+        sql += f'GRANT SELECT ON {", ".join(views_to_grant)} TO {grant_select_permissions_to_user};'
+    cursor.execute(sql)
+
+
+def _get_existing_relations(cursor) -> Dict[str, str]:
+    """Returns the relations currently living under the view schema, mapped to their pg_class relkind."""
+    cursor.execute(
+        """
+        SELECT c.relname, c.relkind
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind IN ('v', 'm', 'r', 'p')
+        """,
+        params=[SUB_SCHEMA_NAME],
+    )
+    return dict(cursor.fetchall())
+
+
+def _get_unpopulated_views(cursor, views: List) -> List:
+    """Returns the materialised views amongst `views` that were created WITH NO DATA and haven't been refreshed.
+
+    Partitioned views are created empty instead, and are unpopulated until a refresh of theirs is recorded.
+    """
+    cursor.execute(
+        """
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relkind = 'm' AND NOT c.relispopulated
+        """,
+        params=[SUB_SCHEMA_NAME],
+    )
+    unpopulated_names = {name for name, in cursor.fetchall()}
+    partitioned_views = [view for view in views if is_partitioned(view)]
+    if partitioned_views:
+        ensure_catalog(cursor)
+        unpopulated_names.update(view.name for view in partitioned_views if get_refresh(cursor, view.name) is None)
+    return [view for view in views if view.name in unpopulated_names]
+
+
+def _get_drop_levels(cursor, names: List[str]) -> List[List[str]]:
+    """Groups the given relations of the view schema into levels which can be dropped one after the other: the
+    relations of a level don't read from each other, nor from those of the following levels.
+
+    The dependencies are read from the rewrite rules of the views in the database, as the relations may not be
+    registered anymore.
+    """
+    cursor.execute(
+        """
+        SELECT DISTINCT dependent.relname, source.relname
+        FROM pg_depend d
+        JOIN pg_rewrite r ON r.oid = d.objid
+        JOIN pg_class dependent ON dependent.oid = r.ev_class
+        JOIN pg_class source ON source.oid = d.refobjid
+        JOIN pg_namespace n ON n.oid = source.relnamespace AND n.oid = dependent.relnamespace
+        WHERE d.classid = 'pg_rewrite'::regclass
+            AND d.refclassid = 'pg_class'::regclass
+            AND dependent.oid <> source.oid
+            AND n.nspname = %s
+            AND dependent.relname = ANY(%s)
+            AND source.relname = ANY(%s)
+        """,
+        params=[SUB_SCHEMA_NAME, list(names), list(names)],
+    )
+    remaining_dependents = defaultdict(int)
+    dependencies = defaultdict(list)
+    for dependent, source in cursor.fetchall():
+        remaining_dependents[source] += 1
+        dependencies[dependent].append(source)
+
+    levels = []
+    level = sorted(name for name in names if not remaining_dependents[name])
+    while level:
+        levels.append(level)
+        next_level = []
+        for name in level:
+            for source in dependencies[name]:
+                remaining_dependents[source] -= 1
+                if not remaining_dependents[source]:
+                    next_level.append(source)
+        level = sorted(next_level)
+    return levels
+
+
+def _drop_relation_sql(names: List[str], relkind: str) -> str:
+    relation_type = {'v': 'VIEW', 'm': 'MATERIALIZED VIEW'}.get(relkind, 'TABLE')
+    relations = ', '.join(f'{SUB_SCHEMA_NAME}.{name}' for name in names)
+    sql = f'DROP {relation_type} IF EXISTS {relations};'
+    if relkind == 'r':
+        # Tables may be IncrementalAggregateViews, whose triggers on the source table go with their function
+        functions = ', '.join(f'{SUB_SCHEMA_NAME}.{get_maintenance_function_name(name)}()' for name in names)
+        sql = f'DROP FUNCTION IF EXISTS {functions} CASCADE;{sql}'
+    return sql
+
+
+def _with_dependents(views: Set, all_views: List) -> Set:
+    """Returns the given views along with every view (transitively) depending on them."""
+    dependents = defaultdict(set)
+    for view in all_views:
+        for dependency in view.get_dependencies():
+            dependents[dependency].add(view)
+
+    result = set()
+    to_visit = list(views)
+    while to_visit:
+        view = to_visit.pop()
+        if view in result:
+            continue
+        result.add(view)
+        to_visit.extend(dependents[view])
+    return result
+
+
+def refresh_materialized_view(
+    view: PostgresMaterialisedViewMixin,
+    concurrently: bool = False,
+    only_if_stale: bool = False,
+    skip_if_locked: bool = False,
+    lock_timeout: Optional[float] = None,
+    count_rows: bool = False,
+) -> bool:
+    """Refresh the given materialized view.
+
+    If `only_if_stale` is True, the refresh is skipped when none of the view's source tables have been written to,
+    and none of the materialised views it reads from have been refreshed, since its last refresh (see
+    `BasePostgresView.get_source_tables`).
+
+    The view is refreshed whilst holding its advisory lock, so that other processes don't refresh it at the same
+    time.  It waits for the lock, for at most `lock_timeout` seconds if given, after which AdvisoryLockTimeout is
+    raised.  If `skip_if_locked` is True, the refresh is skipped if another process holds the lock instead: straight
+    away, or after waiting for `lock_timeout` seconds if given.
+
+    The refresh is recorded in the catalog (see `BasePostgresView.get_last_refresh`), along with the number of rows
+    of the view if `count_rows` is True (counting them scans the whole view) or `view_refreshed` has listeners.
+
+    Returns whether the view was refreshed.
+    """
+    # The other views are needed to follow the view's source tables
+    register_all_views()
+
+    with connections[view.database].cursor() as cursor:
+        with advisory_lock(cursor, get_refresh_lock_name(view), skip_if_locked, lock_timeout) as acquired:
+            if not acquired:
+                LOG.getChild('refresh').info('Skipping refresh of %s as it is being refreshed elsewhere', view.name)
+                return False
+
+            ensure_catalog(cursor)
+            source_tables = view.get_source_tables()
+            signature = None
+            if source_tables is not None:
+                refreshed_views = {
+                    other_view.name_with_schema: other_view.name
+                    for other_view in registry[view.database] if _is_refreshed(other_view)
+                }
+                signature = get_source_table_signature(cursor, source_tables, refreshed_views)
+                if only_if_stale and get_source_signature(cursor, view.name) == signature:
+                    LOG.getChild('refresh').info(
+                        'Skipping refresh of %s as its source tables are unchanged', view.name
+                    )
+                    return False
+
+            instrumented = view_refreshed.has_listeners(view)
+            lock_wait_sampler = nullcontext()
+            if instrumented:
+                cursor.execute('SELECT pg_backend_pid();')
+                lock_wait_sampler = LockWaitSampler(view.database, backend_pid=cursor.fetchone()[0])
+
+            start = time.monotonic()
+            with lock_wait_sampler:
+                if is_partitioned(view):
+                    _refresh_partitions(cursor, view)
+                else:
+                    cursor.execute(view.get_refresh_sql(concurrently))
+            duration = time.monotonic() - start
+
+            if signature is not None:
+                set_source_signature(cursor, view.name, signature)
+
+            if instrumented:
+                relation_size, rows = get_relation_metrics(cursor, view.name_with_schema)
+                metrics = ViewMetrics(
+                    view.database, duration, relation_size, rows, lock_wait_sampler.lock_wait, concurrently
+                )
+            elif count_rows:
+                cursor.execute(f'SELECT count(*) FROM {view.name_with_schema};')
+                rows = cursor.fetchone()[0]
+            else:
+                rows = None
+            set_refresh(cursor, view.name, duration, rows)
+
+    LOG.getChild('refresh').info('Refreshed %s in %.2fs', view.name, duration)
+    if instrumented:
+        view_refreshed.send(sender=view, metrics=metrics)
+    view_changed.send(sender=view)
+    return True
+
+
+def _refresh_partitions(cursor, view: PartitionedMaterialisedViewMixin):
+    """Recomputes the recent partitions of the view in a transaction, see `PartitionedMaterialisedViewMixin`."""
+    with transaction.atomic(using=view.database):
+        last_refresh = get_refresh(cursor, view.name)
+        # The periods are those of the connection's time zone, like the bounds of the partitions
+        cursor.execute(
+            'SELECT current_date, %s::timestamptz::date;', params=[last_refresh.started_at if last_refresh else None]
+        )
+        today, last_refreshed_on = cursor.fetchone()
+        since = view.get_refresh_start(today, last_refreshed_on)
+        LOG.getChild('refresh').info(
+            'Recomputing the partitions of %s from %s', view.name, since if since is not None else 'the start'
+        )
+        refresh_sql = view.get_partition_refresh_sql(since)
+        cursor.execute(refresh_sql.sql, params=refresh_sql.params)
+
+
+def refresh_incremental(
+    view: WatermarkRefreshMixin, skip_if_locked: bool = False, lock_timeout: Optional[float] = None
+) -> int:
+    """Insert the rows of the given view beyond the watermark reached by its last refresh.
+
+    See `WatermarkRefreshMixin`.  The view is locked against other refreshes (but not readers) meanwhile, and the
+    refresh holds the view's advisory lock like `refresh_materialized_view` (see `skip_if_locked` and
+    `lock_timeout` there).
+
+    Returns the number of rows inserted (or updated, for views with a pk_field), 0 if the refresh was skipped.
+    """
     with connections[view.database].cursor() as cursor:
-        cursor.execute(view.get_refresh_sql(concurrently))
+        # Timing the locks tells how long was spent waiting for other refreshes
+        start = time.monotonic()
+        with advisory_lock(cursor, get_refresh_lock_name(view), skip_if_locked, lock_timeout) as acquired:
+            if not acquired:
+                LOG.getChild('refresh').info('Skipping refresh of %s as it is being refreshed elsewhere', view.name)
+                return 0
+            with transaction.atomic(using=view.database):
+                cursor.execute(f'LOCK TABLE {view.name_with_schema} IN EXCLUSIVE MODE;')
+                lock_wait = time.monotonic() - start
+                ensure_catalog(cursor)
+                watermark = get_watermark(cursor, view.name)
+                if watermark is None:
+                    # The view was (re)built by a sync since the last refresh, so it holds the rows up to its maximum
+                    cursor.execute(f'SELECT max({view.watermark_field})::text FROM {view.name_with_schema};')
+                    watermark = cursor.fetchone()[0]
+
+                cursor.execute(
+                    'SELECT column_name FROM information_schema.columns '
+                    'WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position;',
+                    params=[SUB_SCHEMA_NAME, view.name],
+                )
+                refresh_sql = view.get_incremental_refresh_sql(watermark, [column for column, in cursor.fetchall()])
+                cursor.execute(refresh_sql.sql, params=refresh_sql.params)
+                new_watermark, rows = cursor.fetchone()
+                if new_watermark is not None:
+                    watermark = new_watermark
+                if watermark is not None:
+                    set_watermark(cursor, view.name, watermark)
+                duration = time.monotonic() - start
+                set_refresh(cursor, view.name, duration)
+
+                metrics = None
+                if view_refreshed.has_listeners(view):
+                    relation_size, _ = get_relation_metrics(cursor, view.name_with_schema)
+                    metrics = ViewMetrics(view.database, duration, relation_size, rows, lock_wait)
+
+    LOG.getChild('refresh').info(
+        'Inserted %s rows into %s up to watermark %s in %.2fs', rows, view.name, watermark, duration
+    )
+    if metrics is not None:
+        view_refreshed.send(sender=view, metrics=metrics)
+    view_changed.send(sender=view)
+    return rows
+
+
+def refresh_materialized_views(
+    views: Optional[Iterable[PostgresMaterialisedViewMixin]] = None,
+    concurrently: bool = False,
+    max_workers: int = 4,
+    only_if_stale: bool = False,
+    skip_if_locked: bool = False,
+    lock_timeout: Optional[float] = None,
+) -> List[PostgresMaterialisedViewMixin]:
+    """Refresh several materialized views, in parallel where the dependency graph allows it.
+
+    Each view is refreshed on its own connection from a pool of `max_workers` threads and is only started once
+    every materialized view it (transitively) depends on has finished refreshing.  If a view fails, the views
+    depending on it are skipped and MaterialisedViewRefreshError is raised once everything else has finished.
+
+    Args:
+        views: the materialized views to refresh.  Defaults to every registered materialized view.
+        concurrently (bool): if True the views will be refreshed concurrently (requires a pk_field)
+        max_workers (int): the maximum number of views refreshed at the same time
+        only_if_stale (bool): if True, views whose source tables are unchanged since their last refresh are skipped
+        skip_if_locked (bool): if True, views being refreshed by another process are skipped (after waiting for
+            them for `lock_timeout` seconds if given)
+        lock_timeout (float): the number of seconds to wait for views being refreshed by another process, see
+            `refresh_materialized_view`
+
+    Returns the views which were refreshed (i.e. not skipped as unchanged or locked), in the order they finished.
+    """
+    logger = LOG.getChild('refresh')
+
+    register_all_views()
+    all_views = set(itertools.chain.from_iterable(registry.values()))
+    if views is None:
+        views = [view for view in all_views if issubclass(view, PostgresMaterialisedViewMixin)]
+    views_to_refresh = set(views)
+
+    if concurrently:
+        # Partitioned views never block readers, so they aren't refreshed concurrently
+        views_without_pk = sorted(
+            view.name for view in views_to_refresh
+            if not view.pk_field and not is_partitioned(view)
+        )
+        if views_without_pk:
+            raise ValueError(f"Can't refresh concurrently without a pk_field: {views_without_pk}")
+
+    view_dependencies = {view: _materialised_dependencies(view, views_to_refresh) for view in views_to_refresh}
+    upstream = {view: set(dependencies) for view, dependencies in view_dependencies.items()}
+    downstream = defaultdict(set)
+    for view, dependencies in upstream.items():
+        for dependency in dependencies:
+            downstream[dependency].add(view)
+
+    refreshed, failed, skipped = [], {}, set()
+    logger.info('Refreshing %s materialized views with %s workers', len(views_to_refresh), max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+
+        def _submit_ready_views():
+            for view in [view for view, dependencies in upstream.items() if not dependencies]:
+                del upstream[view]
+                future = executor.submit(
+                    _refresh_materialized_view_in_thread,
+                    view,
+                    concurrently,
+                    only_if_stale,
+                    skip_if_locked=skip_if_locked,
+                    lock_timeout=lock_timeout,
+                )
+                running[future] = view
+
+        _submit_ready_views()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                view = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    if future.result():
+                        refreshed.append(view)
+                        logger.info('Refreshed %s (%s/%s)', view.name, len(refreshed), len(views_to_refresh))
+                    for dependent in downstream[view]:
+                        if dependent in upstream:
+                            upstream[dependent].discard(view)
+                else:
+                    logger.error('Failed to refresh %s', view.name, exc_info=error)
+                    failed[view] = error
+                    to_skip = list(downstream[view])
+                    while to_skip:
+                        dependent = to_skip.pop()
+                        if upstream.pop(dependent, None) is not None:
+                            logger.warning('Skipping %s as %s failed to refresh', dependent.name, view.name)
+                            skipped.add(dependent)
+                            to_skip.extend(downstream[dependent])
+            _submit_ready_views()
+
+    if upstream:
+        cycle = _find_shortest_cycle(list(upstream), view_dependencies)
+        raise CyclicDependencyError(
+            f'A Cyclic dependency exists: {" -> ".join(view.name for view in cycle)}', cycle=cycle
+        )
+    if failed:
+        raise MaterialisedViewRefreshError(failed, skipped)
+    return refreshed
+
+
+def populate_materialized_views(max_workers: int = 4) -> List[PostgresMaterialisedViewMixin]:
+    """Populate the materialized views left unpopulated by `sync_views(defer_population=True)`.
+
+    The views are refreshed in dependency order, `max_workers` at a time (see `refresh_materialized_views`), with
+    the progress being logged.  Only views which are still unpopulated are refreshed, so this can be re-run to
+    resume after a failure.
+
+    Returns the views which were populated.
+    """
+    register_all_views()
+    views_to_populate = []
+    for database, views in registry.items():
+        materialised_views = [view for view in views if issubclass(view, PostgresMaterialisedViewMixin)]
+        if not materialised_views:
+            continue
+        with connections[database].cursor() as cursor:
+            views_to_populate.extend(_get_unpopulated_views(cursor, materialised_views))
+
+    LOG.getChild('populate').info('Populating %s materialized views', len(views_to_populate))
+    return refresh_materialized_views(views_to_populate, max_workers=max_workers)
+
+
+def _refresh_materialized_view_in_thread(
+    view: PostgresMaterialisedViewMixin,
+    concurrently: bool,
+    only_if_stale: bool,
+    skip_if_locked: bool = False,
+    lock_timeout: Optional[float] = None,
+) -> bool:
+    """Refreshes a view from a worker thread, closing the thread's connection afterwards."""
+    try:
+        return refresh_materialized_view(
+            view,
+            concurrently=concurrently,
+            only_if_stale=only_if_stale,
+            skip_if_locked=skip_if_locked,
+            lock_timeout=lock_timeout,
+        )
+    finally:
+        connections[view.database].close()
+
+
+def _materialised_dependencies(view, materialised_views: Set) -> Set:
+    """Returns the closest views amongst `materialised_views` that the given view depends on, looking through
+    any (non-materialized) views in between.
+    """
+    result = set()
+    to_visit = list(view.get_dependencies())
+    visited = set()
+    while to_visit:
+        dependency = to_visit.pop()
+        if dependency in visited:
+            continue
+        visited.add(dependency)
+        if dependency in materialised_views:
+            result.add(dependency)
+        else:
+            to_visit.extend(dependency.get_dependencies())
+    return result
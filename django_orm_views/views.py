@@ -1,6 +1,14 @@
+import datetime
+import hashlib
 import re
-from typing import Optional
-from django.db.models import QuerySet
+from typing import Dict, List, Optional, Pattern, Set, Tuple
+from django.db import connections
+from django.db.models import Manager, QuerySet
+from django.db.models.expressions import RawSQL
+from django.db.models.sql import Query
+from django.db.models.sql.datastructures import BaseTable
+from django.db.models.sql.where import ExtraWhere
+from django.utils import timezone
 
 try:
     # Django 3.1 and above
@@ -8,16 +16,78 @@ try:
 except ImportError:
     from django.utils.decorators import classproperty
 
-from .constants import SUB_SCHEMA_NAME, ParameterisedSQL
-from .register import AutoRegisterMixin
-from .exceptions import InvalidViewDepencies
+from .catalog import ViewRefresh, get_refresh
+from .constants import LOG, SUB_SCHEMA_NAME, ParameterisedSQL
+from .incremental import WatermarkRefreshMixin
+from .references import compile_view_reference_pattern, find_view_references, replace_view_references
+from .register import AutoRegisterMixin, registry
+from .exceptions import CyclicDependencyError, InvalidViewDepencies
+from .indexes import ViewIndex
 from .not_managed_model import NotManagedModel
+from .policies import RefreshPolicy
+
+
+# Compiling a queryset is relatively expensive and the SQL doesn't change unless the models do, so the compiled SQL
+# and names of views are cached for the lifetime of the process.  See `clear_compiled_sql_cache`.
+_compiled_sql_cache = {}
+_name_cache = {}
+# The names of the views referenced by each view, along with the registered views they were matched against
+_referenced_view_names_cache = {}
+# The registered views of each database by name, and the pattern matching references to them, rebuilt as views
+# are registered.  Finding the dependencies of every view would otherwise be quadratic in the number of views.
+_registered_views_cache = {}
+
+# How hidden views are inlined into the SQL of the views reading from them, see `BasePostgresView.inline_hidden_views`
+INLINE_AS_CTE = 'cte'
+INLINE_AS_SUBQUERY = 'subquery'
+
+_WITH_CLAUSE = re.compile(r'^\s*WITH(\s+RECURSIVE)?\s+', re.IGNORECASE)
+
+
+def clear_compiled_sql_cache(view=None):
+    """Forgets the compiled SQL (name, and referenced views) of the given view, or of every view if none is given.
+
+    This is called whenever migrations are run, as they can change the SQL generated for a queryset.
+    """
+    # The names of the registered views may change along with the view's
+    _registered_views_cache.clear()
+    if view is None:
+        _compiled_sql_cache.clear()
+        _name_cache.clear()
+        _referenced_view_names_cache.clear()
+    else:
+        _compiled_sql_cache.pop(view, None)
+        _name_cache.pop(view, None)
+        _referenced_view_names_cache.pop(view, None)
+
+
+def _get_registered_views(database: str) -> Tuple[Dict[str, type], Optional[Pattern]]:
+    """Returns the registered views of the database by name, and the pattern matching references to them."""
+    views = registry[database]
+    cached = _registered_views_cache.get(database)
+    # Views are only ever added to the registry, so its size tells whether it changed
+    if cached is None or cached[0] is not views or cached[1] != len(views):
+        views_by_name = {view.name: view for view in views}
+        cached = (views, len(views), views_by_name, compile_view_reference_pattern(views_by_name))
+        _registered_views_cache[database] = cached
+    return cached[2], cached[3]
+
+
+def _clear_compiled_sql_cache_on_migrate(**kwargs):
+    clear_compiled_sql_cache()
 
 
 class HiddenViewMixin:
     hidden = True
 
 
+def _is_refreshed(view) -> bool:
+    """Whether the rows of the view are a snapshot which has to be refreshed, as opposed to always being up to date
+    (plain views, and tables maintained by triggers).
+    """
+    return issubclass(view, (PostgresMaterialisedViewMixin, WatermarkRefreshMixin))
+
+
 class PostgresMaterialisedViewMixin:
     """Mixin to make a subclass of AutoRegisterMixin and BasePostgresView materialized.
 
@@ -25,23 +95,44 @@ class PostgresMaterialisedViewMixin:
         pk_field (str): is an optional string with the column name from the view.
             This column will get a unique index. Having a unique index will allow this
             view to refresh concurrently.
+        indexes (List[ViewIndex]): additional indexes created once the view is populated.
+        refresh_policy (RefreshPolicy): how the view is refreshed by `run_view_refresher`, if at all.
     """
 
+    materialised = True
     pk_field: Optional[str] = None
+    indexes: List[ViewIndex] = []
+    refresh_policy: Optional[RefreshPolicy] = None
 
-    @classproperty
-    def creation_sql(cls) -> ParameterisedSQL:
-        parameterised_sql = cls._parameterised_sql
-        sql = f"CREATE MATERIALIZED VIEW {cls.name_with_schema} AS {parameterised_sql.sql};"
+    @classmethod
+    def get_creation_sql(
+        cls, schema: str = SUB_SCHEMA_NAME, include_indexes: bool = True, with_data: bool = True
+    ) -> ParameterisedSQL:
+        parameterised_sql = cls._get_parameterised_sql_for_schema(schema)
+        name_with_schema = f'{schema}.{cls.name}'
+        sql = f"CREATE MATERIALIZED VIEW {name_with_schema} AS {parameterised_sql.sql}"
+        sql += ";" if with_data else " WITH NO DATA;"
 
         if cls.pk_field:
-            sql += f"CREATE UNIQUE INDEX {cls.name}_{cls.pk_field} ON {cls.name_with_schema} ({cls.pk_field});"
+            sql += f"CREATE UNIQUE INDEX {cls.name}_{cls.pk_field} ON {name_with_schema} ({cls.pk_field});"
+
+        if include_indexes:
+            sql += ''.join(cls.get_index_sql(schema=schema))
 
         return ParameterisedSQL(
             sql=sql,
             params=parameterised_sql.params,
         )
 
+    @classmethod
+    def get_index_sql(cls, schema: str = SUB_SCHEMA_NAME, concurrently: bool = False) -> List[str]:
+        """Get the SQL statements creating the `indexes` of the view.
+
+        Args:
+            concurrently (bool): if True the statements will be for concurrent index builds
+        """
+        return [index.get_creation_sql(cls.name, f'{schema}.{cls.name}', concurrently) for index in cls.indexes]
+
     @classmethod
     def get_refresh_sql(cls, concurrently: bool = False) -> str:
         """Get the SQL statement to refresh the view.
@@ -65,6 +156,17 @@ class BasePostgresView:
     view_dependencies = []
     prefix = None
     hidden = False
+    # Whether the rows of the view are stored (materialised view or table), rather than computed when it's read
+    materialised = False
+    # Set to INLINE_AS_CTE or INLINE_AS_SUBQUERY to inline the hidden (non materialised) views the view reads from
+    # into its own SQL, see `inlined_views`
+    inline_hidden_views: Optional[str] = None
+    # The tables the view reads from, used to tell whether a materialised view is stale.
+    # Derived from the queryset for PostgresViewFromQueryset (unless it has RawSQL or extra() SQL, in which case
+    # they have to be declared too), has to be declared for PostgresViewFromSQL.
+    source_tables: Optional[List[str]] = None
+    # Set to False if the SQL can change within a process, e.g. a queryset filtering on `timezone.now()`
+    cache_compiled_sql = True
 
     def __init_subclass__(cls, **kwargs):
         super().__init_subclass__(**kwargs)
@@ -80,6 +182,88 @@ class BasePostgresView:
         """
         raise NotImplementedError
 
+    @classproperty
+    def _compiled_sql(cls) -> ParameterisedSQL:
+        """`_parameterised_sql` with the hidden views inlined (see `inline_hidden_views`), cached per process unless
+        `cache_compiled_sql` is False for the view or one of the inlined views.
+        """
+        if cls in _compiled_sql_cache:
+            return _compiled_sql_cache[cls]
+        parameterised_sql, inlined_views = cls._get_inlined_sql()
+        if cls.cache_compiled_sql and all(view.cache_compiled_sql for view in inlined_views):
+            _compiled_sql_cache[cls] = parameterised_sql
+        return parameterised_sql
+
+    @classproperty
+    def inlined_views(cls) -> List:
+        """The hidden views inlined into the SQL of the view, dependencies first.
+
+        With `inline_hidden_views` set, the hidden views of the same database which the SQL of the view references
+        (directly or through other hidden views) are inlined as common table expressions, so that Postgres plans
+        a single query rather than a stack of views.  With INLINE_AS_CTE, Postgres folds a CTE into the query where
+        it's referenced once, and computes it once where it's referenced several times.  With INLINE_AS_SUBQUERY,
+        the CTEs are NOT MATERIALIZED, so they're always folded into the query like subqueries.
+
+        Materialised views are never inlined, as that would compute their rows instead of reading them.
+        """
+        return cls._get_inlined_sql()[1]
+
+    @classmethod
+    def _get_inlined_sql(cls) -> Tuple[ParameterisedSQL, List]:
+        parameterised_sql = cls._parameterised_sql
+        if cls.inline_hidden_views is None:
+            return parameterised_sql, []
+        if cls.inline_hidden_views not in (INLINE_AS_CTE, INLINE_AS_SUBQUERY):
+            raise ValueError(f"{cls.name} can't inline hidden views as {cls.inline_hidden_views!r}")
+
+        inlinable_views = {
+            view.name: view for view in registry[cls.database] if view.hidden and not view.materialised
+        }
+        inlinable_views.pop(cls.name, None)
+
+        # Depth first, so that each view comes after the views it inlines
+        inlined_views, inlined_sqls = [], {}
+
+        def _visit(view, path):
+            if view in inlined_sqls:
+                return
+            if view in path:
+                cycle = path[path.index(view):] + [view]
+                raise CyclicDependencyError(
+                    f"Can't inline cyclic views: {' -> '.join(view.name for view in cycle)}", cycle
+                )
+            view_sql = view._parameterised_sql
+            for name in sorted(find_view_references(view_sql.sql, inlinable_views)):
+                _visit(inlinable_views[name], path + [view])
+            inlined_sqls[view] = view_sql
+            inlined_views.append(view)
+
+        for name in sorted(find_view_references(parameterised_sql.sql, inlinable_views)):
+            _visit(inlinable_views[name], [cls])
+        if not inlined_views:
+            return parameterised_sql, []
+
+        inlined_names = [view.name for view in inlined_views]
+
+        def _reference_ctes(sql: str) -> str:
+            return replace_view_references(sql, inlined_names, lambda view_name: f'"inlined_{view_name}"')
+
+        materialized = 'NOT MATERIALIZED ' if cls.inline_hidden_views == INLINE_AS_SUBQUERY else ''
+        ctes = ', '.join(
+            f'"inlined_{view.name}" AS {materialized}({_reference_ctes(inlined_sqls[view].sql)})'
+            for view in inlined_views
+        )
+        params = [param for view in inlined_views for param in inlined_sqls[view].params]
+
+        sql = _reference_ctes(parameterised_sql.sql)
+        with_clause = _WITH_CLAUSE.match(sql)
+        if with_clause:
+            # The SQL has CTEs of its own, which can reference the inlined views
+            sql = f'WITH{with_clause.group(1) or ""} {ctes}, {sql[with_clause.end():]}'
+        else:
+            sql = f'WITH {ctes} {sql}'
+        return ParameterisedSQL(sql=sql, params=params + list(parameterised_sql.params)), inlined_views
+
     @classproperty
     def creation_sql(cls) -> ParameterisedSQL:
         """Returns the SQL to create the view.
@@ -101,12 +285,127 @@ class BasePostgresView:
         representation to the cursor itself (in this case, an ISO Format datetime,
         which is not the default `__str__` in python)
         """
-        parameterised_sql = cls._parameterised_sql
+        return cls.get_creation_sql()
+
+    @classmethod
+    def get_creation_sql(
+        cls, schema: str = SUB_SCHEMA_NAME, include_indexes: bool = True, with_data: bool = True
+    ) -> ParameterisedSQL:
+        """Returns the SQL to create the view under the given schema (see `creation_sql`).
+
+        `include_indexes` and `with_data` only apply to materialised views: see
+        `PostgresMaterialisedViewMixin.get_index_sql`, and `with_data=False` creates the view unpopulated.
+        """
+        parameterised_sql = cls._get_parameterised_sql_for_schema(schema)
         return ParameterisedSQL(
-            sql=f'CREATE VIEW {cls.name_with_schema} AS {parameterised_sql.sql};',
+            sql=f'CREATE VIEW {schema}.{cls.name} AS {parameterised_sql.sql};',
             params=parameterised_sql.params
         )
 
+    @classmethod
+    def _get_parameterised_sql_for_schema(cls, schema: str) -> ParameterisedSQL:
+        """Returns `_parameterised_sql`, with references to the other views of the same database
+        pointing at `schema` rather than SUB_SCHEMA_NAME.  This is used to build the views under a staging schema.
+        """
+        parameterised_sql = cls._compiled_sql
+        if schema == SUB_SCHEMA_NAME:
+            return parameterised_sql
+        views_by_name, pattern = _get_registered_views(cls.database)
+        sql = replace_view_references(
+            parameterised_sql.sql, views_by_name, lambda view_name: f'"{schema}"."{view_name}"', pattern=pattern
+        )
+        return ParameterisedSQL(sql=sql, params=parameterised_sql.params)
+
+    @classmethod
+    def get_dependencies(cls) -> Set:
+        """Returns the views the view depends on: its `view_dependencies`, along with the other registered views of
+        the same database which its SQL references, so that they don't all have to be declared.
+
+        References hidden in SQL the package can't see into (e.g. `RawSQL` expressions, or functions reading from
+        views) still have to be declared in `view_dependencies`.
+        """
+        views_by_name, _ = _get_registered_views(cls.database)
+        referenced_views = {
+            views_by_name[name] for name in cls._get_cached_referenced_view_names()
+            if name in views_by_name and views_by_name[name] is not cls
+        }
+        return set(cls.view_dependencies) | referenced_views
+
+    @classmethod
+    def _get_cached_referenced_view_names(cls) -> Set[str]:
+        """`_get_referenced_view_names`, cached like the compiled SQL until other views are registered."""
+        views_by_name, _ = _get_registered_views(cls.database)
+        cached = _referenced_view_names_cache.get(cls)
+        if cached is not None and cached[0] is views_by_name:
+            return cached[1]
+        referenced_view_names = cls._get_referenced_view_names()
+        if cls.cache_compiled_sql:
+            _referenced_view_names_cache[cls] = (views_by_name, referenced_view_names)
+        return referenced_view_names
+
+    @classmethod
+    def _get_referenced_view_names(cls) -> Set[str]:
+        """The names of the views referenced by the SQL of the view."""
+        views_by_name, pattern = _get_registered_views(cls.database)
+        return find_view_references(cls._parameterised_sql.sql, views_by_name, pattern=pattern)
+
+    @classmethod
+    def get_source_tables(cls) -> Optional[List[str]]:
+        """Returns the tables the view reads from.  References to other views of this package are followed
+        down to their own source tables, except for materialised views: they only change when they're refreshed,
+        which the staleness signature tracks through their last refresh in the catalog.
+
+        Returns None if the source tables aren't known, in which case the view is always considered stale.
+        """
+        tables = cls._get_direct_source_tables()
+        if tables is None:
+            return None
+
+        views_by_name = {view.name_with_schema: view for view in registry[cls.database]}
+        source_tables = set()
+        for table in tables:
+            view = views_by_name.get(table.replace('"', ''))
+            if view is None or view.materialised:
+                source_tables.add(table)
+                continue
+            view_source_tables = view.get_source_tables()
+            if view_source_tables is None:
+                return None
+            source_tables.update(view_source_tables)
+        return sorted(source_tables)
+
+    @classmethod
+    def _get_direct_source_tables(cls) -> Optional[List[str]]:
+        return cls.source_tables
+
+    @classmethod
+    def get_last_refresh(cls) -> Optional[ViewRefresh]:
+        """Returns the last refresh of the view recorded in the catalog (including its population by a sync), or
+        None if the view isn't populated or isn't refreshed at all.
+        """
+        if not _is_refreshed(cls):
+            return None
+        with connections[cls.database].cursor() as cursor:
+            return get_refresh(cursor, cls.name)
+
+    @classmethod
+    def last_refreshed(cls) -> Optional[datetime.datetime]:
+        """Returns the time as of which the rows of the view reflect its source tables, i.e. the start of its last
+        refresh.  None if the view hasn't been populated, or isn't refreshed (plain views are always up to date).
+        """
+        last_refresh = cls.get_last_refresh()
+        return last_refresh.started_at if last_refresh else None
+
+    @classproperty
+    def fingerprint(cls) -> str:
+        """A digest of the creation SQL (SQL + params).  Incremental syncs compare this with the
+        fingerprint stored in the catalog to decide whether the view needs to be rebuilt.
+        """
+        creation_sql = cls.creation_sql
+        digest = hashlib.sha256(creation_sql.sql.encode())
+        digest.update(repr(creation_sql.params).encode())
+        return digest.hexdigest()
+
     @classproperty
     def name(cls) -> str:
         """The name of the view.  This can be overridden by subclasses
@@ -118,6 +417,9 @@ class BasePostgresView:
             MyPostgreSQLView -> mypostgressqlview
 
         """
+        if cls in _name_cache:
+            return _name_cache[cls]
+
         word = cls.__name__
         word = re.sub(r'([A-Z]+)([A-Z][a-z])', r'\1\2', word)
         word = re.sub(r'([a-z\d])([A-Z])', r'\1\2', word)
@@ -127,6 +429,7 @@ class BasePostgresView:
         if cls.prefix is not None:
             word = f'{cls.prefix}_{word}'
 
+        _name_cache[cls] = word
         return word
 
     @classproperty
@@ -150,6 +453,45 @@ class BasePostgresView:
         return ParameterisedSQL(sql=qry, params=[])
 
 
+def _walk_query(query: Query):
+    """Yields the query along with its expressions and where nodes, and those of its subqueries and combined
+    queries (`union`, `intersection` and `difference`).
+    """
+    to_visit = [query]
+    while to_visit:
+        node = to_visit.pop()
+        yield node
+        if isinstance(node, Query):
+            to_visit.extend([*node.annotations.values(), node.where, *node.combined_queries])
+            continue
+        inner_query = getattr(node, 'query', None)
+        if isinstance(inner_query, Query):
+            to_visit.append(inner_query)
+        if hasattr(node, 'get_source_expressions'):
+            to_visit.extend(expression for expression in node.get_source_expressions() if expression is not None)
+        else:
+            to_visit.extend(getattr(node, 'children', None) or [])
+
+
+def _get_query_tables(query: Query) -> Set[str]:
+    """Returns the tables referenced by the query's `alias_map`, including those of any subqueries."""
+    return {
+        alias.table_name
+        for node in _walk_query(query) if isinstance(node, Query)
+        for alias in node.alias_map.values()
+    }
+
+
+def _has_raw_sql(query: Query) -> bool:
+    """Whether the query has SQL which may read from tables its `alias_map`s don't show: `RawSQL` expressions, or
+    SQL added by `extra()`.
+    """
+    return any(
+        isinstance(node, (RawSQL, ExtraWhere)) or (isinstance(node, Query) and (node.extra or node.extra_tables))
+        for node in _walk_query(query)
+    )
+
+
 class PostgresViewFromQueryset(AutoRegisterMixin, BasePostgresView, should_register=False):
     """Used as the interface to the package for defining views based on a Django Queryset."""
 
@@ -157,6 +499,23 @@ class PostgresViewFromQueryset(AutoRegisterMixin, BasePostgresView, should_regis
     def get_queryset(cls) -> QuerySet:
         raise NotImplementedError
 
+    @classmethod
+    def _get_direct_source_tables(cls) -> Optional[List[str]]:
+        if cls.source_tables is not None:
+            return cls.source_tables
+        query = cls.get_queryset().query
+        if _has_raw_sql(query):
+            return None
+        return sorted(_get_query_tables(query))
+
+    @classmethod
+    def _get_referenced_view_names(cls) -> Set[str]:
+        # The tables of readable views are the views themselves, e.g. "views"."my_view", so the references are
+        # read from the query rather than its SQL
+        schema_prefix = f'{SUB_SCHEMA_NAME}.'
+        tables = (table.replace('"', '') for table in _get_query_tables(cls.get_queryset().query))
+        return {table[len(schema_prefix):] for table in tables if table.startswith(schema_prefix)}
+
     @classproperty
     def _parameterised_sql(cls) -> ParameterisedSQL:
         qset = cls.get_queryset()
@@ -177,13 +536,81 @@ class PostgresViewFromSQL(AutoRegisterMixin, BasePostgresView, should_register=F
         return ParameterisedSQL(sql=cls.sql, params=[])
 
 
+class _LiveViewTable(BaseTable):
+    """The SQL of a view as a subquery, which takes the place of the view in the FROM clause of a query."""
+
+    def __init__(self, view, alias):
+        super().__init__(view.name_with_schema, alias)
+        self.view = view
+
+    def as_sql(self, compiler, connection):
+        parameterised_sql = self.view._compiled_sql
+        return f'({parameterised_sql.sql}) {self.table_alias}', list(parameterised_sql.params)
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(self.view, change_map.get(self.table_alias, self.table_alias))
+
+    @property
+    def identity(self):
+        return self.__class__, self.view, self.table_alias
+
+
+class ViewQuerySet(QuerySet):
+    """The queryset of readable views."""
+
+    def fresh_within(self, max_age: datetime.timedelta) -> 'ViewQuerySet':
+        """Returns the queryset as is if the view was last refreshed within `max_age`, otherwise one computing
+        the rows of the view from its SQL, at the cost of running its query.
+
+        Only the view itself is computed: any materialised view it reads from is still read as is.  Views which
+        aren't refreshed are always fresh.
+        """
+        view = self.model
+        if not _is_refreshed(view):
+            return self._chain()
+        last_refreshed = view.last_refreshed()
+        if last_refreshed is not None and timezone.now() - last_refreshed <= max_age:
+            return self._chain()
+
+        LOG.getChild('fresh_within').info(
+            'Reading %s from its SQL, as it was last refreshed at %s', view.name, last_refreshed
+        )
+        queryset = self._chain()
+        query = queryset.query
+        aliases = list(query.alias_map)
+        view_alias = aliases[0] if aliases else query.get_initial_alias()
+        live_alias = f'{view.name}_live'
+        change_map = {view_alias: live_alias}
+        query.change_aliases(change_map)
+        # change_aliases moves the renamed alias last and leaves the joins from it alone, but the FROM clause
+        # follows the order of alias_map
+        query.alias_map = {
+            change_map.get(alias, alias): (
+                _LiveViewTable(view, live_alias) if alias == view_alias
+                else query.alias_map[alias].relabeled_clone(change_map)
+            )
+            for alias in aliases or [view_alias]
+        }
+        # The base alias is cached by the query
+        query.__dict__.pop('base_table', None)
+        return queryset
+
+
+class ViewManager(Manager.from_queryset(ViewQuerySet)):
+    pass
+
+
 class ReadableViewFromQueryset(
     PostgresViewFromQueryset, NotManagedModel, is_abstract_model=True, should_register=False
 ):
+    objects = ViewManager()
+
     class Meta:
         abstract = True
 
 
 class ReadableViewFromSQL(PostgresViewFromSQL, NotManagedModel, is_abstract_model=True, should_register=False):
+    objects = ViewManager()
+
     class Meta:
         abstract = True
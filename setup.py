@@ -18,7 +18,10 @@ setup(
     extras_require={
         'test': [
             'psycopg2-binary==2.8.6'
-        ]
+        ],
+        'parquet': [
+            'pyarrow>=4.0',
+        ],
     },
     zip_safe=False,  # We need this for the management commands to work
 )
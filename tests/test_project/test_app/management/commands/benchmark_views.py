@@ -0,0 +1,250 @@
+"""Benchmarks syncing and refreshing views, using synthetic view graphs and data.
+
+Run it against the postgres service of the docker-compose setup, e.g.:
+
+    docker-compose run django sh -c "cd tests/test_project && ./manage.py migrate && ./manage.py benchmark_views"
+
+The synthetic views are swapped into the registry for the duration of the benchmark, and the views of the
+test project are sync'd back afterwards.
+"""
+import json
+import re
+import statistics
+import threading
+import time
+import types
+from contextlib import nullcontext
+
+from django.core.management import BaseCommand
+from django.db import connection, connections
+from django.db.models import Count, Sum
+from django.test.utils import CaptureQueriesContext
+
+from django_orm_views.constants import DEFAULT_DATABASE_LABEL
+from django_orm_views.register import registry, register_all_views
+from django_orm_views.signals import LockWaitSampler
+from django_orm_views.sync import refresh_materialized_views, sync_views, topological_sort_views
+from django_orm_views.views import (
+    PostgresMaterialisedViewMixin,
+    PostgresViewFromQueryset,
+    PostgresViewFromSQL,
+    clear_compiled_sql_cache,
+)
+
+from ...models import TestModel
+
+CREATE_VIEW_RE = re.compile(r'CREATE (?:MATERIALIZED )?VIEW \w+\.(\w+)')
+
+
+class ConcurrentReader:
+    """Keeps reading from a view on a separate connection, as a dashboard or analytics user would."""
+
+    def __init__(self, view_name: str, database: str = DEFAULT_DATABASE_LABEL):
+        self.view_name = view_name
+        self.database = database
+        self.reads = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _read(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    with connections[self.database].cursor() as cursor:
+                        cursor.execute(f'SELECT count(*) FROM views.{self.view_name};')
+                    self.reads += 1
+                except Exception:
+                    # The view can be missing for a moment whilst it's rebuilt
+                    connections[self.database].close()
+        finally:
+            connections[self.database].close()
+
+
+def _make_view(class_name: str, bases: tuple, attributes: dict):
+    return types.new_class(class_name, bases, {'should_register': False}, lambda namespace: namespace.update(attributes))
+
+
+def build_view_graph(width: int, depth: int, materialised_every: int):
+    """Builds `depth` levels of `width` views.  The first level is made of queryset views aggregating TestModel,
+    each view of the following levels joins two views of the previous level.  Every `materialised_every`th view
+    is materialised.
+    """
+    levels = []
+    for level in range(depth):
+        views = []
+        for index in range(width):
+            bases = (PostgresViewFromSQL,)
+            attributes = {}
+            if materialised_every and (level * width + index) % materialised_every == 0:
+                bases = (PostgresMaterialisedViewMixin,) + bases
+                attributes['pk_field'] = 'integer_col'
+
+            if level == 0:
+                bases = bases[:-1] + (PostgresViewFromQueryset,)
+                attributes['get_queryset'] = classmethod(
+                    lambda cls, minimum=index: (
+                        TestModel.objects
+                        .filter(integer_col__gte=minimum)
+                        .values('integer_col')
+                        .annotate(row_count=Count('id'), total=Sum('integer_col'))
+                    )
+                )
+            else:
+                left, right = levels[-1][index], levels[-1][(index + 1) % width]
+                attributes['view_dependencies'] = [left, right]
+                attributes['sql'] = f"""
+                    SELECT a.integer_col, a.row_count + b.row_count AS row_count, a.total + b.total AS total
+                    FROM views.{left.name} a
+                    JOIN views.{right.name} b ON a.integer_col = b.integer_col
+                """
+            views.append(_make_view(f'BenchmarkLevel{level}View{index}', bases, attributes))
+        levels.append(views)
+    return [view for views in levels for view in views]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks syncing and refreshing synthetic views (requires a migrated database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--width', type=int, default=10, help='Number of views per level of the graph')
+        parser.add_argument('--depth', type=int, default=4, help='Number of levels of the graph')
+        parser.add_argument(
+            '--materialised-every', type=int, default=5, help='Materialise every nth view (0 for none)'
+        )
+        parser.add_argument('--rows', type=int, default=100000, help='Number of rows of source data')
+        parser.add_argument('--repeat', type=int, default=3, help='Number of runs of each benchmark')
+        parser.add_argument('--workers', type=int, default=4, help='Number of workers for parallel refreshes')
+        parser.add_argument(
+            '--with-reader', action='store_true', help='Read from a view on another connection whilst syncing'
+        )
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this file as JSON')
+
+    def handle(self, *_, **options):
+        register_all_views()
+        views = build_view_graph(options['width'], options['depth'], options['materialised_every'])
+        materialised_views = [view for view in views if issubclass(view, PostgresMaterialisedViewMixin)]
+        repeat = options['repeat']
+        results = {
+            'views': len(views),
+            'materialised_views': len(materialised_views),
+            'rows': options['rows'],
+        }
+
+        results['topological_sort'] = self._time(repeat, lambda: topological_sort_views(views))
+        results['compilation_cold'] = self._time(repeat, lambda: self._compile(views, cold=True))
+        results['compilation_warm'] = self._time(repeat, lambda: self._compile(views, cold=False))
+
+        saved_registry = {database: set(database_views) for database, database_views in registry.items()}
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT coalesce(max(id), 0) FROM test_app_testmodel;')
+            max_existing_id = cursor.fetchone()[0]
+            cursor.execute(
+                """
+                INSERT INTO test_app_testmodel (integer_col, character_col, date_col, datetime_col)
+                SELECT i %% 1000, 'benchmark', current_date, now() FROM generate_series(1, %s) i;
+                """,
+                [options['rows']],
+            )
+        try:
+            registry.clear()
+            registry[DEFAULT_DATABASE_LABEL].update(views)
+
+            for mode, sync_options in (
+                ('sync', {}),
+                ('sync_batched', {'batched': True}),
+                ('sync_blue_green', {'blue_green': True}),
+                ('sync_incremental_unchanged', {'incremental': True}),
+            ):
+                results[mode] = self._benchmark_sync(views, repeat, options['with_reader'], **sync_options)
+
+            for mode, workers in (('refresh_serial', 1), ('refresh_parallel', options['workers'])):
+                results[mode] = self._benchmark_refresh(materialised_views, repeat, workers)
+        finally:
+            registry.clear()
+            for database, database_views in saved_registry.items():
+                registry[database].update(database_views)
+            TestModel.objects.filter(id__gt=max_existing_id).delete()
+            clear_compiled_sql_cache()
+            sync_views()
+
+        self._write_results(results)
+        if options['json_path']:
+            with open(options['json_path'], 'w') as json_file:
+                json.dump(results, json_file, indent=2)
+
+    @staticmethod
+    def _time(repeat: int, function) -> dict:
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            durations.append(time.perf_counter() - start)
+        return {'median': statistics.median(durations), 'max': max(durations)}
+
+    @staticmethod
+    def _compile(views, cold: bool):
+        if cold:
+            clear_compiled_sql_cache()
+        for view in views:
+            view.creation_sql
+
+    def _benchmark_sync(self, views, repeat: int, with_reader: bool, **sync_options) -> dict:
+        sync_views()
+        durations, lock_waits, ddl_durations, reads = [], [], [], []
+        for _ in range(repeat):
+            reader = ConcurrentReader(views[0].name) if with_reader else None
+            with reader or nullcontext(), LockWaitSampler() as sampler:
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    sync_views(**sync_options)
+                    durations.append(time.perf_counter() - start)
+            if reader is not None:
+                reads.append(reader.reads)
+            lock_waits.append(sampler.lock_wait)
+            ddl_durations.extend(
+                float(query['time']) for query in queries.captured_queries if CREATE_VIEW_RE.search(query['sql'])
+            )
+        result = {
+            'median': statistics.median(durations),
+            'max': max(durations),
+            'lock_wait_median': statistics.median(lock_waits),
+            'ddl_statement_median': statistics.median(ddl_durations) if ddl_durations else None,
+            'ddl_statement_max': max(ddl_durations) if ddl_durations else None,
+        }
+        if with_reader:
+            result['concurrent_reads_median'] = statistics.median(reads)
+        return result
+
+    def _benchmark_refresh(self, materialised_views, repeat: int, workers: int) -> dict:
+        durations, lock_waits = [], []
+        for _ in range(repeat):
+            with LockWaitSampler() as sampler:
+                start = time.perf_counter()
+                refresh_materialized_views(materialised_views, max_workers=workers)
+                durations.append(time.perf_counter() - start)
+            lock_waits.append(sampler.lock_wait)
+        return {
+            'median': statistics.median(durations),
+            'max': max(durations),
+            'lock_wait_median': statistics.median(lock_waits),
+        }
+
+    def _write_results(self, results: dict):
+        for name, value in results.items():
+            if not isinstance(value, dict):
+                self.stdout.write(f'{name:<30} {value}')
+                continue
+            measurements = ', '.join(
+                f'{key}={measurement:.4f}s' if isinstance(measurement, float) and 'reads' not in key
+                else f'{key}={measurement}'
+                for key, measurement in value.items()
+            )
+            self.stdout.write(f'{name:<30} {measurements}')
@@ -1,8 +1,15 @@
 from django.db import models
-from django.db.models import F, OuterRef
+from django.db.models import Count, F, Max, Min, OuterRef, Sum
 from django.utils.functional import classproperty
 
+from django_orm_views.aggregates import IncrementalAggregateView
+from django_orm_views.cache import CachedViewManager, LRUResultCache
+from django_orm_views.incremental import WatermarkRefreshMixin
+from django_orm_views.indexes import ViewIndex
+from django_orm_views.partitioned import PARTITION_BY_MONTH, PartitionedMaterialisedViewMixin
 from django_orm_views.views import (
+    INLINE_AS_CTE,
+    HiddenViewMixin,
     PostgresViewFromQueryset,
     PostgresViewFromSQL,
     PostgresMaterialisedViewMixin,
@@ -96,6 +103,47 @@ class DependentView(PostgresViewFromSQL):
     """
 
 
+# -----------------------------------------------------------------------------
+# Inlined hidden views
+# -----------------------------------------------------------------------------
+
+
+class HiddenPositiveView(HiddenViewMixin, PostgresViewFromSQL):
+
+    prefix = 'test'
+    sql = """
+        SELECT id, integer_col, character_col FROM test_app_testmodel WHERE integer_col > 0
+    """
+
+
+class HiddenReadableView(HiddenViewMixin, ReadableViewFromSQL):
+
+    prefix = 'test'
+    view_dependencies = [HiddenPositiveView]
+    id = models.IntegerField(primary_key=True)
+    integer_col = models.IntegerField()
+    character_col = models.CharField(max_length=100)
+
+    sql = """
+        SELECT id, integer_col, character_col FROM views.test_hiddenpositiveview
+    """
+
+
+class InlinedDependentView(PostgresViewFromQueryset):
+
+    prefix = 'test'
+    view_dependencies = [HiddenReadableView]
+    inline_hidden_views = INLINE_AS_CTE
+
+    @classmethod
+    def get_queryset(cls):
+        return (
+            HiddenReadableView.objects.filter(integer_col__lt=100)
+            .values('character_col')
+            .annotate(total=Sum('integer_col'))
+        )
+
+
 # -----------------------------------------------------------------------------
 # Materialized
 # -----------------------------------------------------------------------------
@@ -111,6 +159,81 @@ class SimpleMaterializedView(PostgresMaterialisedViewMixin, PostgresViewFromQuer
         return TestModel.objects.values()
 
 
+class DependentMaterializedView(PostgresMaterialisedViewMixin, PostgresViewFromSQL):
+
+    prefix = 'test'
+
+    view_dependencies = [
+        SimpleMaterializedView
+    ]
+    source_tables = ['views.test_simplematerializedview']
+
+    sql = """
+        SELECT * FROM "views"."test_simplematerializedview"
+    """
+
+
+class IndexedMaterializedView(PostgresMaterialisedViewMixin, PostgresViewFromQueryset):
+
+    prefix = 'test'
+    pk_field = 'id'
+    indexes = [
+        ViewIndex(fields=['integer_col', '-date_col'], include=['character_col'], condition='integer_col > 0'),
+        ViewIndex(fields=['datetime_col'], method='brin', name='test_indexed_datetime_brin'),
+        ViewIndex(fields=['character_col'], method='hash'),
+    ]
+
+    @classmethod
+    def get_queryset(cls):
+        return TestModel.objects.values()
+
+
+# -----------------------------------------------------------------------------
+# Partitioned
+# -----------------------------------------------------------------------------
+
+
+class DailyPartitionedView(PartitionedMaterialisedViewMixin, PostgresViewFromQueryset):
+
+    prefix = 'test'
+    partition_field = 'date_col'
+    partition_interval = PARTITION_BY_MONTH
+    indexes = [ViewIndex(fields=['date_col'])]
+
+    @classmethod
+    def get_queryset(cls):
+        return TestModel.objects.values('date_col').annotate(total=Sum('integer_col'))
+
+
+# -----------------------------------------------------------------------------
+# Incremental aggregates
+# -----------------------------------------------------------------------------
+
+
+class CharacterAggregateView(IncrementalAggregateView):
+
+    prefix = 'test'
+
+    @classmethod
+    def get_queryset(cls):
+        return TestModel.objects.filter(integer_col__gt=0).values('character_col').annotate(
+            total=Sum('integer_col'),
+            row_count=Count('id'),
+            first_date=Min('date_col'),
+            last_date=Max('date_col'),
+        )
+
+
+class WatermarkedView(WatermarkRefreshMixin, PostgresViewFromQueryset):
+
+    prefix = 'test'
+    watermark_field = 'id'
+
+    @classmethod
+    def get_queryset(cls):
+        return TestModel.objects.filter(integer_col__gt=0).values('id', 'integer_col', 'character_col')
+
+
 # -----------------------------------------------------------------------------
 # Readable Views
 # -----------------------------------------------------------------------------
@@ -138,6 +261,20 @@ class ReadableTestViewFromSQL(ReadableViewFromSQL):
         """
 
 
+class ReadableMaterializedTestView(PostgresMaterialisedViewMixin, ReadableViewFromQueryset):
+
+    prefix = 'test'
+    pk_field = 'id'
+    id = models.IntegerField(primary_key=True)
+    character_col = models.CharField(max_length=100)
+
+    cached_objects = CachedViewManager(LRUResultCache(max_entries=10))
+
+    @classmethod
+    def get_queryset(cls) -> models.QuerySet:
+        return TestModel.objects.filter(integer_col__gt=0).values('id', 'character_col')
+
+
 class ReadableTestViewWithNullableForeignKeys(ReadableViewFromQueryset):
 
     view_dependencies = [ReadableTestViewFromSQL]
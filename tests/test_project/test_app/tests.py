@@ -1,20 +1,81 @@
 import datetime
+import io
+import json
+import tempfile
+import threading
+import time
+from concurrent import futures
+from unittest import mock, skipUnless
 
-from django_orm_views.sync import sync_views, refresh_materialized_view
-from django.db import connection
-from django.test import TestCase
+from django_orm_views.aggregates import IncrementalAggregateView
+from django_orm_views.cache import DjangoResultCache, LRUResultCache
+from django_orm_views.constants import ParameterisedSQL
+from django_orm_views.exceptions import (
+    CyclicDependencyError,
+    InvalidAggregateView,
+    AdvisoryLockTimeout,
+    MaterialisedViewRefreshError,
+    ViewSyncError,
+)
+from django_orm_views.explain import explain_view, explain_views
+from django_orm_views.export import FORMAT_PARQUET, export_view, pyarrow
+from django_orm_views.incremental import WatermarkRefreshMixin
+from django_orm_views.locks import SYNC_LOCK_NAME, advisory_lock, get_refresh_lock_name
+from django_orm_views.partitioned import PARTITION_BY_DAY
+from django_orm_views.policies import RefreshPolicy
+from django_orm_views.register import discover_views_modules, registry
+from django_orm_views.scheduler import ViewRefresher
+from django_orm_views.signals import view_refreshed, view_synced
+from django_orm_views.sync import (
+    populate_materialized_views,
+    refresh_incremental,
+    sync_views,
+    refresh_materialized_view,
+    refresh_materialized_views,
+    topological_levels,
+    topological_sort_views,
+)
+from django_orm_views.views import (
+    INLINE_AS_CTE,
+    INLINE_AS_SUBQUERY,
+    PostgresMaterialisedViewMixin,
+    PostgresViewFromQueryset,
+    PostgresViewFromSQL,
+    clear_compiled_sql_cache,
+)
+from django.apps import apps
+from django.core.management import CommandError, call_command
+from django.db import DataError, connection, transaction
+from django.db.models import Avg, Count
+from django.db.models.expressions import RawSQL
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from .models import TestModel, TestModelWithForeignKey
 from .postgres_views import (
+    SimpleViewFromQueryset,
+    SimpleViewFromSQL,
+    DependentView,
     SimpleMaterializedView,
+    DependentMaterializedView,
+    CharacterAggregateView,
+    DailyPartitionedView,
+    WatermarkedView,
+    HiddenPositiveView,
+    HiddenReadableView,
+    IndexedMaterializedView,
+    InlinedDependentView,
+    ReadableMaterializedTestView,
     ReadableTestViewFromQueryset,
     ReadableTestViewFromSQL,
     ReadableTestViewWithNullableForeignKeys,
     ReadableTestViewWithNotNullableForeignKeys
 )
 
+NOW = datetime.datetime(2019, 1, 1)
+
 
-class BaseTestCase(TestCase):
+class SyncViewsMixin:
 
     def setUp(self):
         sync_views()
@@ -25,6 +86,16 @@ class BaseTestCase(TestCase):
             return cursor.fetchall()
 
 
+class BaseTestCase(SyncViewsMixin, TestCase):
+    pass
+
+
+class BaseTransactionTestCase(SyncViewsMixin, TransactionTestCase):
+    """Used when the code under test opens its own connections (e.g. from worker threads), as those
+    can't see the data of a TestCase's transaction.
+    """
+
+
 class TestSimpleViewFromQueryset(BaseTestCase):
 
     def test_view_generates_and_returns_as_expected(self):
@@ -315,3 +386,1532 @@ class TestReadableViews(BaseTestCase):
             self.assertIsNone(foreign_keys_view_instance.one_to_one_model_field)
 
 
+
+
+class TestIncrementalSync(BaseTestCase):
+
+    def _get_oid(self, view_name):
+        return self._execute_raw_sql(f"SELECT 'views.{view_name}'::regclass::oid;")[0][0]
+
+    def test_unchanged_views_are_not_rebuilt(self):
+        oid_before = self._get_oid('test_simpleviewfromsql')
+
+        sync_views(incremental=True)
+
+        self.assertEqual(self._get_oid('test_simpleviewfromsql'), oid_before)
+
+    def test_changed_views_and_dependents_are_rebuilt(self):
+        unchanged_oid_before = self._get_oid('test_complexviewfromsql')
+        changed_oid_before = self._get_oid('test_simpleviewfromsql')
+        dependent_oid_before = self._get_oid('test_dependentview')
+        self._execute_raw_sql("""
+            UPDATE views_catalog.view_fingerprint SET fingerprint = 'stale'
+            WHERE view_name = 'test_simpleviewfromsql'
+            RETURNING view_name;
+        """)
+
+        sync_views(incremental=True)
+
+        self.assertEqual(self._get_oid('test_complexviewfromsql'), unchanged_oid_before)
+        self.assertNotEqual(self._get_oid('test_simpleviewfromsql'), changed_oid_before)
+        self.assertNotEqual(self._get_oid('test_dependentview'), dependent_oid_before)
+
+    def test_unregistered_views_are_dropped(self):
+        self._execute_raw_sql("""
+            CREATE VIEW views.test_removedview AS SELECT 1 AS id;
+            INSERT INTO views_catalog.view_fingerprint (view_name, fingerprint)
+            VALUES ('test_removedview', 'removed')
+            RETURNING view_name;
+        """)
+
+        sync_views(incremental=True)
+
+        self.assertEqual(
+            self._execute_raw_sql("SELECT to_regclass('views.test_removedview') IS NULL;"),
+            [(True,)]
+        )
+
+    def test_unregistered_views_reading_from_rebuilt_views_are_dropped(self):
+        self._execute_raw_sql("""
+            CREATE VIEW views.test_removedview AS SELECT * FROM views.test_simpleviewfromsql;
+            INSERT INTO views_catalog.view_fingerprint (view_name, fingerprint)
+            VALUES ('test_removedview', 'removed');
+            UPDATE views_catalog.view_fingerprint SET fingerprint = 'stale'
+            WHERE view_name = 'test_simpleviewfromsql'
+            RETURNING view_name;
+        """)
+
+        sync_views(incremental=True)
+
+        self.assertEqual(
+            self._execute_raw_sql("SELECT to_regclass('views.test_removedview') IS NULL;"),
+            [(True,)]
+        )
+
+    def test_unregistered_views_are_dropped_in_dependency_order(self):
+        self._execute_raw_sql("""
+            CREATE VIEW views.test_removedview AS SELECT 1 AS id;
+            CREATE MATERIALIZED VIEW views.test_removedmaterializedview AS SELECT * FROM views.test_removedview;
+            INSERT INTO views_catalog.view_fingerprint (view_name, fingerprint)
+            VALUES ('test_removedview', 'removed'), ('test_removedmaterializedview', 'removed')
+            RETURNING view_name;
+        """)
+
+        sync_views(incremental=True)
+
+        self.assertEqual(
+            self._execute_raw_sql(
+                "SELECT to_regclass('views.test_removedview'), to_regclass('views.test_removedmaterializedview');"
+            ),
+            [(None, None)]
+        )
+
+
+class TestRefreshMaterialisedViews(BaseTransactionTestCase):
+
+    def test_refreshes_views_in_dependency_order(self):
+        test_data = TestModel.objects.create(
+            integer_col=2,
+            character_col='A',
+            date_col=datetime.date(2019, 1, 1),
+            datetime_col=datetime.datetime(2019, 1, 1),
+        )
+
+        refreshed = refresh_materialized_views(
+            [DependentMaterializedView, SimpleMaterializedView], max_workers=2
+        )
+
+        self.assertEqual(refreshed, [SimpleMaterializedView, DependentMaterializedView])
+        result = self._execute_raw_sql("""
+            SELECT id FROM "views"."test_dependentmaterializedview";
+        """)
+        self.assertEqual(result, [(test_data.id,)])
+
+    def test_dependents_of_failed_views_are_skipped(self):
+        with mock.patch(
+            'django_orm_views.sync.refresh_materialized_view', side_effect=Exception('Refresh failed')
+        ) as refresh_mock:
+            with self.assertRaises(MaterialisedViewRefreshError) as context:
+                refresh_materialized_views([DependentMaterializedView, SimpleMaterializedView])
+
+        refresh_mock.assert_called_once_with(
+            SimpleMaterializedView, concurrently=False, only_if_stale=False, skip_if_locked=False, lock_timeout=None
+        )
+        self.assertEqual(set(context.exception.failures), {SimpleMaterializedView})
+        self.assertEqual(context.exception.skipped, {DependentMaterializedView})
+
+    def test_concurrently_requires_a_pk_field(self):
+        with self.assertRaises(ValueError):
+            refresh_materialized_views([DependentMaterializedView], concurrently=True)
+
+
+class TestBlueGreenSync(BaseTestCase):
+
+    def test_views_are_swapped_in(self):
+        test_data = TestModel.objects.create(
+            integer_col=2,
+            character_col='A',
+            date_col=datetime.date(2019, 1, 1),
+            datetime_col=datetime.datetime(2019, 1, 1),
+        )
+
+        sync_views(blue_green=True)
+
+        self.assertEqual(
+            self._execute_raw_sql("SELECT id FROM views.test_simplematerializedview;"),
+            [(test_data.id,)]
+        )
+        self.assertEqual(
+            self._execute_raw_sql("SELECT to_regnamespace('views_next'), to_regnamespace('views_old');"),
+            [(None, None)]
+        )
+
+    def test_dependent_views_reference_the_swapped_in_views(self):
+        sync_views(blue_green=True)
+
+        view_definition = self._execute_raw_sql("SELECT pg_get_viewdef('views.test_dependentview');")[0][0]
+        self.assertIn('views.test_simpleviewfromsql', view_definition)
+        self.assertNotIn('views_next', view_definition)
+
+
+class TestMaterialisedViewStaleness(BaseTestCase):
+
+    def _add_row(self):
+        return TestModel.objects.create(
+            integer_col=2,
+            character_col='A',
+            date_col=datetime.date(2019, 1, 1),
+            datetime_col=datetime.datetime(2019, 1, 1),
+        )
+
+    def test_source_tables_are_derived_from_the_queryset(self):
+        self.assertEqual(SimpleMaterializedView.get_source_tables(), ['test_app_testmodel'])
+
+    def test_source_tables_follow_views(self):
+        class MaterialisedViewOfView(PostgresMaterialisedViewMixin, PostgresViewFromSQL, should_register=False):
+            source_tables = ['views.test_simpleviewfromqueryset']
+            sql = 'SELECT * FROM views.test_simpleviewfromqueryset'
+
+        self.assertEqual(MaterialisedViewOfView.get_source_tables(), ['test_app_testmodel'])
+
+    def test_source_tables_include_those_of_combined_querysets(self):
+        class UnionView(PostgresMaterialisedViewMixin, PostgresViewFromQueryset, should_register=False):
+            @classmethod
+            def get_queryset(cls):
+                return TestModel.objects.values('id').union(TestModelWithForeignKey.objects.values('id'))
+
+        self.assertEqual(UnionView.get_source_tables(), ['test_app_testmodel', 'test_app_testmodelwithforeignkey'])
+
+    def test_source_tables_of_querysets_with_raw_sql_are_unknown(self):
+        class RawSQLView(PostgresMaterialisedViewMixin, PostgresViewFromQueryset, should_register=False):
+            @classmethod
+            def get_queryset(cls):
+                return TestModel.objects.values('id').annotate(
+                    references=RawSQL('SELECT count(*) FROM test_app_testmodelwithforeignkey', [])
+                )
+
+        class ExtraView(PostgresMaterialisedViewMixin, PostgresViewFromQueryset, should_register=False):
+            @classmethod
+            def get_queryset(cls):
+                return TestModel.objects.extra(
+                    where=['id IN (SELECT foreign_key_id FROM test_app_testmodelwithforeignkey)']
+                ).values('id')
+
+        self.assertIsNone(RawSQLView.get_source_tables())
+        self.assertIsNone(ExtraView.get_source_tables())
+
+    def test_source_tables_stop_at_materialised_views(self):
+        self.assertEqual(DependentMaterializedView.get_source_tables(), ['views.test_simplematerializedview'])
+
+    def test_refresh_is_skipped_when_source_tables_are_unchanged(self):
+        refresh_materialized_view(SimpleMaterializedView)
+
+        self.assertFalse(refresh_materialized_view(SimpleMaterializedView, only_if_stale=True))
+
+    def test_refresh_happens_when_source_tables_changed(self):
+        refresh_materialized_view(SimpleMaterializedView)
+        test_data = self._add_row()
+
+        self.assertTrue(refresh_materialized_view(SimpleMaterializedView, only_if_stale=True))
+        self.assertEqual(
+            self._execute_raw_sql('SELECT id FROM "views"."test_simplematerializedview";'),
+            [(test_data.id,)]
+        )
+
+    def test_refresh_happens_once_materialised_source_views_are_refreshed(self):
+        refresh_materialized_view(DependentMaterializedView)
+        test_data = self._add_row()
+
+        # The upstream view hasn't been refreshed yet, so the downstream view is still up to date with it
+        self.assertFalse(refresh_materialized_view(DependentMaterializedView, only_if_stale=True))
+        refresh_materialized_view(SimpleMaterializedView)
+
+        self.assertTrue(refresh_materialized_view(DependentMaterializedView, only_if_stale=True))
+        self.assertEqual(
+            self._execute_raw_sql('SELECT id FROM "views"."test_dependentmaterializedview";'),
+            [(test_data.id,)]
+        )
+
+
+class TestCompiledSQLCache(TestCase):
+
+    def setUp(self):
+        clear_compiled_sql_cache()
+        self.addCleanup(clear_compiled_sql_cache)
+
+    def test_queryset_is_compiled_once(self):
+        with mock.patch.object(
+            SimpleViewFromQueryset, 'get_queryset', return_value=TestModel.objects.values()
+        ) as get_queryset_mock:
+            SimpleViewFromQueryset.creation_sql
+            SimpleViewFromQueryset.fingerprint
+
+        get_queryset_mock.assert_called_once_with()
+
+    def test_queryset_is_recompiled_once_cleared(self):
+        with mock.patch.object(
+            SimpleViewFromQueryset, 'get_queryset', return_value=TestModel.objects.values()
+        ) as get_queryset_mock:
+            SimpleViewFromQueryset.creation_sql
+            clear_compiled_sql_cache(SimpleViewFromQueryset)
+            SimpleViewFromQueryset.creation_sql
+
+        self.assertEqual(get_queryset_mock.call_count, 2)
+
+    def test_referenced_views_are_found_once(self):
+        with mock.patch.object(
+            DependentView, '_get_referenced_view_names', wraps=DependentView._get_referenced_view_names
+        ) as get_referenced_view_names_mock:
+            DependentView.get_dependencies()
+            dependencies = DependentView.get_dependencies()
+            clear_compiled_sql_cache(DependentView)
+            DependentView.get_dependencies()
+
+        self.assertIn(SimpleViewFromSQL, dependencies)
+        self.assertEqual(get_referenced_view_names_mock.call_count, 2)
+
+    def test_referenced_views_are_found_again_once_views_are_registered(self):
+        DependentView.get_dependencies()
+
+        class NewView(PostgresViewFromSQL):
+            sql = 'SELECT 1'
+
+        self.addCleanup(registry['default'].discard, NewView)
+        sql = ParameterisedSQL(sql='SELECT * FROM views.newview', params=[])
+        with mock.patch.object(DependentView, '_parameterised_sql', sql):
+            self.assertEqual(DependentView.get_dependencies(), set(DependentView.view_dependencies) | {NewView})
+
+
+class TestViewRegistration(TestCase):
+
+    def test_views_modules_are_discovered(self):
+        self.assertEqual(discover_views_modules(), ['test_app.postgres_views'])
+
+    @override_settings(DJANGO_ORM_VIEWS_LAZY_REGISTRATION=True)
+    def test_lazy_registration_does_not_import_views_on_startup(self):
+        with mock.patch('django_orm_views.apps.register_all_views') as register_all_views_mock:
+            apps.get_app_config('django_orm_views').ready()
+
+        register_all_views_mock.assert_not_called()
+
+    def test_views_are_imported_on_startup_by_default(self):
+        with mock.patch('django_orm_views.apps.register_all_views') as register_all_views_mock:
+            apps.get_app_config('django_orm_views').ready()
+
+        register_all_views_mock.assert_called_once_with()
+
+
+class TestBatchedSync(BaseTestCase):
+
+    def test_batched_sync_uses_fewer_round_trips(self):
+        with CaptureQueriesContext(connection) as unbatched_queries:
+            sync_views()
+        with CaptureQueriesContext(connection) as batched_queries:
+            sync_views(batched=True)
+
+        self.assertLess(len(batched_queries), len(unbatched_queries))
+
+    def test_batched_sync_creates_dependent_views(self):
+        sync_views(batched=True)
+
+        self.assertEqual(self._execute_raw_sql('SELECT * FROM "views"."test_dependentview";'), [])
+
+    def test_select_is_granted_on_views(self):
+        self._execute_raw_sql("CREATE ROLE test_reader; SELECT 1;")
+
+        sync_views(grant_select_permissions_to_user='test_reader', batched=True)
+
+        self.assertEqual(
+            self._execute_raw_sql(
+                "SELECT has_table_privilege('test_reader', 'views.test_simpleviewfromsql', 'SELECT');"
+            ),
+            [(True,)]
+        )
+
+
+class TestParallelDatabaseSync(BaseTransactionTestCase):
+
+    def test_results_are_reported_per_database(self):
+        results = sync_views(parallel_databases=True)
+
+        self.assertEqual(list(results), ['default'])
+        self.assertIsNone(results['default'].error)
+        self.assertGreater(results['default'].views_synced, 0)
+
+    def test_failures_are_reported_once_all_databases_are_synced(self):
+        with mock.patch('django_orm_views.sync._sync_database', side_effect=Exception('Sync failed')):
+            with self.assertRaises(ViewSyncError) as context:
+                sync_views(parallel_databases=True)
+
+        self.assertEqual(str(context.exception.results['default'].error), 'Sync failed')
+
+
+class TestTopologicalSort(TestCase):
+
+    def test_levels_respect_dependencies(self):
+        levels = topological_levels([DependentView, SimpleViewFromSQL, SimpleViewFromQueryset])
+
+        self.assertEqual(levels, [[SimpleViewFromQueryset, SimpleViewFromSQL], [DependentView]])
+
+    def test_cycles_are_reported(self):
+        class CycleA(PostgresViewFromSQL, should_register=False):
+            sql = 'SELECT 1'
+
+        class CycleB(PostgresViewFromSQL, should_register=False):
+            sql = 'SELECT 1'
+            view_dependencies = [CycleA]
+
+        class CycleC(PostgresViewFromSQL, should_register=False):
+            sql = 'SELECT 1'
+            view_dependencies = [CycleB]
+
+        CycleA.view_dependencies = [CycleB]
+
+        with self.assertRaises(CyclicDependencyError) as context:
+            topological_sort_views([CycleA, CycleB, CycleC, SimpleViewFromSQL])
+
+        self.assertEqual(context.exception.cycle, [CycleA, CycleB, CycleA])
+        self.assertIn('cyclea -> cycleb -> cyclea', str(context.exception))
+
+    def test_cycles_are_reported_by_refreshes(self):
+        class MaterialisedCycleA(PostgresMaterialisedViewMixin, PostgresViewFromSQL, should_register=False):
+            sql = 'SELECT 1'
+
+        class MaterialisedCycleB(PostgresMaterialisedViewMixin, PostgresViewFromSQL, should_register=False):
+            sql = 'SELECT 1'
+            view_dependencies = [MaterialisedCycleA]
+
+        MaterialisedCycleA.view_dependencies = [MaterialisedCycleB]
+
+        with self.assertRaises(CyclicDependencyError) as context:
+            refresh_materialized_views([MaterialisedCycleA, MaterialisedCycleB])
+
+        self.assertEqual(context.exception.cycle, [MaterialisedCycleA, MaterialisedCycleB, MaterialisedCycleA])
+        self.assertIn('materialisedcyclea -> materialisedcycleb -> materialisedcyclea', str(context.exception))
+
+    def test_dependencies_are_inferred_from_sql(self):
+        class UndeclaredSQLView(PostgresViewFromSQL, should_register=False):
+            sql = 'SELECT * FROM views.test_simpleviewfromsql JOIN "views"."test_dependentview" USING (id)'
+
+        self.assertEqual(UndeclaredSQLView.get_dependencies(), {SimpleViewFromSQL, DependentView})
+        self.assertEqual(
+            topological_levels([UndeclaredSQLView, DependentView, SimpleViewFromSQL]),
+            [[SimpleViewFromSQL], [DependentView], [UndeclaredSQLView]],
+        )
+
+    def test_dependencies_are_inferred_from_querysets(self):
+        class UndeclaredQuerysetView(PostgresViewFromQueryset, should_register=False):
+            @classmethod
+            def get_queryset(cls):
+                return ReadableTestViewFromSQL.objects.filter(
+                    id__in=ReadableMaterializedTestView.objects.values('id')
+                ).values('id')
+
+        self.assertEqual(
+            UndeclaredQuerysetView.get_dependencies(), {ReadableTestViewFromSQL, ReadableMaterializedTestView}
+        )
+
+    def test_declared_dependencies_are_merged_with_inferred_ones(self):
+        class PartlyDeclaredView(PostgresViewFromSQL, should_register=False):
+            view_dependencies = [SimpleViewFromQueryset]
+            sql = 'SELECT * FROM views.test_simpleviewfromsql'
+
+        self.assertEqual(PartlyDeclaredView.get_dependencies(), {SimpleViewFromQueryset, SimpleViewFromSQL})
+        # Tables which aren't views of the package aren't dependencies
+        self.assertEqual(SimpleViewFromSQL.get_dependencies(), set())
+
+
+class TestMaterialisedViewIndexes(BaseTestCase):
+
+    def test_declared_indexes_are_created(self):
+        result = self._execute_raw_sql("""
+            SELECT indexname, indexdef FROM pg_indexes
+            WHERE schemaname = 'views' AND tablename = 'test_indexedmaterializedview'
+            ORDER BY indexname;
+        """)
+
+        self.assertEqual(
+            result,
+            [
+                (
+                    'test_indexed_datetime_brin',
+                    'CREATE INDEX test_indexed_datetime_brin ON views.test_indexedmaterializedview '
+                    'USING brin (datetime_col)'
+                ),
+                (
+                    'test_indexedmaterializedview_character_col_idx',
+                    'CREATE INDEX test_indexedmaterializedview_character_col_idx '
+                    'ON views.test_indexedmaterializedview USING hash (character_col)'
+                ),
+                (
+                    'test_indexedmaterializedview_id',
+                    'CREATE UNIQUE INDEX test_indexedmaterializedview_id '
+                    'ON views.test_indexedmaterializedview USING btree (id)'
+                ),
+                (
+                    'test_indexedmaterializedview_integer_col_date_col_idx',
+                    'CREATE INDEX test_indexedmaterializedview_integer_col_date_col_idx '
+                    'ON views.test_indexedmaterializedview USING btree (integer_col, date_col DESC) '
+                    'INCLUDE (character_col) WHERE (integer_col > 0)'
+                ),
+            ]
+        )
+
+
+class TestConcurrentIndexBuilds(BaseTransactionTestCase):
+
+    def test_indexes_are_built_concurrently_after_sync(self):
+        with CaptureQueriesContext(connection) as queries:
+            sync_views(concurrent_indexes=True)
+
+        concurrent_index_statements = [
+            query['sql'] for query in queries.captured_queries if 'CREATE INDEX CONCURRENTLY' in query['sql']
+        ]
+        self.assertEqual(len(concurrent_index_statements), 3)
+
+        result = self._execute_raw_sql("""
+            SELECT cls.relname, idx.indisvalid FROM pg_index idx
+            JOIN pg_class cls ON cls.oid = idx.indexrelid
+            JOIN pg_class tbl ON tbl.oid = idx.indrelid
+            WHERE tbl.relname = 'test_indexedmaterializedview'
+            ORDER BY cls.relname;
+        """)
+        self.assertEqual(
+            result,
+            [
+                ('test_indexed_datetime_brin', True),
+                ('test_indexedmaterializedview_character_col_idx', True),
+                ('test_indexedmaterializedview_id', True),
+                ('test_indexedmaterializedview_integer_col_date_col_idx', True),
+            ]
+        )
+
+    def test_incremental_sync_only_builds_indexes_of_rebuilt_views(self):
+        with CaptureQueriesContext(connection) as queries:
+            sync_views(incremental=True, concurrent_indexes=True)
+
+        self.assertFalse(
+            any('CREATE INDEX CONCURRENTLY' in query['sql'] for query in queries.captured_queries)
+        )
+
+    def test_concurrent_indexes_cannot_be_built_in_a_transaction(self):
+        with transaction.atomic():
+            with self.assertRaises(ValueError):
+                sync_views(concurrent_indexes=True)
+
+    def test_concurrent_indexes_are_checked_once_views_are_registered(self):
+        views_by_database = {database: set(views) for database, views in registry.items()}
+
+        with mock.patch.dict(registry, clear=True), mock.patch(
+            'django_orm_views.sync.register_all_views', side_effect=lambda: registry.update(views_by_database)
+        ):
+            with transaction.atomic():
+                with self.assertRaisesMessage(ValueError, 'concurrently'):
+                    sync_views(concurrent_indexes=True)
+
+
+class TestDeferredPopulation(BaseTransactionTestCase):
+
+    def setUp(self):
+        self.test_data = TestModel.objects.create(
+            integer_col=2,
+            character_col='A',
+            date_col=datetime.date(2019, 1, 1),
+            datetime_col=datetime.datetime(2019, 1, 1),
+        )
+        sync_views(defer_population=True)
+
+    def _get_unpopulated_view_names(self):
+        result = self._execute_raw_sql("""
+            SELECT matviewname FROM pg_matviews
+            WHERE schemaname = 'views' AND NOT ispopulated
+            ORDER BY matviewname;
+        """)
+        return [name for name, in result]
+
+    def test_materialised_views_are_created_with_no_data(self):
+        self.assertEqual(
+            self._get_unpopulated_view_names(),
+            [
+                'test_dependentmaterializedview',
+                'test_indexedmaterializedview',
+                'test_readablematerializedtestview',
+                'test_simplematerializedview',
+            ]
+        )
+
+    def test_populates_views_in_dependency_order(self):
+        populated = populate_materialized_views(max_workers=2)
+
+        self.assertEqual(
+            set(populated),
+            {
+                SimpleMaterializedView,
+                DependentMaterializedView,
+                IndexedMaterializedView,
+                ReadableMaterializedTestView,
+                DailyPartitionedView,
+            },
+        )
+        self.assertLess(populated.index(SimpleMaterializedView), populated.index(DependentMaterializedView))
+        self.assertEqual(self._get_unpopulated_view_names(), [])
+        result = self._execute_raw_sql("""
+            SELECT id FROM "views"."test_dependentmaterializedview";
+        """)
+        self.assertEqual(result, [(self.test_data.id,)])
+
+    def test_population_resumes_from_unpopulated_views(self):
+        refresh_materialized_view(SimpleMaterializedView)
+
+        populated = populate_materialized_views()
+
+        self.assertEqual(
+            set(populated),
+            {DependentMaterializedView, IndexedMaterializedView, ReadableMaterializedTestView, DailyPartitionedView},
+        )
+        self.assertEqual(populate_materialized_views(), [])
+
+    def test_cannot_defer_population_in_blue_green_sync(self):
+        with self.assertRaises(ValueError):
+            sync_views(blue_green=True, defer_population=True)
+
+
+class TestIncrementalAggregateView(BaseTestCase):
+
+    def setUp(self):
+        TestModel.objects.bulk_create([
+            TestModel(integer_col=1, character_col='A', date_col=datetime.date(2019, 1, 1), datetime_col=NOW),
+            TestModel(integer_col=2, character_col='A', date_col=datetime.date(2019, 1, 2), datetime_col=NOW),
+            TestModel(integer_col=0, character_col='B', date_col=datetime.date(2019, 1, 1), datetime_col=NOW),
+        ])
+        super().setUp()
+
+    def _get_aggregates(self):
+        return self._execute_raw_sql("""
+            SELECT character_col, total, row_count, first_date, last_date
+            FROM views.test_characteraggregateview
+            ORDER BY character_col;
+        """)
+
+    def test_table_is_populated_on_sync(self):
+        self.assertEqual(
+            self._get_aggregates(),
+            [('A', 3, 2, datetime.date(2019, 1, 1), datetime.date(2019, 1, 2))]
+        )
+
+    def test_inserted_rows_are_merged(self):
+        TestModel.objects.bulk_create([
+            TestModel(integer_col=5, character_col='A', date_col=datetime.date(2018, 1, 1), datetime_col=NOW),
+            TestModel(integer_col=4, character_col='B', date_col=datetime.date(2019, 1, 5), datetime_col=NOW),
+            TestModel(integer_col=-1, character_col='C', date_col=datetime.date(2019, 1, 5), datetime_col=NOW),
+        ])
+
+        self.assertEqual(
+            self._get_aggregates(),
+            [
+                ('A', 8, 3, datetime.date(2018, 1, 1), datetime.date(2019, 1, 2)),
+                ('B', 4, 1, datetime.date(2019, 1, 5), datetime.date(2019, 1, 5)),
+            ]
+        )
+
+    def test_groups_of_updated_and_deleted_rows_are_recomputed(self):
+        TestModel.objects.filter(date_col=datetime.date(2019, 1, 2)).update(character_col='B')
+        self.assertEqual(
+            self._get_aggregates(),
+            [
+                ('A', 1, 1, datetime.date(2019, 1, 1), datetime.date(2019, 1, 1)),
+                ('B', 2, 1, datetime.date(2019, 1, 2), datetime.date(2019, 1, 2)),
+            ]
+        )
+
+        TestModel.objects.filter(character_col='A').delete()
+        self.assertEqual(
+            self._get_aggregates(),
+            [('B', 2, 1, datetime.date(2019, 1, 2), datetime.date(2019, 1, 2))]
+        )
+
+    def test_recomputed_groups_are_filtered_before_being_aggregated(self):
+        # Stands in for the transition table of the trigger
+        self._execute_raw_sql(
+            "CREATE TEMPORARY TABLE deleted_rows AS SELECT 'A'::varchar AS character_col; SELECT 1;"
+        )
+        parameterised_sql = CharacterAggregateView._compiled_sql
+        groups_sql = CharacterAggregateView._get_groups_sql(
+            parameterised_sql.sql, 'SELECT "character_col" FROM deleted_rows'
+        )
+
+        [[plan]] = self._execute_raw_sql(f'EXPLAIN (FORMAT JSON) {groups_sql}', parameterised_sql.params)
+
+        def _walk(node):
+            yield node
+            for child in node.get('Plans', []):
+                yield from _walk(child)
+
+        # The source rows are joined with the changed groups before being aggregated, rather than the whole
+        # source table being aggregated and then filtered
+        [aggregate] = [
+            node for node in _walk(plan[0]['Plan'])
+            if node['Node Type'] == 'Aggregate' and 'test_app_testmodel' in str(node.get('Group Key'))
+        ]
+        self.assertIn('deleted_rows', [node.get('Relation Name') for node in _walk(aggregate)])
+        self.assertEqual(
+            self._execute_raw_sql(groups_sql, parameterised_sql.params),
+            [('A', 3, 2, datetime.date(2019, 1, 1), datetime.date(2019, 1, 2))],
+        )
+
+    def test_triggers_are_dropped_with_the_view(self):
+        sync_views()
+        sync_views(incremental=True)
+        with mock.patch.object(CharacterAggregateView, 'prefix', 'renamed'):
+            clear_compiled_sql_cache(CharacterAggregateView)
+            try:
+                sync_views(incremental=True)
+            finally:
+                clear_compiled_sql_cache(CharacterAggregateView)
+
+        result = self._execute_raw_sql("""
+            SELECT count(*) FROM pg_trigger
+            WHERE tgrelid = 'test_app_testmodel'::regclass AND NOT tgisinternal;
+        """)
+        self.assertEqual(result, [(4,)])
+
+    def test_unsupported_querysets_are_rejected(self):
+        class NullableGroupView(IncrementalAggregateView, should_register=False):
+            @classmethod
+            def get_queryset(cls):
+                return TestModelWithForeignKey.objects.values('foreign_key').annotate(row_count=Count('id'))
+
+        class AverageView(IncrementalAggregateView, should_register=False):
+            @classmethod
+            def get_queryset(cls):
+                return TestModel.objects.values('character_col').annotate(average=Avg('integer_col'))
+
+        for view in (NullableGroupView, AverageView):
+            with self.subTest(view=view.__name__), self.assertRaises(InvalidAggregateView):
+                view.get_creation_sql()
+
+
+class TestWatermarkRefresh(BaseTestCase):
+
+    def setUp(self):
+        self.first_row = TestModel.objects.create(
+            integer_col=1, character_col='A', date_col=datetime.date(2019, 1, 1), datetime_col=NOW
+        )
+        super().setUp()
+
+    def _get_rows(self):
+        return self._execute_raw_sql("""
+            SELECT id, integer_col, character_col FROM views.test_watermarkedview ORDER BY id;
+        """)
+
+    def _create_row(self, integer_col):
+        return TestModel.objects.create(
+            integer_col=integer_col, character_col='B', date_col=datetime.date(2019, 1, 1), datetime_col=NOW
+        )
+
+    def test_only_rows_beyond_the_watermark_are_inserted(self):
+        self.assertEqual(refresh_incremental(WatermarkedView), 0)
+
+        new_row = self._create_row(2)
+        self._create_row(0)
+        self.assertEqual(refresh_incremental(WatermarkedView), 1)
+        self.assertEqual(refresh_incremental(WatermarkedView), 0)
+
+        self.assertEqual(self._get_rows(), [(self.first_row.id, 1, 'A'), (new_row.id, 2, 'B')])
+        result = self._execute_raw_sql("""
+            SELECT watermark FROM views_catalog.view_watermark WHERE view_name = 'test_watermarkedview';
+        """)
+        self.assertEqual(result, [(str(new_row.id),)])
+
+    def test_refresh_populates_views_created_with_no_data(self):
+        sync_views(defer_population=True)
+        self.assertEqual(self._get_rows(), [])
+
+        self.assertEqual(refresh_incremental(WatermarkedView), 1)
+        self.assertEqual(self._get_rows(), [(self.first_row.id, 1, 'A')])
+
+    def test_conflicts_are_ignored_for_views_with_only_a_pk_field(self):
+        class KeyOnlyView(WatermarkRefreshMixin, PostgresViewFromQueryset, should_register=False):
+            watermark_field = 'id'
+            pk_field = 'id'
+
+            @classmethod
+            def get_queryset(cls):
+                return TestModel.objects.values('id')
+
+        creation_sql = KeyOnlyView.get_creation_sql()
+        self._execute_raw_sql(creation_sql.sql + 'SELECT 1;', creation_sql.params)
+        refresh_sql = KeyOnlyView.get_incremental_refresh_sql(None, ['id'])
+
+        self.assertIn('DO NOTHING', refresh_sql.sql)
+        # Every row is already in the view, so none of them is inserted again
+        self.assertEqual(self._execute_raw_sql(refresh_sql.sql, refresh_sql.params), [(None, 0)])
+
+    def test_sync_resets_the_watermark(self):
+        self._create_row(2)
+        refresh_incremental(WatermarkedView)
+
+        sync_views()
+
+        result = self._execute_raw_sql("""
+            SELECT count(*) FROM views_catalog.view_watermark WHERE view_name = 'test_watermarkedview';
+        """)
+        self.assertEqual(result, [(0,)])
+        self.assertEqual(refresh_incremental(WatermarkedView), 0)
+
+
+class TestInstrumentationSignals(BaseTestCase):
+
+    def _receive(self, signal):
+        received = []
+
+        def receiver(sender, metrics, **kwargs):
+            received.append((sender, metrics))
+
+        signal.connect(receiver)
+        self.addCleanup(signal.disconnect, receiver)
+        return received
+
+    def test_view_refreshed_is_sent_with_metrics(self):
+        TestModel.objects.create(
+            integer_col=1, character_col='A', date_col=datetime.date(2019, 1, 1), datetime_col=NOW
+        )
+        received = self._receive(view_refreshed)
+
+        refresh_materialized_view(SimpleMaterializedView, concurrently=True)
+
+        [(sender, metrics)] = received
+        self.assertEqual(sender, SimpleMaterializedView)
+        self.assertEqual(metrics.database, 'default')
+        self.assertEqual(metrics.rows, 1)
+        self.assertGreater(metrics.relation_size, 0)
+        self.assertGreaterEqual(metrics.duration, 0)
+        self.assertEqual(metrics.lock_wait, 0)
+        self.assertTrue(metrics.concurrently)
+
+    def test_incremental_refresh_reports_the_inserted_rows(self):
+        TestModel.objects.create(
+            integer_col=1, character_col='A', date_col=datetime.date(2019, 1, 1), datetime_col=NOW
+        )
+        received = self._receive(view_refreshed)
+
+        refresh_incremental(WatermarkedView)
+
+        [(sender, metrics)] = received
+        self.assertEqual(sender, WatermarkedView)
+        self.assertEqual(metrics.rows, 1)
+        self.assertFalse(metrics.concurrently)
+
+    def test_view_synced_is_sent_for_each_view(self):
+        received = self._receive(view_synced)
+
+        sync_views(batched=True)
+
+        metrics_by_view = dict(received)
+        self.assertEqual(set(metrics_by_view), registry['default'])
+        self.assertIsNone(metrics_by_view[SimpleViewFromQueryset].rows)
+        self.assertEqual(metrics_by_view[SimpleViewFromQueryset].relation_size, 0)
+        self.assertEqual(metrics_by_view[SimpleMaterializedView].rows, 0)
+
+    def test_metrics_are_not_gathered_without_receivers(self):
+        with CaptureQueriesContext(connection) as queries:
+            refresh_materialized_view(SimpleMaterializedView)
+            sync_views()
+
+        self.assertFalse(any('pg_total_relation_size' in query['sql'] for query in queries.captured_queries))
+
+
+class TestExplainViews(BaseTestCase):
+
+    def test_reports_every_view_most_expensive_first(self):
+        reports = explain_views()
+
+        self.assertEqual({report.view for report in reports}, registry['default'])
+        self.assertEqual([report.error for report in reports], [None] * len(reports))
+        costs = [report.total_cost for report in reports]
+        self.assertEqual(costs, sorted(costs, reverse=True))
+
+    def test_sequential_scans_of_large_tables_are_reported(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE test_app_testmodel;')
+
+        report = explain_view(WatermarkedView, large_table_rows=0)
+
+        [scan] = report.sequential_scans
+        self.assertEqual(scan.table, 'public.test_app_testmodel')
+        self.assertIn('integer_col > 0', scan.filter)
+        self.assertEqual(len(report.missing_index_hints), 1)
+        self.assertEqual(explain_view(WatermarkedView).sequential_scans, [])
+
+    def test_analyze_executes_the_plan(self):
+        report = explain_view(SimpleViewFromQueryset, analyze=True, sample_limit=10)
+
+        self.assertIsNotNone(report.execution_time)
+
+    def test_analyze_reports_the_estimates_of_the_whole_view(self):
+        report = explain_view(SimpleViewFromQueryset)
+        sampled_report = explain_view(SimpleViewFromQueryset, analyze=True, sample_limit=1)
+
+        self.assertGreater(report.plan_rows, 1)
+        self.assertEqual(sampled_report.plan_rows, report.plan_rows)
+        self.assertEqual(sampled_report.total_cost, report.total_cost)
+
+    def test_views_failing_to_explain_are_reported(self):
+        class MissingDependencyView(PostgresViewFromSQL, should_register=False):
+            sql = 'SELECT * FROM views.doesnotexist'
+
+        report = explain_view(MissingDependencyView)
+
+        self.assertIn('doesnotexist', report.error)
+        # The transaction is still usable
+        self.assertEqual(self._execute_raw_sql('SELECT 1;'), [(1,)])
+
+    def test_command_outputs_json(self):
+        stdout = io.StringIO()
+
+        call_command('explain_views', 'test_simpleviewfromqueryset', '--json', stdout=stdout)
+
+        [report] = json.loads(stdout.getvalue())
+        self.assertEqual(report['view'], 'test_simpleviewfromqueryset')
+        self.assertGreater(report['total_cost'], 0)
+
+
+class TestViewRefresher(TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        refresh_patcher = mock.patch('django_orm_views.scheduler._refresh_materialized_view_in_thread')
+        self.refresh_mock = refresh_patcher.start()
+        self.addCleanup(refresh_patcher.stop)
+        self.refresh_mock.return_value = True
+
+        class HourlyView(PostgresMaterialisedViewMixin, PostgresViewFromSQL, should_register=False):
+            refresh_policy = RefreshPolicy(interval=datetime.timedelta(hours=1))
+            sql = 'SELECT 1'
+
+        class DependentHourlyView(PostgresMaterialisedViewMixin, PostgresViewFromSQL, should_register=False):
+            view_dependencies = [HourlyView]
+            refresh_policy = RefreshPolicy(
+                interval=datetime.timedelta(hours=1), max_staleness=datetime.timedelta(hours=6), concurrently=True
+            )
+            sql = 'SELECT 1'
+
+        self.view, self.dependent_view = HourlyView, DependentHourlyView
+
+    def _get_refresher(self, views, **kwargs):
+        refresher = ViewRefresher(views, jitter=0, clock=lambda: self.now, **kwargs)
+        self.addCleanup(refresher._executor.shutdown)
+        return refresher
+
+    def _tick_and_wait(self, refresher):
+        refresher.tick()
+        futures.wait(list(refresher._running.values()))
+
+    def test_views_are_refreshed_every_interval(self):
+        refresher = self._get_refresher([self.view])
+
+        self._tick_and_wait(refresher)
+        self.now = 3599
+        self._tick_and_wait(refresher)
+        self.assertEqual(self.refresh_mock.call_count, 1)
+
+        self.now = 3600
+        self._tick_and_wait(refresher)
+        self.assertEqual(self.refresh_mock.call_count, 2)
+        self.refresh_mock.assert_called_with(self.view, False, False, skip_if_locked=True)
+
+    def test_failures_are_retried_with_backoff(self):
+        self.refresh_mock.side_effect = Exception('Refresh failed')
+        refresher = self._get_refresher([self.view], retry_delay=datetime.timedelta(seconds=10))
+
+        call_times = []
+        for self.now in range(0, 100):
+            calls = self.refresh_mock.call_count
+            self._tick_and_wait(refresher)
+            if self.refresh_mock.call_count > calls:
+                call_times.append(self.now)
+
+        self.assertEqual(call_times, [0, 10, 30, 70])
+
+    def test_dependents_wait_for_their_dependencies(self):
+        started, release = threading.Event(), threading.Event()
+
+        def refresh(view, concurrently, only_if_stale, **kwargs):
+            if view is self.view:
+                started.set()
+                release.wait()
+            return True
+
+        self.refresh_mock.side_effect = refresh
+        self.addCleanup(release.set)
+        refresher = self._get_refresher([self.view, self.dependent_view], max_workers=2)
+
+        refresher.tick()
+        self.assertTrue(started.wait(timeout=5))
+        self.assertEqual(set(refresher._running), {self.view})
+
+        release.set()
+        futures.wait(list(refresher._running.values()))
+        self._tick_and_wait(refresher)
+        self.refresh_mock.assert_called_with(self.dependent_view, True, False, skip_if_locked=True)
+
+    def test_only_stale_views_are_refreshed_within_max_staleness(self):
+        # The source tables never change, so refreshes are skipped whenever they're only if stale
+        self.refresh_mock.side_effect = lambda view, concurrently, only_if_stale, **kwargs: not only_if_stale
+        refresher = self._get_refresher([self.dependent_view])
+
+        for self.now in (0, 3600, 6 * 3600):
+            self._tick_and_wait(refresher)
+
+        self.assertEqual(
+            self.refresh_mock.call_args_list,
+            [
+                mock.call(self.dependent_view, True, False, skip_if_locked=True),
+                mock.call(self.dependent_view, True, True, skip_if_locked=True),
+                mock.call(self.dependent_view, True, False, skip_if_locked=True),
+            ]
+        )
+
+    def test_refreshes_only_start_within_the_window(self):
+        self.view.refresh_policy = RefreshPolicy(
+            interval=datetime.timedelta(hours=1),
+            window_start=datetime.time(22),
+            window_end=datetime.time(6),
+        )
+        refresher = self._get_refresher([self.view])
+
+        with mock.patch('django_orm_views.scheduler._get_time_of_day', return_value=datetime.time(12)):
+            self._tick_and_wait(refresher)
+        self.refresh_mock.assert_not_called()
+
+        with mock.patch('django_orm_views.scheduler._get_time_of_day', return_value=datetime.time(23)):
+            self._tick_and_wait(refresher)
+        self.refresh_mock.assert_called_once()
+
+    def test_dependencies_outside_their_window_do_not_hold_back_dependents(self):
+        self.view.refresh_policy = RefreshPolicy(
+            interval=datetime.timedelta(hours=1),
+            window_start=datetime.time(22),
+            window_end=datetime.time(6),
+        )
+        refresher = self._get_refresher([self.view, self.dependent_view])
+
+        with mock.patch('django_orm_views.scheduler._get_time_of_day', return_value=datetime.time(12)):
+            self._tick_and_wait(refresher)
+
+        self.refresh_mock.assert_called_once_with(self.dependent_view, True, False, skip_if_locked=True)
+
+    def test_views_need_a_refresh_policy(self):
+        with self.assertRaises(ValueError):
+            ViewRefresher([SimpleMaterializedView])
+
+    def test_policies_are_validated(self):
+        with self.assertRaises(ValueError):
+            RefreshPolicy(interval=datetime.timedelta(0))
+        with self.assertRaises(ValueError):
+            RefreshPolicy(interval=datetime.timedelta(hours=1), window_start=datetime.time(22))
+
+
+class TestAdvisoryLocks(SyncViewsMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # The locks are held from a separate session, as they're reentrant within a session
+        self.other_connection = connection.get_new_connection(connection.get_connection_params())
+        self.other_connection.autocommit = True
+        self.addCleanup(self.other_connection.close)
+
+    def _hold_lock(self, name):
+        cursor = self.other_connection.cursor()
+        lock = advisory_lock(cursor, name)
+        lock.__enter__()
+        self.addCleanup(lock.__exit__, None, None, None)
+
+    def test_sync_is_skipped_if_locked(self):
+        self._hold_lock(SYNC_LOCK_NAME)
+
+        results = sync_views(skip_if_locked=True)
+
+        self.assertTrue(results['default'].skipped)
+        self.assertEqual(results['default'].views_synced, 0)
+
+    def test_sync_times_out_waiting_for_the_lock(self):
+        self._hold_lock(SYNC_LOCK_NAME)
+
+        with self.assertRaises(AdvisoryLockTimeout):
+            sync_views(lock_timeout=0.1)
+
+    def test_refresh_is_skipped_if_locked(self):
+        self._hold_lock(get_refresh_lock_name(SimpleMaterializedView))
+
+        self.assertFalse(refresh_materialized_view(SimpleMaterializedView, skip_if_locked=True))
+        # Other views aren't affected by the lock
+        self.assertTrue(refresh_materialized_view(DependentMaterializedView, skip_if_locked=True))
+
+    def test_refresh_times_out_waiting_for_the_lock(self):
+        self._hold_lock(get_refresh_lock_name(SimpleMaterializedView))
+
+        with self.assertRaises(AdvisoryLockTimeout):
+            refresh_materialized_view(SimpleMaterializedView, lock_timeout=0.1)
+
+    def test_skipping_waits_for_the_timeout(self):
+        self._hold_lock(SYNC_LOCK_NAME)
+
+        start = time.monotonic()
+        with connection.cursor() as cursor:
+            with advisory_lock(cursor, SYNC_LOCK_NAME, skip_if_locked=True, timeout=0.2) as acquired:
+                self.assertFalse(acquired)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+    def test_incremental_refresh_is_skipped_if_locked(self):
+        self._hold_lock(get_refresh_lock_name(WatermarkedView))
+
+        self.assertEqual(refresh_incremental(WatermarkedView, skip_if_locked=True), 0)
+
+    def test_locks_are_released(self):
+        self.assertTrue(refresh_materialized_view(SimpleMaterializedView))
+        sync_views()
+
+        with self.other_connection.cursor() as cursor:
+            with advisory_lock(cursor, SYNC_LOCK_NAME, skip_if_locked=True) as acquired:
+                self.assertTrue(acquired)
+            with advisory_lock(cursor, get_refresh_lock_name(SimpleMaterializedView), skip_if_locked=True) as acquired:
+                self.assertTrue(acquired)
+
+
+    def test_refresh_errors_within_transactions_release_the_lock(self):
+        with mock.patch.object(SimpleMaterializedView, 'get_refresh_sql', return_value='SELECT 1 / 0;'):
+            with self.assertRaisesMessage(DataError, 'division by zero'):
+                with transaction.atomic():
+                    refresh_materialized_view(SimpleMaterializedView)
+
+        with self.other_connection.cursor() as cursor:
+            with advisory_lock(cursor, get_refresh_lock_name(SimpleMaterializedView), skip_if_locked=True) as acquired:
+                self.assertTrue(acquired)
+
+
+class TestViewFreshness(SyncViewsMixin, TestCase):
+
+    def _add_row(self, integer_col=1, character_col='a'):
+        return TestModel.objects.create(
+            integer_col=integer_col, character_col=character_col, date_col=NOW.date(), datetime_col=NOW
+        )
+
+    def test_sync_records_materialised_views_as_refreshed(self):
+        last_refresh = ReadableMaterializedTestView.get_last_refresh()
+
+        self.assertIsNotNone(last_refresh)
+        self.assertLessEqual(last_refresh.started_at, last_refresh.finished_at)
+        self.assertIsNone(last_refresh.rows)
+        # Plain views are always up to date
+        self.assertIsNone(SimpleViewFromQueryset.last_refreshed())
+
+    def test_refreshes_are_recorded(self):
+        self._add_row()
+        self._add_row()
+        synced_at = ReadableMaterializedTestView.last_refreshed()
+
+        refresh_materialized_view(ReadableMaterializedTestView)
+
+        last_refresh = ReadableMaterializedTestView.get_last_refresh()
+        self.assertGreater(last_refresh.started_at, synced_at)
+        self.assertIsNone(last_refresh.rows)
+        self.assertGreaterEqual(last_refresh.duration, 0)
+        self.assertEqual(ReadableMaterializedTestView.last_refreshed(), last_refresh.started_at)
+
+    def test_rows_are_only_counted_on_demand(self):
+        self._add_row()
+        self._add_row()
+
+        with CaptureQueriesContext(connection) as queries:
+            refresh_materialized_view(ReadableMaterializedTestView)
+        self.assertFalse(any('count(*)' in query['sql'] for query in queries.captured_queries))
+
+        refresh_materialized_view(ReadableMaterializedTestView, count_rows=True)
+        self.assertEqual(ReadableMaterializedTestView.get_last_refresh().rows, 2)
+
+    def test_catalog_is_only_created_once(self):
+        refresh_materialized_view(ReadableMaterializedTestView)
+
+        with CaptureQueriesContext(connection) as queries:
+            refresh_materialized_view(ReadableMaterializedTestView)
+        self.assertFalse(any('CREATE' in query['sql'] for query in queries.captured_queries))
+
+    def test_incremental_refreshes_are_recorded(self):
+        synced_at = WatermarkedView.last_refreshed()
+
+        refresh_incremental(WatermarkedView)
+
+        self.assertGreater(WatermarkedView.last_refreshed(), synced_at)
+
+    def test_deferred_views_are_not_refreshed_until_populated(self):
+        sync_views(defer_population=True)
+        self.assertIsNone(ReadableMaterializedTestView.last_refreshed())
+
+        refresh_materialized_view(ReadableMaterializedTestView)
+        self.assertIsNotNone(ReadableMaterializedTestView.last_refreshed())
+
+    def test_fresh_views_are_read_as_is(self):
+        self._add_row()
+
+        self.assertEqual(ReadableMaterializedTestView.objects.fresh_within(datetime.timedelta(hours=1)).count(), 0)
+
+    def test_stale_views_are_computed_from_their_sql(self):
+        row = self._add_row(character_col='b')
+        self._add_row(integer_col=0)
+        self._add_row()
+
+        with mock.patch('django_orm_views.views.timezone.now') as now_mock:
+            now_mock.return_value = ReadableMaterializedTestView.last_refreshed() + datetime.timedelta(hours=2)
+            queryset = ReadableMaterializedTestView.objects.filter(character_col='b').fresh_within(
+                datetime.timedelta(hours=1)
+            )
+
+        self.assertEqual(list(queryset.values_list('id', flat=True)), [row.id])
+        self.assertEqual([view.id for view in queryset.order_by('id')], [row.id])
+        self.assertEqual(ReadableMaterializedTestView.objects.filter(character_col='b').count(), 0)
+
+    def test_stale_views_can_be_joined(self):
+        row = self._add_row()
+        TestModelWithForeignKey.objects.create(foreign_key=row)
+        with mock.patch('django_orm_views.views.timezone.now') as now_mock:
+            now_mock.return_value = ReadableMaterializedTestView.last_refreshed() + datetime.timedelta(hours=2)
+            queryset = ReadableMaterializedTestView.objects.fresh_within(datetime.timedelta(hours=1))
+
+        self.assertEqual(list(queryset.filter(id__in=TestModelWithForeignKey.objects.values('foreign_key'))), [
+            ReadableMaterializedTestView(id=row.id, character_col='a')
+        ])
+
+    def test_unpopulated_views_are_computed_from_their_sql(self):
+        sync_views(defer_population=True)
+        self._add_row()
+
+        self.assertEqual(ReadableMaterializedTestView.objects.fresh_within(datetime.timedelta(days=1)).count(), 1)
+
+    def test_plain_views_are_always_fresh(self):
+        self._add_row()
+
+        self.assertEqual(ReadableTestViewFromQueryset.objects.fresh_within(datetime.timedelta(0)).count(), 1)
+
+
+class TestCachedViewManager(SyncViewsMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = ReadableMaterializedTestView.cached_objects.cache
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+        self.row = TestModel.objects.create(integer_col=1, character_col='a', date_col=NOW.date(), datetime_col=NOW)
+        refresh_materialized_view(ReadableMaterializedTestView)
+
+    def test_results_are_cached(self):
+        queryset = ReadableMaterializedTestView.cached_objects.filter(character_col='a')
+        self.assertEqual([view.id for view in queryset], [self.row.id])
+        self.assertEqual(queryset.all().count(), 1)
+        self.assertEqual(ReadableMaterializedTestView.cached_objects.get(character_col='a').id, self.row.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual([view.id for view in queryset.all()], [self.row.id])
+            self.assertEqual(queryset.all().count(), 1)
+            self.assertEqual(ReadableMaterializedTestView.cached_objects.get(character_col='a').id, self.row.id)
+
+    def test_queries_are_keyed_by_their_sql(self):
+        manager = ReadableMaterializedTestView.cached_objects
+        self.assertEqual(list(manager.filter(character_col='a').values_list('id', flat=True)), [self.row.id])
+        self.assertEqual(list(manager.filter(character_col='b').values_list('id', flat=True)), [])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(list(manager.filter(character_col='a').values_list('id', flat=True)), [self.row.id])
+            self.assertEqual(list(manager.filter(character_col='b').values_list('id', flat=True)), [])
+        self.assertEqual(list(manager.filter(character_col='a').values('id')), [{'id': self.row.id}])
+
+    def test_refreshes_invalidate_the_results(self):
+        self.assertEqual(ReadableMaterializedTestView.cached_objects.count(), 1)
+        TestModel.objects.create(integer_col=2, character_col='b', date_col=NOW.date(), datetime_col=NOW)
+
+        self.assertEqual(ReadableMaterializedTestView.cached_objects.count(), 1)
+        refresh_materialized_view(ReadableMaterializedTestView)
+        self.assertEqual(ReadableMaterializedTestView.cached_objects.count(), 2)
+
+    def test_syncs_invalidate_the_results(self):
+        self.assertEqual(len(ReadableMaterializedTestView.cached_objects.all()), 1)
+        TestModel.objects.create(integer_col=2, character_col='b', date_col=NOW.date(), datetime_col=NOW)
+
+        sync_views()
+        self.assertEqual(len(ReadableMaterializedTestView.cached_objects.all()), 2)
+
+    def test_views_computed_from_their_sql_are_not_cached(self):
+        queryset = ReadableMaterializedTestView.cached_objects.fresh_within(datetime.timedelta(0))
+        self.assertEqual(queryset.count(), 1)
+
+        self.assertEqual(len(self.cache), 0)
+
+    def test_lru_cache_evicts_the_least_recently_used_results(self):
+        cache = LRUResultCache(max_entries=2)
+        cache.set(ReadableMaterializedTestView, 'a', [1])
+        cache.set(ReadableMaterializedTestView, 'b', [2])
+        cache.get(ReadableMaterializedTestView, 'a')
+        cache.set(ReadableMaterializedTestView, 'c', [3])
+
+        self.assertEqual(cache.get(ReadableMaterializedTestView, 'a'), [1])
+        self.assertIsNone(cache.get(ReadableMaterializedTestView, 'b'))
+        self.assertEqual(cache.get(ReadableMaterializedTestView, 'c'), [3])
+
+    def test_lru_cache_results_expire(self):
+        cache = LRUResultCache(timeout=60)
+        with mock.patch('django_orm_views.cache.time.monotonic', return_value=0):
+            cache.set(ReadableMaterializedTestView, 'a', [1])
+        with mock.patch('django_orm_views.cache.time.monotonic', return_value=60):
+            self.assertIsNone(cache.get(ReadableMaterializedTestView, 'a'))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_django_cache_results_are_invalidated(self):
+        cache = DjangoResultCache()
+        cache.set(ReadableMaterializedTestView, 'a', [1])
+        self.assertEqual(cache.get(ReadableMaterializedTestView, 'a'), [1])
+
+        cache.invalidate(ReadableMaterializedTestView)
+
+        self.assertIsNone(cache.get(ReadableMaterializedTestView, 'a'))
+
+
+class TestInlinedHiddenViews(BaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for integer_col, character_col in [(1, 'a'), (2, 'a'), (0, 'a'), (200, 'b'), (3, 'b')]:
+            TestModel.objects.create(
+                integer_col=integer_col, character_col=character_col, date_col=NOW.date(), datetime_col=NOW
+            )
+
+    def _execute_view_sql(self, view):
+        parameterised_sql = view._compiled_sql
+        return self._execute_raw_sql(
+            f'SELECT * FROM ({parameterised_sql.sql}) AS view ORDER BY 1', parameterised_sql.params
+        )
+
+    def test_hidden_views_are_inlined_dependencies_first(self):
+        self.assertEqual(InlinedDependentView.inlined_views, [HiddenPositiveView, HiddenReadableView])
+        self.assertEqual(HiddenReadableView.inlined_views, [])
+
+        sql = InlinedDependentView._compiled_sql.sql
+        self.assertTrue(sql.startswith('WITH "inlined_test_hiddenpositiveview" AS ('))
+        self.assertNotIn('"views"', sql)
+
+    def test_inlined_views_return_the_same_rows(self):
+        result = self._execute_raw_sql('SELECT * FROM views.test_inlineddependentview ORDER BY 1;')
+
+        self.assertEqual(result, [('a', 3), ('b', 3)])
+        self.assertEqual(self._execute_view_sql(InlinedDependentView), result)
+
+    def test_views_can_be_inlined_as_subqueries(self):
+        class SubqueryInlinedView(InlinedDependentView, should_register=False):
+            inline_hidden_views = INLINE_AS_SUBQUERY
+
+        self.assertIn('AS NOT MATERIALIZED (', SubqueryInlinedView._compiled_sql.sql)
+        self.assertEqual(self._execute_view_sql(SubqueryInlinedView), [('a', 3), ('b', 3)])
+
+    def test_views_with_their_own_ctes_can_inline_views(self):
+        class ViewWithCTE(PostgresViewFromSQL, should_register=False):
+            inline_hidden_views = INLINE_AS_SUBQUERY
+            sql = """
+                WITH large AS (SELECT * FROM "views"."test_hiddenreadableview" WHERE integer_col > 1)
+                SELECT character_col, count(*) FROM large GROUP BY character_col
+            """
+
+        self.assertEqual(ViewWithCTE.inlined_views, [HiddenPositiveView, HiddenReadableView])
+        self.assertEqual(self._execute_view_sql(ViewWithCTE), [('a', 1), ('b', 2)])
+
+    def test_materialised_views_are_not_inlined(self):
+        class ViewOfMaterialisedView(PostgresViewFromSQL, should_register=False):
+            inline_hidden_views = INLINE_AS_CTE
+            sql = 'SELECT * FROM views.test_simplematerializedview'
+
+        with mock.patch.object(SimpleMaterializedView, 'hidden', True):
+            self.assertEqual(ViewOfMaterialisedView.inlined_views, [])
+
+    def test_inlined_views_are_reported(self):
+        [report] = explain_views([InlinedDependentView])
+
+        self.assertEqual(report.inlined_views, ['test_hiddenpositiveview', 'test_hiddenreadableview'])
+
+
+class TestPartitionedMaterialisedView(TestCase):
+
+    def setUp(self):
+        for day, integer_col in [(datetime.date(2019, 1, 5), 1), (datetime.date(2019, 1, 20), 2),
+                                 (datetime.date(2019, 2, 1), 3)]:
+            self._add_row(day, integer_col)
+        sync_views()
+
+    def _add_row(self, day, integer_col):
+        return TestModel.objects.create(
+            integer_col=integer_col, character_col='a', date_col=day, datetime_col=NOW
+        )
+
+    def _execute_raw_sql(self, sql, params=None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _get_partition_names(self):
+        result = self._execute_raw_sql("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'views.test_dailypartitionedview'::regclass ORDER BY c.relname;
+        """)
+        return [name for name, in result]
+
+    def _get_rows(self):
+        return self._execute_raw_sql('SELECT date_col, total FROM views.test_dailypartitionedview ORDER BY 1;')
+
+    def test_sync_creates_partitions_for_the_periods_of_the_rows(self):
+        self.assertEqual(
+            self._get_partition_names(),
+            [
+                'test_dailypartitionedview_p201901',
+                'test_dailypartitionedview_p201902',
+                'test_dailypartitionedview_pdefault',
+            ],
+        )
+        self.assertEqual(
+            self._get_rows(),
+            [(datetime.date(2019, 1, 5), 1), (datetime.date(2019, 1, 20), 2), (datetime.date(2019, 2, 1), 3)],
+        )
+
+    def test_refresh_only_recomputes_recent_partitions(self):
+        [[today]] = self._execute_raw_sql('SELECT current_date;')
+        self._add_row(datetime.date(2019, 1, 5), 10)
+        self._add_row(today, 4)
+
+        self.assertTrue(refresh_materialized_view(DailyPartitionedView))
+
+        # January 2019 is frozen, so its new row is only picked up by the next sync
+        self.assertEqual(
+            self._get_rows(),
+            [(datetime.date(2019, 1, 5), 1), (datetime.date(2019, 1, 20), 2), (datetime.date(2019, 2, 1), 3),
+             (today, 4)],
+        )
+        self.assertIn(f'test_dailypartitionedview_p{today:%Y%m}', self._get_partition_names())
+        self.assertIsNone(DailyPartitionedView.get_last_refresh().rows)
+
+        sync_views()
+        self.assertIn((datetime.date(2019, 1, 5), 11), self._get_rows())
+
+    def test_unrefreshed_views_are_recomputed_entirely(self):
+        self._execute_raw_sql('DELETE FROM views_catalog.view_refresh RETURNING view_name;')
+        self._add_row(datetime.date(2019, 1, 5), 10)
+
+        refresh_materialized_view(DailyPartitionedView)
+
+        self.assertIn((datetime.date(2019, 1, 5), 11), self._get_rows())
+
+    def test_refresh_start(self):
+        march = datetime.date(2024, 3, 15)
+
+        self.assertIsNone(DailyPartitionedView.get_refresh_start(march, None))
+        self.assertEqual(
+            DailyPartitionedView.get_refresh_start(march, datetime.date(2024, 3, 10)), datetime.date(2024, 2, 1)
+        )
+        # Periods which ended since the last refresh are recomputed
+        self.assertEqual(
+            DailyPartitionedView.get_refresh_start(march, datetime.date(2023, 12, 20)), datetime.date(2023, 12, 1)
+        )
+        with mock.patch.multiple(DailyPartitionedView, partition_interval=PARTITION_BY_DAY, refresh_partitions=3):
+            self.assertEqual(
+                DailyPartitionedView.get_refresh_start(march, datetime.date(2024, 3, 15)), datetime.date(2024, 3, 13)
+            )
+
+    def test_partitions_of_long_view_names_are_shortened(self):
+        class DailyPartitionedViewWithALongNameTruncatingPartitions(DailyPartitionedView, should_register=False):
+            pass
+
+        class DailyPartitionedViewWithALongNameTruncatingItsPartitions(DailyPartitionedView, should_register=False):
+            pass
+
+        view = DailyPartitionedViewWithALongNameTruncatingPartitions
+        # The names only differ past the length they're shortened to
+        self.assertNotEqual(
+            view.get_partition_prefix(), DailyPartitionedViewWithALongNameTruncatingItsPartitions.get_partition_prefix()
+        )
+
+        with mock.patch.object(view, 'partition_interval', PARTITION_BY_DAY):
+            creation_sql = view.get_creation_sql()
+            self._execute_raw_sql(creation_sql.sql + 'SELECT 1;', creation_sql.params)
+
+        result = self._execute_raw_sql(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass;',
+            [view.name_with_schema],
+        )
+        partition_names = [name for name, in result]
+        self.assertEqual(len(partition_names), 4)
+        self.assertTrue(all(len(name) <= 63 for name in partition_names))
+        self.assertIn(f'{view.get_partition_prefix()}_p20190105', partition_names)
+
+    def test_partitions_colliding_with_other_views_are_rejected(self):
+        class CollidingView(PostgresViewFromSQL, should_register=False):
+            name = 'test_dailypartitionedview_p201901'
+            sql = 'SELECT 1'
+
+        with mock.patch.dict(registry, {'default': registry['default'] | {CollidingView}}):
+            with self.assertRaises(ValueError):
+                DailyPartitionedView.get_creation_sql()
+
+    def test_partitioned_views_require_a_partition_field(self):
+        with mock.patch.object(DailyPartitionedView, 'partition_field', None):
+            with self.assertRaises(ValueError):
+                DailyPartitionedView.get_creation_sql()
+
+
+class TestExportView(BaseTestCase):
+
+    def setUp(self):
+        self.rows = [
+            TestModel.objects.create(
+                integer_col=integer_col, character_col=character_col, date_col=NOW.date(), datetime_col=NOW
+            )
+            for integer_col, character_col in [(1, 'a'), (2, 'b,c'), (3, 'd')]
+        ]
+        super().setUp()
+
+    def test_views_are_exported_to_csv(self):
+        output = io.StringIO()
+
+        rows = export_view(ReadableTestViewFromSQL, output)
+
+        self.assertEqual(rows, 3)
+        expected = ''.join(f'{row.id},{row.character_col}\n' for row in self.rows).replace('b,c', '"b,c"')
+        self.assertEqual(output.getvalue(), f'id,character_col\n{expected}')
+
+    def test_columns_and_rows_can_be_selected(self):
+        output = io.BytesIO()
+
+        rows = export_view(
+            'test_simpleviewfromsql',
+            output,
+            columns=['character_col', 'integer_col'],
+            where='integer_col >= %s',
+            params=[2],
+            header=False,
+        )
+
+        self.assertEqual(rows, 2)
+        self.assertEqual(output.getvalue(), b'"b,c",2\nd,3\n')
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_views_are_exported_to_parquet_in_row_groups(self):
+        import pyarrow.parquet
+
+        output = io.BytesIO()
+
+        rows = export_view(SimpleViewFromSQL, output, format=FORMAT_PARQUET, where='integer_col > 0', row_group_size=2)
+
+        self.assertEqual(rows, 3)
+        output.seek(0)
+        parquet_file = pyarrow.parquet.ParquetFile(output)
+        self.assertEqual(parquet_file.num_row_groups, 2)
+        table = parquet_file.read()
+        self.assertEqual(str(table.schema.field('integer_col').type), 'int32')
+        self.assertEqual(str(table.schema.field('date_col').type), 'date32[day]')
+        self.assertEqual(table.column('character_col').to_pylist(), ['a', 'b,c', 'd'])
+
+    def test_command_exports_csv_to_stdout(self):
+        stdout = io.StringIO()
+
+        call_command('export_view', 'readabletestviewfromsql', '--columns', 'character_col', stdout=stdout)
+
+        self.assertEqual(stdout.getvalue(), 'character_col\na\n"b,c"\nd\n')
+
+    def test_command_exports_to_files(self):
+        stdout = io.StringIO()
+        with tempfile.NamedTemporaryFile(suffix='.csv') as output:
+            call_command(
+                'export_view', 'readabletestviewfromsql', '--output', output.name, '--no-header', stdout=stdout
+            )
+
+            self.assertEqual(len(output.read().splitlines()), 3)
+        self.assertIn('Exported 3 rows of readabletestviewfromsql', stdout.getvalue())
+
+    def test_command_requires_an_output_for_parquet(self):
+        with self.assertRaises(CommandError):
+            call_command('export_view', 'readabletestviewfromsql', '--format', 'parquet')